@@ -0,0 +1,359 @@
+"""Local stand-ins for Telegram and video sites, for benchmarks.
+
+- `FakeBotAPI` answers the Bot API methods the bot uses (`getUpdates` with
+  long polling, `sendMessage`, `sendDocument`, `sendMediaGroup`, message
+  edits), with a configurable per-call latency and a share of calls answered
+  with 429 and `retry_after`. Uploads are read to the end and counted, not
+  stored. Every call is reported to an `on_call(chat_id, method, info)`
+  callback so a driver can tell when a chat got its answer.
+- `MediaServer` serves generated video bytes: `/v/<id>.mp4?size=N&rate=R`
+  answers N bytes at R bytes/s (0 = as fast as possible).
+- `FakeYoutubeDL` is a `yt_dlp.YoutubeDL` stand-in that "extracts" those
+  media URLs and downloads them over plain HTTP; `install_fake_extractor()`
+  puts it in place of yt-dlp inside the bot process.
+
+Only the standard library is used, so the fakes cost the measured process
+nothing when they run in the driver.
+"""
+
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+CHUNK = 64 * 1024
+# bitrate used to derive a fake duration from the file size (1 Mbit/s)
+BYTES_PER_SECOND_OF_VIDEO = 125_000
+# Bot API methods that may be answered with 429
+RATE_LIMITED = ("sendMessage", "sendDocument", "sendMediaGroup", "editMessageText", "deleteMessage")
+_CHAT_ID_RE = re.compile(rb'name="chat_id"\r\n(?:[^\r\n]+\r\n)*\r\n(-?\d+)')
+
+
+class _Server:
+    """A `ThreadingHTTPServer` on a free localhost port, served from a daemon thread."""
+
+    handler_class: type = BaseHTTPRequestHandler
+
+    def start(self) -> "_Server":
+        handler = type("Handler", (self.handler_class,), {"owner": self})
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        threading.Thread(target=self._httpd.serve_forever, name=type(self).__name__, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    owner: Any = None
+
+    def log_message(self, fmt, *args) -> None:
+        pass
+
+    def _reply(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self) -> bytes:
+        """The request body, keeping only the first 64 KiB of uploads (the rest is counted)."""
+        kept = bytearray()
+        self.body_size = 0
+
+        def take(data: bytes) -> None:
+            self.body_size += len(data)
+            if len(kept) < CHUNK:
+                kept.extend(data[:CHUNK - len(kept)])
+
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                while size:
+                    data = self.rfile.read(min(size, CHUNK))
+                    take(data)
+                    size -= len(data)
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get("Content-Length") or 0)
+            while remaining:
+                data = self.rfile.read(min(remaining, CHUNK))
+                if not data:
+                    break
+                take(data)
+                remaining -= len(data)
+        return bytes(kept)
+
+
+class _BotAPIHandler(_Handler):
+    def do_GET(self) -> None:
+        self.body_size = 0
+        self._dispatch(b"")
+
+    def do_POST(self) -> None:
+        self._dispatch(self._read_body())
+
+    def _dispatch(self, body: bytes) -> None:
+        parts = urlsplit(self.path)
+        method = parts.path.rsplit("/", 1)[-1]
+        params: Dict[str, Any] = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        content_type = self.headers.get("Content-Type", "")
+        if body and content_type.startswith("application/json"):
+            params.update(json.loads(body))
+        elif body and content_type.startswith("application/x-www-form-urlencoded"):
+            params.update({k: v[-1] for k, v in parse_qs(body.decode()).items()})
+        elif body:
+            match = _CHAT_ID_RE.search(body)
+            if match:
+                params["chat_id"] = match.group(1).decode()
+        status, reply = self.owner.handle(method, params, getattr(self, "body_size", 0))
+        self._reply(status, reply)
+
+
+class FakeBotAPI(_Server):
+    """A local Bot API (`TELEGRAM_API_URL`) for one bot token.
+
+    Usage:
+      api = FakeBotAPI(latency=0.05, rate_limit_ratio=0.02, on_call=record).start()
+      env["TELEGRAM_API_URL"] = api.url
+      api.push_update(update)            # returned by the bot's next getUpdates
+    """
+
+    handler_class = _BotAPIHandler
+
+    def __init__(self, latency: float = 0.0, rate_limit_ratio: float = 0.0, retry_after: int = 1,
+                 on_call: Optional[Callable[[Any, str, Dict[str, Any]], None]] = None,
+                 max_poll: float = 30.0):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.on_call = on_call
+        self.max_poll = max_poll
+        self._cond = threading.Condition()
+        self._updates: List[Dict[str, Any]] = []
+        self._ids = itertools.count(1)
+        self._calls = itertools.count()
+        self.counts: Dict[str, int] = {}
+        self.throttled = 0
+        self.uploaded_bytes = 0
+        self.polled = threading.Event()
+
+    def next_update_id(self) -> int:
+        return next(self._ids)
+
+    def push_update(self, update: Dict[str, Any]) -> None:
+        with self._cond:
+            self._updates.append(update)
+            self._cond.notify_all()
+
+    def reset(self) -> None:
+        """Forget queued updates and counters (between benchmark runs)."""
+        with self._cond:
+            self._updates.clear()
+            self.counts = {}
+            self.throttled = 0
+            self.uploaded_bytes = 0
+            self.polled.clear()
+
+    def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        deadline = time.monotonic() + min(float(params.get("timeout") or 0), self.max_poll)
+        self.polled.set()
+        with self._cond:
+            # confirmed updates are gone for good, like on Telegram
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return list(self._updates[:100])
+
+    def handle(self, method: str, params: Dict[str, Any], body_size: int):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._cond:
+            self.counts[method] = self.counts.get(method, 0) + 1
+            call = next(self._calls)
+            # deterministic spread: every (1/ratio)-th call is throttled
+            throttle = (method in RATE_LIMITED and self.rate_limit_ratio
+                        and int((call + 1) * self.rate_limit_ratio) > int(call * self.rate_limit_ratio))
+            if throttle:
+                self.throttled += 1
+            elif method in ("sendDocument", "sendMediaGroup"):
+                self.uploaded_bytes += body_size
+        if throttle:
+            return 429, {"ok": False, "error_code": 429,
+                         "description": f"Too Many Requests: retry after {self.retry_after}",
+                         "parameters": {"retry_after": self.retry_after}}
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": self._get_updates(params)}
+
+        chat_id = params.get("chat_id")
+        chat_id = int(chat_id) if isinstance(chat_id, str) and chat_id.lstrip("-").isdigit() else chat_id
+        message_id = next(self._ids)
+        result: Any = {"message_id": message_id, "chat": {"id": chat_id}, "date": int(time.time())}
+        info: Dict[str, Any] = {"bytes": body_size}
+        if method == "sendMessage":
+            result["text"] = info["text"] = params.get("text", "")
+        elif method == "sendDocument":
+            document = params.get("document")
+            info["by_id"] = isinstance(document, str) and not document.startswith("file://")
+            result["document"] = {"file_id": document if info["by_id"] else f"BENCH{message_id}",
+                                  "file_size": body_size}
+        elif method == "sendMediaGroup":
+            result = [dict(result, document={"file_id": f"BENCH{message_id}"})]
+        elif method in ("editMessageText", "deleteMessage", "setWebhook"):
+            result = True
+        if self.on_call is not None and chat_id is not None:
+            self.on_call(chat_id, method, info)
+        return 200, {"ok": True, "result": result}
+
+
+class _MediaHandler(_Handler):
+    def do_HEAD(self) -> None:
+        self._serve(head=True)
+
+    def do_GET(self) -> None:
+        self._serve()
+
+    def _serve(self, head: bool = False) -> None:
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if not parts.path.startswith("/v/") or "size" not in query:
+            self.send_error(404)
+            return
+        size = int(query["size"][0])
+        rate = float(query.get("rate", ["0"])[0])
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        if head:
+            return
+        started = time.monotonic()
+        sent = 0
+        block = (parts.path.encode() * (CHUNK // max(1, len(parts.path)) + 1))[:CHUNK]
+        try:
+            while sent < size:
+                n = min(CHUNK, size - sent)
+                self.wfile.write(block[:n])
+                sent += n
+                self.owner.count(n)
+                if rate:
+                    ahead = sent / rate - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class MediaServer(_Server):
+    """Serve generated videos: `video_url("abc", 4_000_000, rate=2e6)`."""
+
+    handler_class = _MediaHandler
+
+    def __init__(self):
+        self.served_bytes = 0
+        self._lock = threading.Lock()
+
+    def count(self, n: int) -> None:
+        with self._lock:
+            self.served_bytes += n
+
+    def video_url(self, video_id: str, size: int, rate: float = 0) -> str:
+        return f"{self.url}/v/{video_id}.mp4?size={size}&rate={int(rate)}"
+
+
+class FakeYoutubeDL:
+    """The part of `yt_dlp.YoutubeDL` that `botlib.downloader` uses, for `MediaServer` URLs."""
+
+    def __init__(self, opts: Optional[Dict[str, Any]] = None):
+        self.opts = opts or {}
+
+    def __enter__(self) -> "FakeYoutubeDL":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def extract_info(self, url: str, download: bool = True) -> Dict[str, Any]:
+        parts = urlsplit(url)
+        if not parts.path.startswith("/v/"):
+            raise ValueError(f"not a benchmark video: {url}")
+        size = int(parse_qs(parts.query)["size"][0])
+        video_id = os.path.splitext(os.path.basename(parts.path))[0]
+        info = {
+            "id": video_id,
+            "title": f"bench-{video_id}",
+            "ext": "mp4",
+            "webpage_url": url,
+            "extractor": "bench",
+            "extractor_key": "Bench",
+            "duration": size / BYTES_PER_SECOND_OF_VIDEO,
+            "formats": [{
+                "format_id": "720p", "url": url, "ext": "mp4", "protocol": "http",
+                "filesize": size, "vcodec": "avc1", "acodec": "mp4a", "width": 1280, "height": 720,
+                "tbr": BYTES_PER_SECOND_OF_VIDEO * 8 / 1000,
+            }],
+        }
+        return self.process_ie_result(info, download=True) if download else info
+
+    def prepare_filename(self, info: Dict[str, Any]) -> str:
+        template = self.opts.get("outtmpl") or "%(title)s.%(ext)s"
+        return template % {"title": info["title"], "ext": info["ext"], "id": info["id"]}
+
+    def process_ie_result(self, info: Dict[str, Any], download: bool = True) -> Dict[str, Any]:
+        if not download:
+            return info
+        fmt = info["formats"][-1]
+        path = self.prepare_filename(info)
+        hooks = self.opts.get("progress_hooks") or []
+        started = time.monotonic()
+        done = 0
+        with urllib.request.urlopen(fmt["url"], timeout=60) as resp, open(path + ".part", "wb") as fh:
+            total = int(resp.headers.get("Content-Length") or fmt["filesize"])
+            while True:
+                chunk = resp.read(CHUNK)
+                if not chunk:
+                    break
+                fh.write(chunk)
+                done += len(chunk)
+                elapsed = max(time.monotonic() - started, 1e-6)
+                for hook in hooks:
+                    hook({"status": "downloading", "downloaded_bytes": done, "total_bytes": total,
+                          "filename": path, "speed": done / elapsed,
+                          "eta": (total - done) / (done / elapsed)})
+        if done != total:
+            raise IOError(f"short read: {done} of {total} bytes")
+        os.replace(path + ".part", path)
+        for hook in hooks:
+            hook({"status": "finished", "downloaded_bytes": done, "total_bytes": total, "filename": path})
+        return dict(info, **fmt, filepath=path)
+
+
+def install_fake_extractor() -> None:
+    """Make `botlib.downloader` use `FakeYoutubeDL` and skip yt-dlp's extractor table."""
+    from botlib import downloader
+
+    downloader.YoutubeDL = FakeYoutubeDL
+    downloader._extractor_classes = lambda: ()
+
+
+__all__ = ["FakeBotAPI", "FakeYoutubeDL", "MediaServer", "install_fake_extractor"]
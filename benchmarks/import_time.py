@@ -0,0 +1,111 @@
+"""Cold-start benchmark: import time and baseline RSS of the bot's entry points.
+
+Every target is imported in a fresh interpreter, `--runs` times; the median
+import time, the whole process's start-to-exit time (the cold start) and
+the resident memory right after the import are reported,
+together with which heavy dependencies the import pulled in. A bare
+interpreter is measured too, as the floor to compare against.
+
+A target is a module name, optionally followed by `:func` to also call a
+function of that module (e.g. `botlib:prewarm` measures a prewarmed worker).
+
+Usage:
+  python benchmarks/import_time.py
+  python benchmarks/import_time.py botlib bot_app --runs 10 --json out.json
+  python benchmarks/import_time.py --max-ms botlib=150 --max-ms bot_app=800   # exit 1 when slower
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+DEFAULT_TARGETS = ["botlib", "botlib.services", "bot_app", "botlib:prewarm"]
+HEAVY = ("yt_dlp", "requests", "httpx", "fastapi")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = r"""
+import importlib, json, sys, time
+target = sys.argv[1]
+module, _, func = target.partition(":")
+started = time.perf_counter()
+if module:
+    mod = importlib.import_module(module)
+    if func:
+        getattr(mod, func)()
+elapsed = time.perf_counter() - started
+rss = 0
+try:
+    with open("/proc/self/status") as fh:
+        for line in fh:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1]) * 1024
+except OSError:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+print(json.dumps({"seconds": elapsed, "rss": rss, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY,)
+
+
+def measure(target: str, runs: int) -> Dict[str, object]:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", _CHILD, target], cwd=ROOT, check=True,
+                             capture_output=True, text=True,
+                             env=dict(os.environ, BOT_PREWARM="0"))
+        sample = json.loads(out.stdout.strip().splitlines()[-1])
+        sample["process"] = time.perf_counter() - started
+        samples.append(sample)
+    return {
+        "target": target or "(interpreter)",
+        "median_ms": statistics.median(s["seconds"] for s in samples) * 1000,
+        "max_ms": max(s["seconds"] for s in samples) * 1000,
+        "process_ms": statistics.median(s["process"] for s in samples) * 1000,
+        "rss_mb": statistics.median(s["rss"] for s in samples) / 2**20,
+        "loaded": samples[-1]["loaded"],
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--max-ms", action="append", default=[], metavar="TARGET=MS",
+                        help="fail when TARGET's median import time exceeds MS")
+    args = parser.parse_args(argv)
+
+    # warm the bytecode cache so the first run is not an outlier
+    measure("", 1)
+    results = [measure("", args.runs)] + [measure(t, args.runs) for t in args.targets]
+
+    print(f"{'target':<22} {'median ms':>10} {'max ms':>8} {'process ms':>11} {'RSS MB':>8}  heavy modules loaded")
+    for r in results:
+        print(f"{r['target']:<22} {r['median_ms']:>10.1f} {r['max_ms']:>8.1f} {r['process_ms']:>11.1f} "
+              f"{r['rss_mb']:>8.1f}  "
+              f"{', '.join(r['loaded']) or '-'}")
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+    failed = False
+    by_target = {r["target"]: r for r in results}
+    for limit in args.max_ms:
+        target, _, ms = limit.partition("=")
+        result = by_target.get(target)
+        if result is None:
+            print(f"--max-ms: {target} was not measured", file=sys.stderr)
+            failed = True
+        elif result["median_ms"] > float(ms):
+            print(f"{target}: {result['median_ms']:.1f} ms exceeds the {ms} ms budget", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
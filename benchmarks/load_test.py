@@ -0,0 +1,405 @@
+"""Load test: simulated users against the real bot, with Telegram and video sites faked.
+
+The driver (this process) runs a `FakeBotAPI` and a `MediaServer` (see
+`fakes.py`), starts the bot as separate processes pointed at them
+(`TELEGRAM_API_URL`) with yt-dlp replaced by `FakeYoutubeDL`, and lets
+`--users` simulated users each send `--messages` video links, one at a time:
+the next link goes out once the previous one was answered (plus `--think`
+seconds). A request is answered when the chat receives a document, or a
+message that is not a progress line (an error, a download link).
+
+For every mode it reports latency percentiles (link sent to answer
+received), throughput, bytes uploaded, Bot API calls and injected 429s, the
+peak RSS summed over the bot's processes and the peak disk usage of its
+workspace. Modes:
+
+  polling    one process, `getUpdates` and the in-process dispatcher
+  webhook    one uvicorn process; updates are POSTed to `/webhook/<token>`
+  pipeline   polling with `BOT_PIPELINE=1` (source piped into the upload)
+  queue      a polling ingress and two `MODE=worker` processes sharing a
+             SQLite work queue
+
+Every mode starts from an empty workspace and `file_id` store; a share of
+links (`--repeat`) asks for a video some user already got, which
+exercises the `file_id` and priority paths. Extra bot settings can be
+passed with `--env KEY=VALUE`. Peak RSS is read from /proc (Linux only).
+
+Usage:
+  python benchmarks/load_test.py
+  python benchmarks/load_test.py --modes polling,queue --users 20 --messages 5 --sizes 1M,8M --speed 4M
+  python benchmarks/load_test.py --api-latency 0.05 --rate-limit 0.05 --json out.json --max-p99 polling=15
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+TOKEN = "123456:bench"
+STATUS_PREFIXES = ("Downloading", "Uploading")
+
+MODES: Dict[str, Dict[str, Any]] = {
+    "polling": {"processes": ["polling"]},
+    "webhook": {"processes": ["webhook"]},
+    "pipeline": {"processes": ["polling"], "env": {"BOT_PIPELINE": "1"}},
+    "queue": {"processes": ["polling", "worker", "worker"],
+              "env": {"BOT_QUEUE": "sqlite:///{root}/queue.sqlite3"}},
+}
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().upper()
+    for suffix, factor in (("K", 2**10), ("M", 2**20), ("G", 2**30)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(float(value))
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _peak_rss(pid: int) -> int:
+    """High-water mark of `pid`'s resident memory in bytes (0 where /proc is missing)."""
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _disk_usage(root: str) -> int:
+    total = 0
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_blocks * 512
+            except OSError:
+                continue
+    return total
+
+
+class DiskSampler(threading.Thread):
+    """Track the peak disk usage under `root` by polling it."""
+
+    def __init__(self, root: str, interval: float = 0.2):
+        super().__init__(name="disk-sampler", daemon=True)
+        self.root = root
+        self.interval = interval
+        self.peak = 0
+        self._halt = threading.Event()
+
+    def run(self) -> None:
+        while not self._halt.wait(self.interval):
+            self.peak = max(self.peak, _disk_usage(self.root))
+
+    def stop(self) -> int:
+        self._halt.set()
+        self.join()
+        return self.peak
+
+
+class Tracker:
+    """Match the bot's Bot API calls to the request each chat is waiting on."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiting: Dict[int, Dict[str, Any]] = {}
+
+    def expect(self, chat_id: int) -> Dict[str, Any]:
+        entry = {"event": threading.Event(), "outcome": None, "at": None}
+        with self._lock:
+            self._waiting[chat_id] = entry
+        return entry
+
+    def on_call(self, chat_id: Any, method: str, info: Dict[str, Any]) -> None:
+        if method in ("sendDocument", "sendMediaGroup"):
+            outcome = "cached" if info.get("by_id") else "sent"
+        elif method == "sendMessage" and not info.get("text", "").startswith(STATUS_PREFIXES):
+            outcome = "reply"
+        else:
+            return
+        with self._lock:
+            entry = self._waiting.pop(chat_id, None)
+        if entry is not None:
+            entry["outcome"] = outcome
+            entry["at"] = time.perf_counter()
+            entry["event"].set()
+
+
+def _post_webhook(url: str, update: Dict[str, Any], deadline: float) -> None:
+    data = json.dumps(update).encode()
+    while True:
+        req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=10):
+                return
+        except (urllib.error.URLError, OSError):
+            # Telegram redelivers on errors and 503 (queue full); so do we
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+
+
+def _user(index: int, args, api, media, tracker: Tracker, shared: List[str], shared_lock: threading.Lock,
+          webhook_url: Optional[str], results: List[Dict[str, Any]]) -> None:
+    rng = random.Random(args.seed * 7919 + index)
+    chat_id = 10_000 + index
+    for number in range(args.messages):
+        with shared_lock:
+            repeat = shared and rng.random() < args.repeat
+            if repeat:
+                url = rng.choice(shared)
+            else:
+                size = args.sizes[rng.randrange(len(args.sizes))]
+                url = media.video_url(f"u{index}m{number}", size, args.speed)
+                shared.append(url)
+        update_id = api.next_update_id()
+        update = {"update_id": update_id, "message": {
+            "message_id": update_id, "date": int(time.time()), "text": url,
+            "chat": {"id": chat_id, "type": "private"}, "from": {"id": chat_id, "is_bot": False}}}
+        entry = tracker.expect(chat_id)
+        started = time.perf_counter()
+        if webhook_url:
+            _post_webhook(webhook_url, update, time.monotonic() + args.timeout)
+        else:
+            api.push_update(update)
+        answered = entry["event"].wait(args.timeout)
+        results.append({
+            "chat_id": chat_id, "repeat": bool(repeat),
+            "outcome": entry["outcome"] if answered else "timeout",
+            "latency": entry["at"] - started if answered else None,
+        })
+        if args.think:
+            time.sleep(args.think)
+
+
+def _wait_ready(mode: str, api, webhook_port: Optional[int], procs, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for proc in procs:
+            if proc.poll() is not None:
+                raise RuntimeError(f"bot process exited early with {proc.returncode}")
+        if webhook_port is not None:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{webhook_port}/health", timeout=2):
+                    return
+            except OSError:
+                pass
+        elif api.polled.is_set():
+            return
+        time.sleep(0.1)
+    raise RuntimeError(f"{mode}: the bot did not come up within {timeout:.0f}s")
+
+
+def run_mode(name: str, args, api, media) -> Dict[str, Any]:
+    spec = MODES[name]
+    root = tempfile.mkdtemp(prefix=f"bot-load-{name}-")
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_TOKEN": TOKEN,
+        "TELEGRAM_API_URL": api.url,
+        "BOT_WORKSPACE_DIR": os.path.join(root, "workspace"),
+        "BOT_FILE_ID_DB": os.path.join(root, "file_ids.sqlite3"),
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, HERE, env.get("PYTHONPATH")])),
+    })
+    env.update({key: value.format(root=root) for key, value in spec.get("env", {}).items()})
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value.format(root=root)
+
+    api.reset()
+    tracker = Tracker()
+    api.on_call = tracker.on_call
+    webhook_port = _free_port() if "webhook" in spec["processes"] else None
+    procs = []
+    for process_mode in spec["processes"]:
+        proc_env = dict(env, MODE=process_mode)
+        if webhook_port is not None:
+            proc_env["BENCH_WEBHOOK_PORT"] = str(webhook_port)
+        procs.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child"], cwd=ROOT,
+                                      env=proc_env, stdout=subprocess.DEVNULL,
+                                      stderr=None if args.verbose else subprocess.DEVNULL))
+    sampler = DiskSampler(root)
+    results: List[Dict[str, Any]] = []
+    try:
+        _wait_ready(name, api, webhook_port, procs)
+        sampler.start()
+        media_before = media.served_bytes
+        webhook_url = f"http://127.0.0.1:{webhook_port}/webhook/{TOKEN}" if webhook_port else None
+        shared: List[str] = []
+        shared_lock = threading.Lock()
+        users = [threading.Thread(target=_user, args=(i, args, api, media, tracker, shared, shared_lock,
+                                                      webhook_url, results), daemon=True)
+                 for i in range(args.users)]
+        started = time.perf_counter()
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        wall = time.perf_counter() - started
+        rss = sum(_peak_rss(proc.pid) for proc in procs)
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+        for proc in procs:
+            try:
+                proc.wait(30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        peak_disk = sampler.stop() if sampler.is_alive() else 0
+        api.on_call = None
+        if args.keep:
+            print(f"{name}: kept {root}", file=sys.stderr)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    latencies = [r["latency"] for r in results if r["latency"] is not None]
+    outcomes: Dict[str, int] = {}
+    for r in results:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+    return {
+        "mode": name,
+        "requests": len(results),
+        "outcomes": outcomes,
+        "p50_s": percentile(latencies, 50),
+        "p99_s": percentile(latencies, 99),
+        "max_s": max(latencies) if latencies else None,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "wall_s": wall,
+        "uploaded_mb": api.uploaded_bytes / 2**20,
+        "source_mb": (media.served_bytes - media_before) / 2**20,
+        "api_calls": sum(api.counts.values()),
+        "throttled": api.throttled,
+        "peak_rss_mb": rss / 2**20,
+        "peak_disk_mb": peak_disk / 2**20,
+    }
+
+
+def child_main() -> None:
+    """Run one bot process (`MODE` env) with yt-dlp replaced by `FakeYoutubeDL`."""
+    from fakes import install_fake_extractor
+
+    install_fake_extractor()
+    import bot_app
+
+    mode = os.environ.get("MODE", "polling")
+    if mode == "webhook":
+        import uvicorn
+
+        uvicorn.run(bot_app.app, host="127.0.0.1", port=int(os.environ["BENCH_WEBHOOK_PORT"]), log_level="warning")
+    elif mode == "worker":
+        bot_app.run_worker()
+    else:
+        bot_app.run_polling()
+
+
+def _fmt(value: Optional[float], spec: str = ".2f") -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated, from {', '.join(MODES)}")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=3, help="links sent by each user")
+    parser.add_argument("--sizes", default="1M,4M,16M", help="video sizes to pick from (K/M/G suffixes)")
+    parser.add_argument("--speed", default="8M", help="source bytes/s per download (0 = unthrottled)")
+    parser.add_argument("--repeat", type=float, default=0.2, help="share of links asking for a known video")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds a user waits between links")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds added to every Bot API call")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of send calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for each answer")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra bot setting for every mode ({root} is the run's temp dir)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--max-p99", action="append", default=[], metavar="MODE=SECONDS",
+                        help="fail when MODE's p99 latency exceeds SECONDS")
+    parser.add_argument("--keep", action="store_true", help="keep each run's temp dir")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's log output")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child_main()
+        return 0
+
+    from fakes import FakeBotAPI, MediaServer
+
+    args.sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    args.speed = parse_size(args.speed)
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(unknown)}")
+
+    api = FakeBotAPI(latency=args.api_latency, rate_limit_ratio=args.rate_limit,
+                     retry_after=args.retry_after, max_poll=1.0).start()
+    media = MediaServer().start()
+    results = []
+    try:
+        for mode in modes:
+            print(f"running {mode}...", file=sys.stderr)
+            results.append(run_mode(mode, args, api, media))
+    finally:
+        api.stop()
+        media.stop()
+
+    print(f"{'mode':<10} {'requests':>8} {'p50 s':>7} {'p99 s':>7} {'max s':>7} {'req/s':>7} "
+          f"{'up MB':>8} {'429s':>5} {'RSS MB':>8} {'disk MB':>8}  outcomes")
+    for r in results:
+        outcomes = ", ".join(f"{k} {v}" for k, v in sorted(r["outcomes"].items()))
+        print(f"{r['mode']:<10} {r['requests']:>8} {_fmt(r['p50_s']):>7} {_fmt(r['p99_s']):>7} "
+              f"{_fmt(r['max_s']):>7} {r['throughput_rps']:>7.2f} {r['uploaded_mb']:>8.1f} "
+              f"{r['throttled']:>5} {r['peak_rss_mb']:>8.1f} {r['peak_disk_mb']:>8.1f}  {outcomes}")
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "child"}, "results": results},
+                      fh, indent=2)
+
+    failed = False
+    by_mode = {r["mode"]: r for r in results}
+    for limit in args.max_p99:
+        mode, _, seconds = limit.partition("=")
+        result = by_mode.get(mode)
+        if result is None:
+            print(f"--max-p99: {mode} was not run", file=sys.stderr)
+            failed = True
+        elif result["p99_s"] is None or result["p99_s"] > float(seconds):
+            print(f"{mode}: p99 {_fmt(result['p99_s'])} s exceeds the {seconds} s budget", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
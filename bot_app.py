@@ -4,27 +4,103 @@ Supports two modes controlled by the `MODE` env var: `polling` (default) and
 `webhook`. For webhook mode you must set `WEBHOOK_URL` to a public HTTPS URL
 where Telegram can POST updates. The FastAPI `app` is exposed so you can run
 it with Uvicorn.
+
+With `BOT_QUEUE` set, polling and webhook only push updates to the shared
+work queue, and `MODE=worker` processes run the downloads (any number of
+them, see `botlib.work_queue`).
 """
 
 import os
 import logging
-from typing import Any, Dict
+import signal
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
 
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import FileResponse, PlainTextResponse
 
+from botlib.dispatcher import Dispatcher, QueueFull
+from botlib import metrics
+from botlib.process_pool import close_default_pool
+from botlib.quotas import flush_default_ledger
+from botlib.rate_limit import get_default_limiter
 from botlib.telegram_adapter import TelegramAdapter
+from botlib.warmup import prewarm_from_env
 from botlib.services import handle_update
+from botlib.storage import LocalBackend, get_default_storage
+from botlib.work_queue import QueueWorker, enqueue_handler, get_default_queue
 from botlib.logger import get_logger
 
 
 logger = get_logger(__name__)
 
-app = FastAPI()
+_dispatcher: Optional[Dispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher(token: str) -> Dispatcher:
+    """Return the process-wide webhook dispatcher, starting it on first use."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher(handle_update, TelegramAdapter(token=token)).start()
+        return _dispatcher
+
+
+def shutdown_dispatcher() -> None:
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.shutdown(wait=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load yt-dlp & co. before the worker takes traffic (BOT_PREWARM)
+    prewarm_from_env()
+    yield
+    # drain accepted updates before the worker process exits
+    shutdown_dispatcher()
+    close_default_pool()
+    flush_default_ledger()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/health")
 def health() -> Dict[str, Any]:
-    return {"status": "ok"}
+    status: Dict[str, Any] = {"status": "ok"}
+    dispatcher = _dispatcher
+    if dispatcher is not None:
+        status.update(dispatcher.stats())
+    else:
+        status.update({"queue_depth": 0, "in_flight": 0})
+    limiter = get_default_limiter()
+    if limiter is not None:
+        status["rate_limit"] = limiter.stats()
+    work_queue = get_default_queue()
+    if work_queue is not None:
+        status["work_queue"] = work_queue.stats()
+    return status
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint() -> PlainTextResponse:
+    """Prometheus scrape endpoint (empty series when `BOT_METRICS=0`)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/files/{token}/{name}")
+def stored_file(token: str, name: str, expires: int = 0, sig: str = "") -> Response:
+    """Serve offloaded files for the `local` storage backend (signed links only)."""
+    storage = get_default_storage()
+    path = storage.resolve(token, name, expires, sig) if isinstance(storage, LocalBackend) else None
+    if path is None:
+        return Response(status_code=404)
+    return FileResponse(path, filename=name)
 
 
 @app.post("/webhook/{token}")
@@ -36,18 +112,34 @@ async def webhook(token: str, request: Request) -> Response:
         logger.warning("Webhook token mismatch or missing")
         return Response(status_code=403)
 
-    # Telegram sends the update as JSON body
+    work_queue = get_default_queue()
+    if work_queue is not None:
+        # distributed mode: a queue worker (MODE=worker) picks it up
+        try:
+            work_queue.push(body)
+        except Exception:
+            logger.exception("Error pushing webhook update to the work queue")
+            return Response(status_code=503)
+        return Response(status_code=200)
+
+    # Telegram sends the update as JSON body. Acknowledge right away and let
+    # the dispatcher workers do the download/upload in the background.
     try:
-        handle_update(body, TelegramAdapter(token=bot_token))
+        get_dispatcher(bot_token).submit(body, block=False)
+    except QueueFull:
+        # a non-2xx answer makes Telegram redeliver the update later
+        logger.warning("Webhook queue full; asking Telegram to retry")
+        return Response(status_code=503)
     except Exception:
-        logger.exception("Error handling webhook update")
+        logger.exception("Error queueing webhook update")
     return Response(status_code=200)
 
 
 def set_webhook(token: str, webhook_url: str) -> bool:
     import requests
 
-    url = f"https://api.telegram.org/bot{token}/setWebhook"
+    api_url = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+    url = f"{api_url}/bot{token}/setWebhook"
     data = {"url": webhook_url}
     try:
         resp = requests.post(url, data=data, timeout=10)
@@ -63,7 +155,37 @@ def run_polling():
     if not token:
         raise RuntimeError("TELEGRAM_TOKEN is required for polling mode")
     adapter = TelegramAdapter(token=token)
-    adapter.run_polling(handle_update)
+    work_queue = get_default_queue()
+    if work_queue is not None:
+        # ingress only: the queue workers do the downloads
+        logger.info("Pushing updates to the shared work queue")
+        adapter.run_polling(enqueue_handler(work_queue), workers=1)
+        return
+    prewarm_from_env()
+    try:
+        adapter.run_polling(handle_update)
+    finally:
+        close_default_pool()
+        flush_default_ledger()
+
+
+def run_worker():
+    """Process jobs from the shared work queue until SIGTERM or Ctrl+C."""
+    token = os.getenv("TELEGRAM_TOKEN")
+    work_queue = get_default_queue()
+    if not token or work_queue is None:
+        raise RuntimeError("TELEGRAM_TOKEN and BOT_QUEUE are required for worker mode")
+    prewarm_from_env()
+    stop = threading.Event()
+    previous = signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        QueueWorker(work_queue, handle_update, TelegramAdapter(token=token)).run(stop)
+    except KeyboardInterrupt:
+        logger.info("Worker interrupted")
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        close_default_pool()
+        flush_default_ledger()
 
 
 def main():
@@ -79,6 +201,9 @@ def main():
             raise RuntimeError("Failed to set webhook")
         # Run Uvicorn externally; this module exposes `app` for ASGI servers.
         logger.info("Webhook configured; start ASGI server to receive updates")
+    elif mode == "worker":
+        logger.info("Starting queue worker")
+        run_worker()
     else:
         logger.info("Starting polling mode")
         run_polling()
@@ -3,13 +3,41 @@
 Expose stable helpers used by the rest of the project. Designed so tests and
 existing imports continue to work while the internal layout follows a
 cleaner package structure.
+
+The helpers are imported on first access (PEP 562 `__getattr__`), so
+`import botlib` does not drag in `requests`, `httpx` or yt-dlp; call
+`botlib.prewarm()` to load them before the first request instead.
 """
 
-from .http_client import get, post
+import importlib
+from typing import Any, List
+
 from .logger import get_logger
 
-# optional components
-from .telegram_adapter import TelegramAdapter  # type: ignore
-from .services import handle_update  # type: ignore
+# public name -> submodule that defines it
+_LAZY = {
+    "get": ".http_client",
+    "post": ".http_client",
+    "TelegramAdapter": ".telegram_adapter",
+    "handle_update": ".services",
+    "handle_update_async": ".services",
+    "AsyncTelegramAdapter": ".async_telegram_adapter",
+    "prewarm": ".warmup",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY))
+
 
-__all__ = ["get", "post", "get_logger", "TelegramAdapter", "handle_update"]
+__all__ = ["get", "post", "get_logger", "TelegramAdapter", "handle_update",
+           "AsyncTelegramAdapter", "handle_update_async", "prewarm"]
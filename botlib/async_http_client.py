@@ -0,0 +1,125 @@
+"""Asyncio HTTP helpers mirroring `botlib.http_client`.
+
+`get`, `post` and `request` are coroutines returning the same normalized
+response dict (`ok`, `status`, `headers`, `body`, optional `error`) and never
+raise. They share one pooled `httpx.AsyncClient` per event loop and retry
+failed responses with the same rules as the sync client (`next_retry_delay`).
+"""
+
+import asyncio
+import os
+import weakref
+from typing import Any, Dict, Optional
+
+try:
+    import httpx
+except Exception:  # pragma: no cover - optional dependency
+    httpx = None  # type: ignore
+
+from .http_client import (
+    DEFAULT_BACKOFF,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_TIMEOUT,
+    next_retry_delay,
+)
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# AsyncClient instances are bound to the loop they were created on
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+
+def _build_client():
+    max_connections = int(os.getenv("HTTP_POOL_MAXSIZE", str(DEFAULT_POOL_MAXSIZE)))
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    return httpx.AsyncClient(limits=limits)
+
+
+def get_client():
+    """Return the pooled client of the running event loop (created on first use)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = _build_client()
+    return client
+
+
+async def close_client() -> None:
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _format_response(response) -> Dict[str, Any]:
+    try:
+        body = response.json()
+    except Exception:
+        body = response.text
+
+    return {
+        "ok": response.is_success,
+        "status": response.status_code,
+        "headers": dict(response.headers),
+        "body": body,
+    }
+
+
+async def request(method: str,
+                  url: str,
+                  timeout: Optional[float] = DEFAULT_TIMEOUT,
+                  retries: Optional[int] = None,
+                  **kwargs: Any) -> Dict[str, Any]:
+    """Send a request on the pooled client and return a normalized dict.
+
+    Extra keyword arguments are passed to `httpx.AsyncClient.request`.
+    """
+    if httpx is None:
+        return {"ok": False, "status": None, "headers": {}, "body": None,
+                "error": "`httpx` library not available"}
+
+    if retries is None:
+        retries = int(os.getenv("HTTP_MAX_RETRIES", str(DEFAULT_MAX_RETRIES)))
+    if not getattr(kwargs.get("content"), "rewindable", True):
+        # a one-shot body (e.g. a piped upload) cannot be sent a second time
+        retries = 0
+    backoff = float(os.getenv("HTTP_BACKOFF", str(DEFAULT_BACKOFF)))
+
+    attempt = 0
+    while True:
+        try:
+            resp = await get_client().request(method, url, timeout=timeout, **kwargs)
+        except httpx.HTTPError as exc:
+            return {"ok": False, "status": None, "headers": {}, "body": None,
+                    "error": str(exc) or type(exc).__name__}
+
+        result = _format_response(resp)
+        if resp.is_success:
+            return result
+        result.setdefault("error", None)
+        delay = next_retry_delay(method, result, attempt, retries, backoff)
+        if delay is None:
+            return result
+
+        logger.info("%s %s returned %s; retrying in %.1fs", method, url.split("/bot")[0], resp.status_code, delay)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def post(url: str,
+               message: Any,
+               headers: Optional[Dict[str, str]] = None,
+               timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+    return await request("POST", url, json=message, headers=headers, timeout=timeout)
+
+
+async def get(url: str,
+              params: Optional[Dict[str, Any]] = None,
+              headers: Optional[Dict[str, str]] = None,
+              timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+    return await request("GET", url, params=params, headers=headers, timeout=timeout)
+
+
+__all__ = ["get", "post", "request", "get_client", "close_client"]
@@ -0,0 +1,207 @@
+"""Asyncio Telegram Bot API adapter.
+
+Mirrors `TelegramAdapter` method for method, but every call is a coroutine
+built on `botlib.async_http_client`, so one event loop can serve many chats
+concurrently. Handlers have the contract `await handler(update, adapter)`;
+`botlib.services.handle_update_async` is the async counterpart of
+`handle_update`.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from .async_http_client import get, post, request
+from .dispatcher import chat_key
+from .http_client import DEFAULT_TIMEOUT
+from .logger import get_logger
+from .metrics import TELEGRAM_UPLOAD_BYTES, observe_telegram
+from .rate_limit import RateLimiter, get_default_limiter
+from .multipart import MultipartEncoder, ProgressCallback, UploadTimeout
+from .telegram_adapter import UPLOAD_DEADLINE, UPLOAD_TIMEOUT, LocalFiles, api_settings
+
+
+logger = get_logger(__name__)
+
+DEFAULT_CONCURRENCY = 100
+
+
+class AsyncTelegramAdapter:
+    """Async polling adapter for Telegram Bot API.
+
+    Usage:
+      adapter = AsyncTelegramAdapter(token)
+      updates = await adapter.get_updates()
+      await adapter.send_message(chat_id, "hi")
+    """
+
+    def __init__(self, token: Optional[str] = None, base_url: Optional[str] = None,
+                 rate_limiter: Optional[RateLimiter] = None, local_mode: Optional[bool] = None,
+                 local_files: Optional[LocalFiles] = None):
+        self.token = token or os.getenv("TELEGRAM_TOKEN")
+        if not self.token:
+            raise ValueError("Telegram token must be provided via constructor or TELEGRAM_TOKEN env")
+        # local Bot API server support, as in `TelegramAdapter`
+        self.base_url, self.local_mode, self.max_upload_bytes, self.local_files = api_settings(
+            self.token, base_url, local_mode, local_files)
+        # outbound calls are smoothed to stay under Telegram's flood limits
+        self.rate_limiter = rate_limiter or get_default_limiter()
+
+    def _url(self, method: str) -> str:
+        return f"{self.base_url}/{method}"
+
+    async def _throttle(self, chat_id: int) -> None:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(chat_id)
+
+    async def get_updates(self, offset: Optional[int] = None, timeout: int = 10) -> List[Dict[str, Any]]:
+        params = {"timeout": timeout}
+        if offset is not None:
+            params["offset"] = offset
+        url = self._url("getUpdates")
+        started = time.perf_counter()
+        result = await get(url, params=params, timeout=timeout + DEFAULT_TIMEOUT)
+        observe_telegram("getUpdates", started, result)
+        if not result.get("ok"):
+            logger.warning("getUpdates failed: %s", result.get("error"))
+            return []
+        return result.get("body", {}).get("result", [])
+
+    async def send_message(self, chat_id: int, text: str) -> Dict[str, Any]:
+        await self._throttle(chat_id)
+        url = self._url("sendMessage")
+        payload = {"chat_id": chat_id, "text": text}
+        started = time.perf_counter()
+        result = await post(url, payload)
+        observe_telegram("sendMessage", started, result)
+        return result
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str) -> Dict[str, Any]:
+        await self._throttle(chat_id)
+        url = self._url("editMessageText")
+        payload = {"chat_id": chat_id, "message_id": message_id, "text": text}
+        started = time.perf_counter()
+        result = await post(url, payload)
+        observe_telegram("editMessageText", started, result)
+        return result
+
+    async def delete_message(self, chat_id: int, message_id: int) -> Dict[str, Any]:
+        await self._throttle(chat_id)
+        url = self._url("deleteMessage")
+        payload = {"chat_id": chat_id, "message_id": message_id}
+        started = time.perf_counter()
+        result = await post(url, payload)
+        observe_telegram("deleteMessage", started, result)
+        return result
+
+    async def send_document_by_id(self, chat_id: int, file_id: str) -> Dict[str, Any]:
+        await self._throttle(chat_id)
+        url = self._url("sendDocument")
+        payload = {"chat_id": chat_id, "document": file_id}
+        started = time.perf_counter()
+        result = await post(url, payload)
+        observe_telegram("sendDocumentById", started, result)
+        return result
+
+    async def send_document(self, chat_id: int, file_path: str, filename: Optional[str] = None,
+                            progress: Optional[ProgressCallback] = None,
+                            timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Send a file to the given chat using sendDocument (streamed multipart upload)."""
+        uri = self.local_files.uri(file_path) if self.local_files else None
+        if uri is not None:
+            await self._throttle(chat_id)
+            started = time.perf_counter()
+            result = await post(self._url("sendDocument"), {"chat_id": chat_id, "document": uri},
+                                timeout=timeout or UPLOAD_DEADLINE)
+            observe_telegram("sendDocument", started, result)
+            if result.get("ok") and progress is not None:
+                size = os.path.getsize(file_path)
+                progress(size, size)
+            return result
+        encoder = MultipartEncoder(
+            {"chat_id": str(chat_id)}, "document", filename or os.path.basename(file_path), file_path,
+            progress=progress, timeout=timeout or UPLOAD_DEADLINE,
+        )
+        await self._throttle(chat_id)
+        return await self._upload_document(encoder)
+
+    async def send_document_stream(self, chat_id: int, source: Iterable[bytes], size: Optional[int],
+                                   filename: str, progress: Optional[ProgressCallback] = None,
+                                   timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Send a document whose bytes come from a (blocking) iterable of chunks."""
+        encoder = MultipartEncoder(
+            {"chat_id": str(chat_id)}, "document", filename, source, size=size,
+            progress=progress, timeout=timeout or UPLOAD_DEADLINE,
+        )
+        await self._throttle(chat_id)
+        return await self._upload_document(encoder)
+
+    async def _upload_document(self, encoder: MultipartEncoder) -> Dict[str, Any]:
+        url = self._url("sendDocument")
+        started = time.perf_counter()
+        try:
+            result = await request("POST", url, content=encoder.async_body(), headers=encoder.headers(),
+                                   timeout=UPLOAD_TIMEOUT)
+        except UploadTimeout as exc:
+            result = {"ok": False, "status": None, "headers": {}, "body": None, "error": str(exc)}
+        observe_telegram("sendDocument", started, result)
+        if not result.get("ok"):
+            logger.warning("Failed to upload document: %s", result.get("error") or result.get("status"))
+        else:
+            TELEGRAM_UPLOAD_BYTES.inc(encoder.bytes_sent)
+        return result
+
+    async def run_polling(self, handler, poll_interval: float = 1.0, concurrency: Optional[int] = None):
+        """Poll for updates and run `await handler(update, self)` as tasks.
+
+        At most `concurrency` updates (default `BOT_ASYNC_CONCURRENCY`) are in
+        flight at once; when all slots are taken, polling waits for one to
+        free up instead of piling up tasks. Updates of the same chat are
+        handled in arrival order. Cancelling the task stops polling and waits
+        for running handlers.
+        """
+        limit = asyncio.Semaphore(concurrency or int(os.getenv("BOT_ASYNC_CONCURRENCY", str(DEFAULT_CONCURRENCY))))
+        chat_locks: Dict[Any, asyncio.Lock] = {}
+        chat_pending: Dict[Any, int] = {}
+        tasks = set()
+
+        async def _run(upd: Dict[str, Any], key: Any) -> None:
+            # asyncio.Lock wakes waiters FIFO, which keeps per-chat ordering
+            try:
+                async with chat_locks[key]:
+                    try:
+                        await handler(upd, self)
+                    except Exception:
+                        logger.exception("Error in update handler")
+            finally:
+                limit.release()
+                chat_pending[key] -= 1
+                if not chat_pending[key]:
+                    del chat_pending[key]
+                    del chat_locks[key]
+
+        offset = None
+        try:
+            while True:
+                updates = await self.get_updates(offset=offset)
+                for upd in updates:
+                    # backpressure: no new task (nor getUpdates call) until a slot is free
+                    await limit.acquire()
+                    offset = max(offset or 0, upd.get("update_id", 0) + 1)
+                    key = chat_key(upd)
+                    chat_locks.setdefault(key, asyncio.Lock())
+                    chat_pending[key] = chat_pending.get(key, 0) + 1
+                    task = asyncio.ensure_future(_run(upd, key))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                await asyncio.sleep(poll_interval)
+        except asyncio.CancelledError:
+            logger.info("Async polling cancelled")
+            raise
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+
+__all__ = ["AsyncTelegramAdapter"]
@@ -0,0 +1,244 @@
+"""Persistent, content-addressed cache of downloaded videos.
+
+Entries are keyed by a stable video key (yt-dlp's `extractor:id` when known,
+otherwise a normalized URL) and live on disk so every worker process on the
+host can share them. Writes are atomic (build in a temp dir, then rename),
+entries expire after a TTL and the least recently used ones are evicted once
+the cache grows past its size budget.
+
+Layout under `root`:
+  objects/<sha256(key)>/entry.json   metadata (key, filename, size, created)
+  objects/<sha256(key)>/<filename>   the cached file
+  aliases/<sha256(alias)>            name of the object dir an alias points to
+  tmp/                               scratch space for atomic writes
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024 * 1024
+DEFAULT_TTL = 7 * 24 * 3600
+
+# query parameters that never change which video a URL points to
+_TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "si", "feature", "ref_src"}
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Return a canonical form of `url` suitable as a cache key.
+
+    Lowercases scheme and host, drops default ports, fragments, trailing
+    slashes and tracking parameters, and sorts the remaining query string.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k not in _TRACKING_PARAMS and not k.startswith("utm_"))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def _digest(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class DownloadCache:
+    """On-disk LRU cache mapping video keys to downloaded files.
+
+    Usage:
+      cache = DownloadCache("/var/cache/bot", max_bytes=10 * 2**30)
+      path = cache.get("Youtube:dQw4w9WgXcQ")
+      if path is None:
+          path = cache.put("Youtube:dQw4w9WgXcQ", downloaded_file)
+    """
+
+    def __init__(self, root: str, max_bytes: int = DEFAULT_MAX_BYTES, ttl: Optional[float] = DEFAULT_TTL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._objects = os.path.join(root, "objects")
+        self._aliases = os.path.join(root, "aliases")
+        self._tmp = os.path.join(root, "tmp")
+        for d in (self._objects, self._aliases, self._tmp):
+            os.makedirs(d, exist_ok=True)
+        self._evict_lock = threading.Lock()
+
+    def _resolve(self, key: str) -> str:
+        digest = _digest(key)
+        try:
+            with open(os.path.join(self._aliases, digest), "r", encoding="utf-8") as fh:
+                digest = fh.read().strip() or digest
+        except OSError:
+            pass
+        return os.path.join(self._objects, digest)
+
+    def _read_entry(self, entry_dir: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(entry_dir, "entry.json"), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return bool(self.ttl) and time.time() - entry.get("created", 0) > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached file path for `key`, or None on a miss."""
+        entry_dir = self._resolve(key)
+        entry = self._read_entry(entry_dir)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self._remove(entry_dir)
+            return None
+        path = os.path.join(entry_dir, entry["filename"])
+        if not os.path.isfile(path):
+            return None
+        try:
+            # the entry.json mtime doubles as the LRU timestamp
+            os.utime(os.path.join(entry_dir, "entry.json"))
+        except OSError:
+            pass
+        return path
+
+    def put(self, key: str, path: str, aliases: Tuple[str, ...] = ()) -> Optional[str]:
+        """Atomically store a copy of `path` under `key` and return the cached path.
+
+        `aliases` are extra keys (e.g. the normalized URL) that resolve to the
+        same entry. If another worker stored the key first, its entry wins.
+        """
+        digest = _digest(key)
+        final_dir = os.path.join(self._objects, digest)
+        filename = os.path.basename(path)
+        if self._read_entry(final_dir) is None:
+            staging = tempfile.mkdtemp(prefix="put_", dir=self._tmp)
+            try:
+                target = os.path.join(staging, filename)
+                try:
+                    os.link(path, target)
+                except OSError:
+                    shutil.copyfile(path, target)
+                entry = {"key": key, "filename": filename, "size": os.path.getsize(target),
+                         "created": time.time()}
+                with open(os.path.join(staging, "entry.json"), "w", encoding="utf-8") as fh:
+                    json.dump(entry, fh)
+                if os.path.isdir(final_dir):
+                    # stale or half-removed entry: replace it
+                    self._remove(final_dir)
+                os.rename(staging, final_dir)
+            except OSError:
+                if not os.path.isdir(final_dir):
+                    logger.exception("Failed to store %s in download cache", key)
+                    shutil.rmtree(staging, ignore_errors=True)
+                    return None
+                shutil.rmtree(staging, ignore_errors=True)
+        for alias in aliases:
+            if alias != key:
+                self._write_alias(alias, digest)
+        self.evict()
+        return self.get(key)
+
+    def _write_alias(self, alias: str, digest: str) -> None:
+        fd, tmp = tempfile.mkstemp(prefix="alias_", dir=self._tmp)
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(digest)
+        os.replace(tmp, os.path.join(self._aliases, _digest(alias)))
+
+    def _remove(self, entry_dir: str) -> None:
+        # rename first so readers never observe a half-deleted entry
+        trash = os.path.join(self._tmp, f"del_{os.path.basename(entry_dir)}_{os.getpid()}_{threading.get_ident()}")
+        try:
+            os.rename(entry_dir, trash)
+        except OSError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def _entries(self) -> List[Tuple[float, int, str, Dict[str, Any]]]:
+        entries = []
+        for name in os.listdir(self._objects):
+            entry_dir = os.path.join(self._objects, name)
+            entry = self._read_entry(entry_dir)
+            if entry is None:
+                continue
+            try:
+                last_access = os.path.getmtime(os.path.join(entry_dir, "entry.json"))
+            except OSError:
+                continue
+            entries.append((last_access, entry.get("size", 0), entry_dir, entry))
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, size, _, _ in self._entries())
+
+    def evict(self) -> int:
+        """Drop expired entries, then LRU entries until under `max_bytes`.
+
+        Returns the number of entries removed.
+        """
+        if not self._evict_lock.acquire(blocking=False):
+            return 0
+        try:
+            removed = 0
+            entries = []
+            for item in self._entries():
+                if self._expired(item[3]):
+                    self._remove(item[2])
+                    removed += 1
+                else:
+                    entries.append(item)
+            total = sum(size for _, size, _, _ in entries)
+            for _, size, entry_dir, _ in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(entry_dir)
+                total -= size
+                removed += 1
+            if removed:
+                logger.info("Evicted %d entries from download cache", removed)
+            return removed
+        finally:
+            self._evict_lock.release()
+
+
+_default_cache: Optional[DownloadCache] = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[DownloadCache]:
+    """Return the cache configured via `BOT_CACHE_DIR`, or None when disabled.
+
+    `BOT_CACHE_MAX_BYTES` and `BOT_CACHE_TTL` (seconds, 0 = never expire)
+    tune the size budget and the expiry.
+    """
+    global _default_cache
+    root = os.getenv("BOT_CACHE_DIR")
+    if not root:
+        return None
+    with _default_lock:
+        if _default_cache is None or _default_cache.root != root:
+            _default_cache = DownloadCache(
+                root,
+                max_bytes=int(os.getenv("BOT_CACHE_MAX_BYTES", str(DEFAULT_MAX_BYTES))),
+                ttl=float(os.getenv("BOT_CACHE_TTL", str(DEFAULT_TTL))),
+            )
+        return _default_cache
+
+
+__all__ = ["DownloadCache", "get_default_cache", "normalize_url"]
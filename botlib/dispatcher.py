@@ -0,0 +1,172 @@
+"""Bounded worker pool that dispatches updates to a handler concurrently.
+
+Updates are grouped by chat: different chats are processed in parallel while
+updates of the same chat run strictly in arrival order (with the default
+`BOT_CHAT_CONCURRENCY=1`). Which chat goes next is decided by a
+`FairScheduler` (weighted fair queuing between chats, plus a priority lane
+that lets cheap updates overtake other chats' downloads; see
+`botlib.scheduler`). The number
+of updates waiting in the pool is bounded so a fast producer (the polling
+loop) is slowed down instead of buffering an unbounded backlog in memory.
+
+The handler contract is unchanged: `handler(update, adapter)`.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .logger import get_logger
+from .scheduler import FairScheduler
+
+
+logger = get_logger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PENDING = 100
+
+
+class QueueFull(Exception):
+    """Raised by `Dispatcher.submit` when the pool cannot accept more work."""
+
+
+def chat_key(update: Dict[str, Any]) -> Hashable:
+    """Return the key used to serialize updates of the same chat.
+
+    Updates without a chat (e.g. callback queries we ignore) fall back to the
+    update id so they never block each other.
+    """
+    msg = update.get("message") or update.get("edited_message") or {}
+    chat_id = (msg.get("chat") or {}).get("id")
+    if chat_id is not None:
+        return chat_id
+    return ("update", update.get("update_id"))
+
+
+class Dispatcher:
+    """Run `handler(update, adapter)` on a pool of worker threads.
+
+    Usage:
+      dispatcher = Dispatcher(handle_update, adapter, workers=8)
+      dispatcher.start()
+      dispatcher.submit(update)
+      dispatcher.shutdown()
+    """
+
+    def __init__(self,
+                 handler: Callable[[Dict[str, Any], Any], None],
+                 adapter: Any,
+                 workers: Optional[int] = None,
+                 max_pending: Optional[int] = None,
+                 scheduler: Optional[FairScheduler] = None):
+        self.handler = handler
+        self.adapter = adapter
+        self.workers = workers or int(os.getenv("BOT_WORKERS", str(DEFAULT_WORKERS)))
+        self.max_pending = max_pending or int(os.getenv("BOT_MAX_PENDING", str(DEFAULT_MAX_PENDING)))
+        self.scheduler = scheduler or FairScheduler.from_env(chat_key, self.workers)
+
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._in_flight = 0
+        self._closed = False
+        self._threads = []
+
+    def start(self) -> "Dispatcher":
+        with self._cond:
+            if self._threads:
+                return self
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"bot-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        logger.info("Dispatcher started with %d workers", self.workers)
+        return self
+
+    def submit(self, update: Dict[str, Any], block: bool = True, timeout: Optional[float] = None) -> None:
+        """Queue `update` for processing.
+
+        Blocks while `max_pending` updates are waiting (backpressure). With
+        `block=False` or when `timeout` expires, raises `QueueFull` instead.
+        """
+        lane = self.scheduler.lane_of(update)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Dispatcher is shut down")
+            if self._pending >= self.max_pending:
+                if not block:
+                    raise QueueFull()
+                if not self._cond.wait_for(lambda: self._closed or self._pending < self.max_pending, timeout):
+                    raise QueueFull()
+                if self._closed:
+                    raise RuntimeError("Dispatcher is shut down")
+
+            self.scheduler.push(update, lane)
+            self._pending += 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "queue_depth": self._pending,
+                "in_flight": self._in_flight,
+                "max_pending": self.max_pending,
+                "scheduler": self.scheduler.stats(),
+            }
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted update has been handled."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0 and self._in_flight == 0, timeout)
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None) -> None:
+        """Stop accepting updates; with `wait` drain the queue before returning."""
+        with self._cond:
+            self._closed = True
+            if not wait:
+                dropped = self.scheduler.clear()
+                self._pending = 0
+                if dropped:
+                    logger.warning("Dispatcher dropped %d queued updates", dropped)
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join(timeout)
+        logger.info("Dispatcher stopped")
+
+    def _next(self):
+        with self._cond:
+            while True:
+                picked = self.scheduler.pop()
+                if picked is not None:
+                    self._pending -= 1
+                    self._in_flight += 1
+                    self._cond.notify_all()
+                    return picked
+                if self._closed and self._pending == 0:
+                    return None, None
+                # queued updates may all be blocked on their chat or lane; wait for a `_done`
+                self._cond.wait()
+
+    def _done(self, run, elapsed: float) -> None:
+        with self._cond:
+            self.scheduler.done(run, elapsed)
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _worker(self) -> None:
+        while True:
+            run, update = self._next()
+            if update is None:
+                return
+            started = time.monotonic()
+            try:
+                self.handler(update, self.adapter)
+            except Exception:
+                logger.exception("Error in update handler")
+            finally:
+                self._done(run, time.monotonic() - started)
+
+
+__all__ = ["Dispatcher", "QueueFull", "chat_key"]
@@ -1,49 +1,287 @@
 """Download videos from many sites using yt-dlp.
 
 This module provides a small wrapper around `yt_dlp` to download a single
-video into `out_dir` and return the downloaded filepath.
+video into `out_dir` and return the downloaded filepath. When a download
+cache is configured (see `botlib.cache`), repeated links are served from
+disk without touching yt-dlp or the network.
+
+Downloads run in two stages: `probe` extracts metadata only (and caches it,
+see `botlib.probe_cache`), then `fetch` downloads a format chosen from that
+metadata. Given a byte budget, the format is planned before anything is
+fetched (see `botlib.formats`).
+
+yt-dlp is imported on first use, not when this module is imported, so the
+echo path, `/health` and process start-up do not pay for it; call
+`botlib.prewarm` to load it ahead of the first download.
 """
 
 import os
-from typing import Optional
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from .cache import get_default_cache, normalize_url
+from .formats import DEFAULT_FORMAT, plan_format
+from .logger import get_logger
+from .metrics import CACHE_REQUESTS, DOWNLOAD_BYTES, DOWNLOAD_SECONDS
+from .probe_cache import get_default_probe_cache
+from .workspace import is_partial, ytdl_resume_options
+
+logger = get_logger(__name__)
+
+_NOT_LOADED: Any = object()
+# the `yt_dlp.YoutubeDL` class once loaded, None when yt-dlp is not installed
+YoutubeDL: Any = _NOT_LOADED
+
+
+def _youtube_dl() -> Optional[Type[Any]]:
+    """Return `yt_dlp.YoutubeDL`, importing yt-dlp on the first call."""
+    global YoutubeDL
+    if YoutubeDL is _NOT_LOADED:
+        try:
+            from yt_dlp import YoutubeDL as loaded
+        except Exception:  # pragma: no cover - runtime dependency
+            loaded = None
+        YoutubeDL = loaded
+    return YoutubeDL
+
+
+VIDEO_KEY_CACHE_SIZE = 4096
+# normalized URL -> video key, least recently used first
+_video_keys: "OrderedDict[str, str]" = OrderedDict()
+_video_keys_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _extractor_classes():
+    try:
+        from yt_dlp.extractor import gen_extractor_classes
+    except Exception:  # pragma: no cover - runtime dependency
+        return ()
+    return tuple(ie for ie in gen_extractor_classes() if ie.ie_key() != "Generic")
+
+
+def video_key(url: str) -> str:
+    """Return a stable key for the video behind `url` without network access.
+
+    Uses yt-dlp's URL patterns to derive `extractor:id` (so `youtu.be/x` and
+    `youtube.com/watch?v=x` share a key); falls back to `url:<normalized url>`.
+    Keys are memoized per normalized URL: matching against every extractor
+    pattern costs tens of milliseconds and one update asks several times.
+    """
+    normalized = normalize_url(url)
+    with _video_keys_lock:
+        key = _video_keys.get(normalized)
+        if key is not None:
+            _video_keys.move_to_end(normalized)
+            return key
+    key = _match_extractor(normalized)
+    with _video_keys_lock:
+        _video_keys[normalized] = key
+        if len(_video_keys) > VIDEO_KEY_CACHE_SIZE:
+            _video_keys.popitem(last=False)
+    return key
+
+
+def known_video_key(url: str) -> str:
+    """The key `video_key` returned for `url` before, else `url:<normalized url>`.
+
+    Never loads yt-dlp, so it is cheap enough for the ingress path; a URL
+    no worker has seen yet simply gets its generic key.
+    """
+    normalized = normalize_url(url)
+    with _video_keys_lock:
+        return _video_keys.get(normalized) or f"url:{normalized}"
+
+
+def _match_extractor(url: str) -> str:
+    for ie in _extractor_classes():
+        try:
+            if ie.suitable(url):
+                video_id = ie.get_temp_id(url)
+                if video_id:
+                    return f"{ie.ie_key()}:{video_id}"
+                break
+        except Exception:
+            continue
+    return f"url:{url}"
+
+
+def _info_key(info: Dict[str, Any]) -> Optional[str]:
+    extractor = info.get("extractor_key") or info.get("extractor")
+    video_id = info.get("id")
+    if extractor and video_id:
+        return f"{extractor}:{video_id}"
+    return None
+
+
+def _link_into(path: str, out_dir: str) -> str:
+    """Expose a cached file inside `out_dir` without copying when possible."""
+    target = os.path.join(out_dir, os.path.basename(path))
+    try:
+        os.link(path, target)
+    except OSError:
+        shutil.copyfile(path, target)
+    return target
+
 
-try:
-    from yt_dlp import YoutubeDL
-except Exception:  # pragma: no cover - runtime dependency
-    YoutubeDL = None  # type: ignore
+ProgressHook = Callable[[Dict[str, Any]], None]
 
 
-def download_video(url: str, out_dir: str) -> Optional[str]:
+def download_video(url: str, out_dir: str, max_bytes: Optional[int] = None,
+                   progress_hooks: Optional[List[ProgressHook]] = None) -> Optional[str]:
     """Download `url` into `out_dir` and return the path of the downloaded file.
 
+    With `max_bytes`, the best format expected to fit that many bytes is
+    chosen before downloading (the result can still be larger when no format
+    fits or the estimates are off). `progress_hooks` are passed to yt-dlp.
+
     Returns None on error (caller should handle and report back to user).
     """
-    if YoutubeDL is None:
-        return None
+    started = time.perf_counter()
+    cache = get_default_cache()
+    key = None
+    if cache is not None:
+        key = video_key(url)
+        cached = cache.get(key)
+        CACHE_REQUESTS.inc(result="hit" if cached else "miss")
+        if cached:
+            os.makedirs(out_dir, exist_ok=True)
+            logger.info("Download cache hit for %s", key)
+            path = _link_into(cached, out_dir)
+            DOWNLOAD_SECONDS.observe(time.perf_counter() - started, result="cache_hit")
+            DOWNLOAD_BYTES.inc(os.path.getsize(path), source="cache")
+            return path
 
-    os.makedirs(out_dir, exist_ok=True)
+    downloaded = _download(url, out_dir, cache, key, max_bytes, progress_hooks)
+    DOWNLOAD_SECONDS.observe(time.perf_counter() - started, result="ok" if downloaded else "error")
+    if downloaded:
+        DOWNLOAD_BYTES.inc(os.path.getsize(downloaded), source="network")
+    return downloaded
+
+
+def _ydl_opts(out_dir: str, fmt: str = DEFAULT_FORMAT) -> Dict[str, Any]:
     # output template: choose title.ext
-    outtmpl = os.path.join(out_dir, "%(title)s.%(ext)s")
-    ydl_opts = {
-        "outtmpl": outtmpl,
-        "format": "bestvideo+bestaudio/best",
+    opts = {
+        "outtmpl": os.path.join(out_dir, "%(title)s.%(ext)s"),
+        "format": fmt,
         "noplaylist": True,
         # quiet=False so that callers can enable logging; keep default verbosity low
     }
+    # resume partials left in out_dir and fetch fragments in parallel
+    opts.update(ytdl_resume_options())
+    return opts
+
+
+def _probe(url: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """Return `(info, from_cache)` for `url`; info is None when extraction fails."""
+    probes = get_default_probe_cache()
+    key = video_key(url) if probes is not None else None
+    if probes is not None:
+        info = probes.get(key)
+        if info is not None:
+            logger.debug("Probe cache hit for %s", key)
+            return info, True
+    ydl_class = _youtube_dl()
+    if ydl_class is None:
+        return None, False
+    try:
+        with ydl_class(_ydl_opts(tempfile.gettempdir())) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception:
+        logger.info("Could not extract %s", url, exc_info=True)
+        return None, False
+    if probes is not None and info:
+        probes.put(key, info)
+    return info, False
+
+
+def probe(url: str) -> Optional[Dict[str, Any]]:
+    """Extract metadata for `url` without downloading (cached for `BOT_PROBE_TTL`).
+
+    Returns None when yt-dlp cannot handle the URL, which makes this a cheap
+    "is this even a video?" check on repeat requests.
+    """
+    return _probe(url)[0]
+
 
+def invalidate_probe(url: str) -> None:
+    """Drop the cached metadata for `url` so the next probe extracts again."""
+    probes = get_default_probe_cache()
+    if probes is not None:
+        probes.invalidate(video_key(url))
+
+
+def _finished_files(out_dir: str) -> Dict[str, Tuple[int, int]]:
+    """`name -> (mtime_ns, size)` of the complete files in `out_dir`."""
+    found = {}
+    for name in os.listdir(out_dir):
+        try:
+            st = os.stat(os.path.join(out_dir, name))
+        except OSError:
+            continue
+        if not is_partial(name) and os.path.isfile(os.path.join(out_dir, name)):
+            found[name] = (st.st_mtime_ns, st.st_size)
+    return found
+
+
+def fetch(info: Dict[str, Any], out_dir: str, max_bytes: Optional[int] = None,
+          progress_hooks: Optional[List[ProgressHook]] = None) -> Optional[str]:
+    """Download the video described by a probed `info` dict into `out_dir`.
+
+    The format is planned against `max_bytes` when given. Returns the file
+    path, or None on error.
+    """
+    ydl_class = _youtube_dl()
+    if ydl_class is None:
+        return None
+    os.makedirs(out_dir, exist_ok=True)
+    # a reused workspace directory may hold leftovers (e.g. an old video.zip)
+    before = _finished_files(out_dir)
+    planned = plan_format(info, max_bytes) if max_bytes else None
+    opts = _ydl_opts(out_dir, planned or DEFAULT_FORMAT)
+    if progress_hooks:
+        opts["progress_hooks"] = list(progress_hooks)
     try:
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
+        with ydl_class(opts) as ydl:
+            info = ydl.process_ie_result(info, download=True)
             # info may be a dict for single video; determine filename
             filename = ydl.prepare_filename(info)
             if os.path.exists(filename):
                 return filename
-            # sometimes prepare_filename uses ext not matching; try to find a file in out_dir
-            for f in os.listdir(out_dir):
-                path = os.path.join(out_dir, f)
-                if os.path.isfile(path):
-                    return path
+            # sometimes prepare_filename uses ext not matching; take a file this download wrote
+            for name, stamp in sorted(_finished_files(out_dir).items()):
+                if before.get(name) != stamp:
+                    return os.path.join(out_dir, name)
     except Exception:
+        logger.info("Fetching %s failed", info.get("webpage_url") or info.get("id"), exc_info=True)
+    return None
+
+
+def _download(url: str, out_dir: str, cache, key: Optional[str],
+              max_bytes: Optional[int] = None,
+              progress_hooks: Optional[List[ProgressHook]] = None) -> Optional[str]:
+    """Probe and fetch `url` for a cache miss and store the result in `cache` (if any)."""
+    info, from_cache = _probe(url)
+    if info is None:
         return None
+    downloaded = fetch(info, out_dir, max_bytes, progress_hooks)
+    if downloaded is None and from_cache:
+        # cached format URLs may have expired; retry once with fresh metadata
+        invalidate_probe(url)
+        info, _ = _probe(url)
+        if info is None:
+            return None
+        downloaded = fetch(info, out_dir, max_bytes, progress_hooks)
 
-    return None
+    if downloaded and cache is not None:
+        info_key = _info_key(info) or key
+        cache.put(info_key, downloaded, aliases=(key,))
+    return downloaded
+
+
+__all__ = ["download_video", "fetch", "invalidate_probe", "probe", "video_key"]
@@ -0,0 +1,90 @@
+"""Persistent mapping from source video keys to Telegram `file_id`s.
+
+Once a file has been uploaded, Telegram lets the bot send it again by its
+`file_id` without transferring the bytes. This store remembers those ids in a
+small SQLite database so repeat requests become a single API call.
+
+What was uploaded depends on the packaging mode (a zip or the raw video),
+so entries are keyed by `package_key(video_key, mode)`: changing
+`BOT_PACKAGING` uploads each video once more in the new form.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def package_key(video_key: str, mode: str) -> str:
+    """The store key for the video `video_key` sent as a `mode` package."""
+    return f"{mode}:{video_key}"
+
+
+class FileIdStore:
+    """Thread-safe SQLite-backed `key -> file_id` store.
+
+    Usage:
+      store = FileIdStore("/var/lib/bot/file_ids.sqlite3")
+      store.put(package_key("Youtube:dQw4w9WgXcQ", "raw"), "BQACAgQAAx...")
+      store.get(package_key("Youtube:dQw4w9WgXcQ", "raw"))
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids ("
+            " key TEXT PRIMARY KEY,"
+            " file_id TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT file_id FROM file_ids WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, file_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO file_ids (key, file_id, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET file_id = excluded.file_id, updated_at = excluded.updated_at",
+                (key, file_id, time.time()),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_store: Optional[FileIdStore] = None
+_default_lock = threading.Lock()
+
+
+def get_default_store() -> Optional[FileIdStore]:
+    """Return the store configured via `BOT_FILE_ID_DB`, or None when disabled."""
+    global _default_store
+    path = os.getenv("BOT_FILE_ID_DB")
+    if not path:
+        return None
+    with _default_lock:
+        if _default_store is None or _default_store.path != path:
+            _default_store = FileIdStore(path)
+        return _default_store
+
+
+__all__ = ["FileIdStore", "get_default_store", "package_key"]
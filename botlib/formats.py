@@ -0,0 +1,125 @@
+"""Pick a yt-dlp format that fits an upload budget before downloading.
+
+yt-dlp's default `bestvideo+bestaudio/best` happily fetches gigabytes that
+Telegram will then refuse. `plan_format` looks at the format list returned by
+`extract_info(download=False)` and estimates each candidate's size from
+`filesize`, then `filesize_approx`, then `tbr` x `duration`. It chooses, in
+this order:
+
+1. the best-quality option that fits the budget, where options are single
+   files with both video and audio plus video-only + audio-only pairs
+   (when ffmpeg can merge them); a single file wins quality ties because it
+   needs no merge step;
+2. the smallest option with a size estimate (it will not fit, but it is the
+   least wasteful thing to download for the fallback upload);
+3. None, meaning "no usable metadata; let yt-dlp use `DEFAULT_FORMAT`".
+"""
+
+import shutil
+from typing import Any, Dict, List, Optional, Tuple
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+DEFAULT_FORMAT = "bestvideo+bestaudio/best"
+# bitrate-based estimates are rough (VBR, container overhead); pad them
+TBR_MARGIN = 1.1
+
+
+def estimate_size(fmt: Dict[str, Any], duration: Optional[float]) -> Optional[int]:
+    """Best guess of a format's size in bytes, or None when unknown."""
+    for field in ("filesize", "filesize_approx"):
+        size = fmt.get(field)
+        if size:
+            return int(size)
+    tbr = fmt.get("tbr")
+    if tbr and duration:
+        # tbr is in kbit/s
+        return int(tbr * 1000 / 8 * duration * TBR_MARGIN)
+    return None
+
+
+def _has_video(fmt: Dict[str, Any]) -> bool:
+    vcodec = fmt.get("vcodec")
+    return vcodec not in (None, "none") or bool(fmt.get("height"))
+
+
+def _has_audio(fmt: Dict[str, Any]) -> bool:
+    acodec = fmt.get("acodec")
+    return acodec not in (None, "none")
+
+
+def _quality(*fmts: Dict[str, Any]) -> Tuple[float, float]:
+    height = max((f.get("height") or 0) for f in fmts)
+    return height, sum((f.get("tbr") or 0) for f in fmts)
+
+
+def can_merge() -> bool:
+    """True when ffmpeg is available to merge separate video and audio."""
+    return shutil.which("ffmpeg") is not None
+
+
+def plan_format(info: Dict[str, Any], budget: int, merge: Optional[bool] = None) -> Optional[str]:
+    """Return a yt-dlp format spec for `info` expected to fit in `budget` bytes.
+
+    `merge` controls whether video-only + audio-only pairs are considered
+    (default: whether ffmpeg is installed).
+    """
+    formats: List[Dict[str, Any]] = [f for f in info.get("formats") or () if f.get("format_id")]
+    if not formats:
+        return None
+    if merge is None:
+        merge = can_merge()
+    duration = info.get("duration")
+
+    sized = [(f, estimate_size(f, duration)) for f in formats]
+    sized = [(f, s) for f, s in sized if s is not None]
+    if not sized:
+        logger.info("No size metadata for %s; using the default format", info.get("id"))
+        return None
+
+    options: List[Tuple[Tuple[float, float, int], int, str]] = []
+    for fmt, size in sized:
+        if _has_video(fmt) and _has_audio(fmt):
+            options.append((_quality(fmt) + (1,), size, fmt["format_id"]))
+    if merge:
+        videos = [(f, s) for f, s in sized if _has_video(f) and not _has_audio(f)]
+        audios = [(f, s) for f, s in sized if _has_audio(f) and not _has_video(f)]
+        for video, vsize in videos:
+            for audio, asize in audios:
+                spec = f"{video['format_id']}+{audio['format_id']}"
+                options.append((_quality(video, audio) + (0,), vsize + asize, spec))
+    if not options:
+        return None
+
+    fitting = [o for o in options if o[1] <= budget]
+    if fitting:
+        _, size, spec = max(fitting)
+        logger.info("Planned format %s (~%d bytes, budget %d)", spec, size, budget)
+    else:
+        # nothing fits; the least wasteful download for the fallback upload
+        _, size, spec = min(options, key=lambda o: o[1])
+        logger.info("No format fits budget %d; smallest is %s (~%d bytes)", budget, spec, size)
+    return spec
+
+
+def single_stream_format(info: Dict[str, Any], budget: int) -> Optional[Dict[str, Any]]:
+    """The best format of `info` that can be streamed as one plain HTTP body.
+
+    That is a single file with video and audio, served over http(s) (not
+    HLS/DASH fragments) with an exact `filesize` of at most `budget` bytes.
+    Returns None when there is no such format.
+    """
+    candidates = [
+        f for f in info.get("formats") or ()
+        if f.get("url") and f.get("protocol", "https") in ("http", "https") and not f.get("fragments")
+        and f.get("filesize") and f["filesize"] <= budget and _has_video(f) and _has_audio(f)
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda f: _quality(f))
+
+
+__all__ = ["DEFAULT_FORMAT", "can_merge", "estimate_size", "plan_format", "single_stream_format"]
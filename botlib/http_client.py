@@ -3,20 +3,99 @@
 This module provides `get` and `post` functions that return a normalized
 response dict instead of raising. It intentionally keeps a small surface
 area and minimal dependencies so it's easy to test and reuse in adapters.
+
+All calls share one pooled `requests.Session`, so connections to
+api.telegram.org are kept alive across calls (including every long-poll
+cycle) instead of paying a TCP+TLS handshake each time. 429 responses are
+retried with exponential backoff, honoring Telegram's `retry_after` hint;
+5xx responses only for idempotent methods, since Telegram may answer 502
+to a `sendMessage` it already delivered. A server asking for a longer wait
+than `MAX_BACKOFF` gets its error returned instead of a sleeping thread.
+
+`requests` itself is imported on first use (it costs ~100 ms at startup);
+`http_client.requests` is None when it is not installed.
 """
 
+import os
+import threading
+import time
 from typing import Any, Dict, Optional
 
-try:
-    import requests
-    from requests import Response
-except Exception:  # pragma: no cover - fallback if requests isn't installed
-    requests = None  # type: ignore
+from .logger import get_logger
 
-DEFAULT_TIMEOUT = 10.0
 
+logger = get_logger(__name__)
 
-def _format_response(response: Response) -> Dict[str, Any]:
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _requests():
+    """Return the `requests` module (imported on first call), or None if missing."""
+    if "requests" not in globals():
+        try:
+            import requests as module
+        except Exception:  # pragma: no cover - fallback if requests isn't installed
+            module = None  # type: ignore
+        globals()["requests"] = module
+    return globals()["requests"]
+
+
+def __getattr__(name: str) -> Any:
+    # PEP 562: `http_client.requests` loads the module lazily
+    if name == "requests":
+        return _requests()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _build_session():
+    """Create a session whose pools are sized from the environment.
+
+    `HTTP_POOL_CONNECTIONS` is the number of hosts kept in the pool and
+    `HTTP_POOL_MAXSIZE` the per-host connection limit; with
+    `HTTP_POOL_BLOCK=1` callers wait for a free connection instead of
+    opening extra, non-pooled ones.
+    """
+    requests = _requests()
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=int(os.getenv("HTTP_POOL_CONNECTIONS", str(DEFAULT_POOL_CONNECTIONS))),
+        pool_maxsize=int(os.getenv("HTTP_POOL_MAXSIZE", str(DEFAULT_POOL_MAXSIZE))),
+        pool_block=os.getenv("HTTP_POOL_BLOCK", "0") == "1",
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """Return the process-wide pooled session (created on first use)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def close_session() -> None:
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+
+def _format_response(response: Any) -> Dict[str, Any]:
     try:
         body = response.json()
     except Exception:
@@ -30,44 +109,111 @@ def _format_response(response: Response) -> Dict[str, Any]:
     }
 
 
-def post(url: str,
-         message: Any,
-         headers: Optional[Dict[str, str]] = None,
-         timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+def retry_delay(result: Dict[str, Any], attempt: int, backoff: float = DEFAULT_BACKOFF) -> float:
+    """Seconds to wait before retrying a failed `result`.
+
+    Prefers Telegram's `parameters.retry_after`, then a `Retry-After`
+    header, then exponential backoff (`backoff * 2**attempt`).
+    """
+    body = result.get("body")
+    if isinstance(body, dict):
+        retry_after = (body.get("parameters") or {}).get("retry_after")
+        if retry_after is not None:
+            return float(retry_after)
+    header = (result.get("headers") or {}).get("Retry-After")
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    return min(backoff * (2 ** attempt), MAX_BACKOFF)
+
+
+def next_retry_delay(method: str, result: Dict[str, Any], attempt: int, retries: int,
+                     backoff: float = DEFAULT_BACKOFF) -> Optional[float]:
+    """Seconds to wait before retrying `method` after `result`, or None to give up.
+
+    429 means the request was refused, so every method may retry it; a 5xx
+    may come after the server acted on the request, so only idempotent
+    methods retry those. Waits longer than `MAX_BACKOFF` are not slept out.
+    """
+    status = result.get("status")
+    if attempt >= retries or status not in RETRY_STATUSES:
+        return None
+    if status != 429 and method.upper() not in IDEMPOTENT_METHODS:
+        return None
+    delay = retry_delay(result, attempt, backoff)
+    if delay > MAX_BACKOFF:
+        logger.warning("Server asked to wait %.0fs before retrying; giving up", delay)
+        return None
+    return delay
+
+
+def _rewind(kwargs: Dict[str, Any]) -> None:
+    # multipart uploads read file objects to EOF; rewind them for the retry
+    for value in (kwargs.get("files") or {}).values():
+        fh = value[1] if isinstance(value, tuple) else value
+        if hasattr(fh, "seek"):
+            fh.seek(0)
+
+
+def request(method: str,
+            url: str,
+            timeout: float = DEFAULT_TIMEOUT,
+            retries: Optional[int] = None,
+            **kwargs: Any) -> Dict[str, Any]:
+    """Send a request on the pooled session and return a normalized dict.
+
+    Extra keyword arguments are passed to `requests.Session.request`.
+    Retries up to `retries` times (default `HTTP_MAX_RETRIES`) as
+    `next_retry_delay` allows.
+    """
+    requests = _requests()
     if requests is None:
         return {"ok": False, "status": None, "headers": {}, "body": None,
                 "error": "`requests` library not available"}
 
-    try:
-        resp = requests.post(url, json=message, headers=headers, timeout=timeout)
-    except requests.exceptions.RequestException as exc:
-        return {"ok": False, "status": None, "headers": {}, "body": None,
-                "error": str(exc)}
-
-    result = _format_response(resp)
-    if not resp.ok:
+    if retries is None:
+        retries = int(os.getenv("HTTP_MAX_RETRIES", str(DEFAULT_MAX_RETRIES)))
+    if not getattr(kwargs.get("data"), "rewindable", True):
+        # a one-shot body (e.g. a piped upload) cannot be sent a second time
+        retries = 0
+    backoff = float(os.getenv("HTTP_BACKOFF", str(DEFAULT_BACKOFF)))
+
+    attempt = 0
+    while True:
+        try:
+            resp = get_session().request(method, url, timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException as exc:
+            return {"ok": False, "status": None, "headers": {}, "body": None,
+                    "error": str(exc)}
+
+        result = _format_response(resp)
+        if resp.ok:
+            return result
         result.setdefault("error", None)
-    return result
+        delay = next_retry_delay(method, result, attempt, retries, backoff)
+        if delay is None:
+            return result
+
+        logger.info("%s %s returned %s; retrying in %.1fs", method, url.split("/bot")[0], resp.status_code, delay)
+        time.sleep(delay)
+        _rewind(kwargs)
+        attempt += 1
+
+
+def post(url: str,
+         message: Any,
+         headers: Optional[Dict[str, str]] = None,
+         timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+    return request("POST", url, json=message, headers=headers, timeout=timeout)
 
 
 def get(url: str,
         params: Optional[Dict[str, Any]] = None,
         headers: Optional[Dict[str, str]] = None,
         timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
-    if requests is None:
-        return {"ok": False, "status": None, "headers": {}, "body": None,
-                "error": "`requests` library not available"}
-
-    try:
-        resp = requests.get(url, params=params, headers=headers, timeout=timeout)
-    except requests.exceptions.RequestException as exc:
-        return {"ok": False, "status": None, "headers": {}, "body": None,
-                "error": str(exc)}
-
-    result = _format_response(resp)
-    if not resp.ok:
-        result.setdefault("error", None)
-    return result
+    return request("GET", url, params=params, headers=headers, timeout=timeout)
 
 
-__all__ = ["get", "post"]
+__all__ = ["get", "post", "request", "get_session", "close_session", "next_retry_delay", "retry_delay"]
@@ -0,0 +1,239 @@
+"""Durable record of accepted updates, their job state and the polling offset.
+
+`run_polling` used to keep the getUpdates offset in memory only, so a crash
+either lost updates that were in flight or replayed whatever Telegram still
+held. With a `JobStore`, every update is written to SQLite (WAL) together
+with the new offset *before* Telegram is told it was received, and each job
+moves through `queued -> downloading -> uploading -> done` (or `failed`).
+After a restart the polling loop picks up the stored offset and resubmits
+the jobs that never finished; completed ones are not run again.
+
+Handlers report progress with `mark_current(state)`; the job being handled
+is tracked in a context variable set by `tracked_handler`.
+"""
+
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+UPLOADING = "uploading"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+# a job that crashed the bot this many times is not resumed again
+MAX_ATTEMPTS = 3
+
+
+class JobStore:
+    """Thread-safe SQLite-backed job table plus the confirmed polling offset.
+
+    Usage:
+      jobs = JobStore("/var/lib/bot/jobs.sqlite3")
+      jobs.accept(updates)            # records them and advances the offset
+      jobs.mark(update_id, "downloading")
+      jobs.finish(update_id)
+      jobs.unfinished()               # after a restart
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " update_id INTEGER PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def offset(self) -> Optional[int]:
+        """The next update id to ask Telegram for, or None before the first update."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'offset'").fetchone()
+        return int(row[0]) if row else None
+
+    def accept(self, updates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Record `updates` and advance the offset past them in one transaction.
+
+        Returns the updates that were new; ones already recorded (Telegram
+        redelivering after a crash) are skipped.
+        """
+        if not updates:
+            return []
+        now = time.time()
+        fresh = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM meta WHERE key = 'offset'").fetchone()
+                offset = int(row[0]) if row else 0
+                for upd in updates:
+                    update_id = upd.get("update_id")
+                    if update_id is None:
+                        continue
+                    cur = self._conn.execute(
+                        "INSERT OR IGNORE INTO jobs (update_id, payload, state, created_at, updated_at)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (update_id, json.dumps(upd), QUEUED, now, now),
+                    )
+                    if cur.rowcount:
+                        fresh.append(upd)
+                    offset = max(offset, update_id + 1)
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('offset', ?)"
+                    " ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (str(offset),),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return fresh
+
+    def start(self, update_id: int) -> None:
+        """Count an attempt at running the job."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET attempts = attempts + 1, updated_at = ? WHERE update_id = ?",
+                (time.time(), update_id),
+            )
+
+    def mark(self, update_id: int, state: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE update_id = ?",
+                (state, error, time.time(), update_id),
+            )
+
+    def finish(self, update_id: int) -> None:
+        """Mark the job done unless the handler already marked it failed."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE update_id = ? AND state != ?",
+                (DONE, time.time(), update_id, FAILED),
+            )
+
+    def state(self, update_id: int) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM jobs WHERE update_id = ?", (update_id,)).fetchone()
+        return row[0] if row else None
+
+    def unfinished(self, max_attempts: int = MAX_ATTEMPTS) -> List[Dict[str, Any]]:
+        """Updates whose jobs never finished, oldest first.
+
+        Jobs that already used up `max_attempts` are marked failed instead of
+        being returned, so an update that crashes the bot cannot loop forever.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT update_id, payload, attempts FROM jobs WHERE state NOT IN (?, ?) ORDER BY update_id",
+                FINISHED,
+            ).fetchall()
+        updates = []
+        for update_id, payload, attempts in rows:
+            if attempts >= max_attempts:
+                logger.warning("Giving up on update %s after %d attempts", update_id, attempts)
+                self.mark(update_id, FAILED, "too many attempts")
+                continue
+            updates.append(json.loads(payload))
+        return updates
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: n for state, n in rows}
+
+    def prune(self, older_than: float) -> int:
+        """Delete finished jobs last updated more than `older_than` seconds ago."""
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?",
+                FINISHED + (time.time() - older_than,),
+            )
+        return cur.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_current_job: "contextvars.ContextVar[Optional[Tuple[JobStore, int]]]" = contextvars.ContextVar(
+    "current_job", default=None)
+
+
+def mark_current(state: str, error: Optional[str] = None) -> None:
+    """Record `state` for the job being handled in this context (if any)."""
+    current = _current_job.get()
+    if current is None:
+        return
+    store, update_id = current
+    try:
+        store.mark(update_id, state, error)
+    except Exception:
+        logger.exception("Could not record state %s for update %s", state, update_id)
+
+
+def tracked_handler(store: JobStore, handler: Callable[[Dict[str, Any], Any], None]):
+    """Wrap `handler(update, adapter)` so its job's state is kept in `store`."""
+
+    def run(update: Dict[str, Any], adapter) -> None:
+        update_id = update.get("update_id")
+        if update_id is None:
+            return handler(update, adapter)
+        store.start(update_id)
+        token = _current_job.set((store, update_id))
+        try:
+            handler(update, adapter)
+        except Exception as exc:
+            store.mark(update_id, FAILED, repr(exc))
+            raise
+        else:
+            store.finish(update_id)
+        finally:
+            _current_job.reset(token)
+
+    return run
+
+
+_default_store: Optional[JobStore] = None
+_default_lock = threading.Lock()
+
+
+def get_default_job_store() -> Optional[JobStore]:
+    """Return the store configured via `BOT_JOB_DB`, or None when disabled."""
+    global _default_store
+    path = os.getenv("BOT_JOB_DB")
+    if not path:
+        return None
+    with _default_lock:
+        if _default_store is None or _default_store.path != path:
+            _default_store = JobStore(path)
+        return _default_store
+
+
+__all__ = [
+    "JobStore", "get_default_job_store", "mark_current", "tracked_handler",
+    "QUEUED", "DOWNLOADING", "UPLOADING", "DONE", "FAILED",
+]
@@ -0,0 +1,224 @@
+"""Minimal Prometheus-style metrics for the bot's hot paths.
+
+Counters and histograms live in a process-wide registry and are rendered in
+the Prometheus text exposition format by `render()` (served on `/metrics` by
+`bot_app`). Instrumentation is enabled unless `BOT_METRICS=0`; when disabled
+every recording call returns after a single flag check and `timed()` hands
+out a shared no-op context manager, so the hot paths pay next to nothing.
+
+Usage:
+  DOWNLOADS = counter("bot_downloads_total", "Downloads by result", ["result"])
+  DOWNLOADS.inc(result="ok")
+  with timed(DOWNLOAD_SECONDS, result="ok"):
+      ...
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+ENABLED = os.getenv("BOT_METRICS", "1") != "0"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+_NOOP = nullcontext()
+
+
+def set_enabled(enabled: bool) -> None:
+    global ENABLED
+    ENABLED = enabled
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_str(self.labels, key)} {value:g}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Observations bucketed by upper bound, plus their count and sum."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        # per-bucket counts, then count and sum
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def count(self, **labels: object) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return int(series[-2]) if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, key, le)} {cumulative:g}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_label_str(self.labels, key, le)} {series[-2]:g}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {series[-2]:g}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {series[-1]:g}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, object]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        labels = self.labels
+        if exc_type is not None and "result" in self.histogram.labels:
+            labels = dict(labels, result="error")
+        self.histogram.observe(time.perf_counter() - self.started, **labels)
+        return False
+
+
+def timed(histogram: Histogram, **labels: object):
+    """Context manager observing the elapsed wall time into `histogram`.
+
+    If the block raises and the histogram has a `result` label, the sample is
+    recorded with `result="error"`.
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Timer(histogram, labels)
+
+
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+
+def _register(metric: _Metric) -> _Metric:
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+    return _register(Counter(name, help, labels))  # type: ignore[return-value]
+
+
+def histogram(name: str, help: str, labels: Iterable[str] = (),
+              buckets: Optional[Sequence[float]] = None) -> Histogram:
+    return _register(Histogram(name, help, labels, buckets or DEFAULT_BUCKETS))  # type: ignore[return-value]
+
+
+def render() -> str:
+    """Return every registered metric in Prometheus text format."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Metrics shared by the bot's modules.
+DOWNLOAD_SECONDS = histogram("bot_download_seconds", "Time spent in download_video", ["result"])
+DOWNLOAD_BYTES = counter("bot_download_bytes_total", "Bytes of downloaded (or cache-served) videos", ["source"])
+CACHE_REQUESTS = counter("bot_cache_requests_total", "Download cache lookups", ["result"])
+PACKAGING_SECONDS = histogram("bot_packaging_seconds", "Time spent packaging videos", ["mode"])
+PACKAGING_BYTES = counter("bot_packaging_bytes_total", "Bytes in and out of packaging", ["mode", "direction"])
+TELEGRAM_SECONDS = histogram("bot_telegram_request_seconds", "Telegram Bot API call latency", ["method", "result"])
+TELEGRAM_UPLOAD_BYTES = counter("bot_telegram_upload_bytes_total", "Bytes uploaded to Telegram")
+THROTTLED_SECONDS = counter("bot_telegram_throttled_seconds_total", "Time outbound calls waited for the rate limiter")
+THROTTLED_CALLS = counter("bot_telegram_throttled_calls_total", "Outbound calls delayed by the rate limiter")
+
+
+def observe_telegram(method: str, started: float, result: Dict[str, object]) -> None:
+    """Record a Telegram call that began at `started` (a `perf_counter` value)."""
+    if not ENABLED:
+        return
+    TELEGRAM_SECONDS.observe(time.perf_counter() - started, method=method,
+                             result="ok" if result.get("ok") else "error")
+
+
+__all__ = [
+    "Counter", "Histogram", "counter", "histogram", "observe_telegram", "render", "set_enabled", "timed",
+    "DOWNLOAD_SECONDS", "DOWNLOAD_BYTES", "CACHE_REQUESTS", "PACKAGING_SECONDS", "PACKAGING_BYTES",
+    "TELEGRAM_SECONDS", "TELEGRAM_UPLOAD_BYTES", "THROTTLED_SECONDS", "THROTTLED_CALLS",
+]
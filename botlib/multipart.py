@@ -0,0 +1,195 @@
+"""Streaming `multipart/form-data` encoder for large uploads.
+
+`requests`' `files=` builds the whole multipart body in memory before
+sending. `MultipartEncoder` instead yields the body in fixed-size chunks, so
+uploading a 50 MB (or 2 GB) file keeps memory flat. The encoder exposes
+`len` (the exact body size, so `Content-Length` can be sent) and works both
+as a sync iterable (`requests`) and, through `async_body()`, an async
+iterable (`httpx`). Parts read from file paths are reopened on every
+iteration, so such a body can be sent again on retry; parts that come from
+a one-shot iterable (a pipe, a generator) cannot, and `rewindable` is False
+for them so the HTTP clients skip their retries.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from urllib.parse import quote
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+
+class UploadTimeout(Exception):
+    """Raised while streaming when an upload exceeds its total time budget."""
+
+
+def _disposition(name: str, filename: Optional[str] = None) -> str:
+    value = f'form-data; name="{name}"'
+    if filename is not None:
+        ascii_name = filename.encode("ascii", "replace").decode("ascii").replace('"', "'")
+        value += f'; filename="{ascii_name}"'
+        if ascii_name != filename:
+            value += f"; filename*=UTF-8''{quote(filename)}"
+    return value
+
+
+def _rewindable(source: Union[str, Iterable[bytes]]) -> bool:
+    if isinstance(source, (str, bytes, bytearray, list, tuple)):
+        return True
+    return bool(getattr(source, "rewindable", False))
+
+
+class MultipartEncoder:
+    """Encode form `fields` plus file parts as a chunked byte stream.
+
+    `source` is a file path or an iterable of byte chunks; for iterables pass
+    `size` when known (otherwise `len` is None and the body is sent with
+    chunked transfer encoding). `progress(sent, total)` is called after each
+    file chunk and `timeout` bounds the whole upload in seconds. More files
+    (e.g. for `sendMediaGroup`) can be given as `(field, filename, path)` in
+    `extra_files`.
+
+    Usage:
+      enc = MultipartEncoder({"chat_id": "1"}, "document", "video.zip", "/tmp/video.zip")
+      session.post(url, data=enc, headers={"Content-Type": enc.content_type})
+    """
+
+    def __init__(self,
+                 fields: Dict[str, Any],
+                 file_field: str,
+                 filename: str,
+                 source: Union[str, Iterable[bytes]],
+                 size: Optional[int] = None,
+                 content_type: str = "application/octet-stream",
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 progress: Optional[ProgressCallback] = None,
+                 timeout: Optional[float] = None,
+                 extra_files: Sequence[Tuple[str, str, str]] = ()):
+        self.boundary = uuid.uuid4().hex
+        self.source = source
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.timeout = timeout
+        if isinstance(source, str):
+            size = os.path.getsize(source)
+
+        head = []
+        for name, value in fields.items():
+            head.append(f"--{self.boundary}\r\nContent-Disposition: {_disposition(name)}\r\n\r\n{value}\r\n")
+        head.append(self._file_header(file_field, filename, content_type))
+        # (part header, source) pairs; `extra_files` are (field, filename, path)
+        self._parts: List[Tuple[bytes, Union[str, Iterable[bytes]]]] = [("".join(head).encode("utf-8"), source)]
+        for field, extra_name, path in extra_files:
+            header = "\r\n" + self._file_header(field, extra_name, content_type)
+            self._parts.append((header.encode("utf-8"), path))
+            size = size + os.path.getsize(path) if size is not None else None
+        self.size = size
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        # `requests` reads the body size from a `len` attribute
+        overhead = sum(len(header) for header, _ in self._parts) + len(self._tail)
+        self.len = overhead + size if size is not None else None
+        self.bytes_sent = 0
+
+    def _file_header(self, field: str, filename: str, content_type: str) -> str:
+        return (f"--{self.boundary}\r\nContent-Disposition: {_disposition(field, filename)}\r\n"
+                f"Content-Type: {content_type}\r\n\r\n")
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    @property
+    def rewindable(self) -> bool:
+        """True when the body can be iterated again from the first byte (e.g. for a retry)."""
+        return all(_rewindable(source) for _, source in self._parts)
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": self.content_type}
+        if self.len is not None:
+            headers["Content-Length"] = str(self.len)
+        return headers
+
+    def _file_chunks(self, source: Union[str, Iterable[bytes]]) -> Iterator[bytes]:
+        if isinstance(source, str):
+            with open(source, "rb") as fh:
+                while True:
+                    chunk = fh.read(self.chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+        else:
+            yield from source
+
+    def _check_deadline(self, started: float) -> None:
+        if self.timeout is not None and time.monotonic() - started > self.timeout:
+            raise UploadTimeout(f"upload exceeded {self.timeout:.0f}s after {self.bytes_sent} bytes")
+
+    def _sent(self, chunk: bytes) -> None:
+        self.bytes_sent += len(chunk)
+        if self.progress is not None:
+            try:
+                self.progress(self.bytes_sent, self.size)
+            except Exception:
+                logger.exception("Upload progress callback failed")
+
+    def __iter__(self) -> Iterator[bytes]:
+        started = time.monotonic()
+        self.bytes_sent = 0
+        for header, source in self._parts:
+            yield header
+            for chunk in self._file_chunks(source):
+                self._check_deadline(started)
+                yield chunk
+                self._sent(chunk)
+        yield self._tail
+
+    def async_body(self) -> "_AsyncBody":
+        """Return an async-only view of the body for `httpx` (as `rewindable` as the encoder).
+
+        httpx picks the sync path for objects that also define `__iter__`.
+        """
+        return _AsyncBody(self)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        started = time.monotonic()
+        self.bytes_sent = 0
+        loop = asyncio.get_running_loop()
+        for header, source in self._parts:
+            yield header
+            # disk reads (or a blocking producer) must not stall the event loop
+            chunks = self._file_chunks(source)
+            try:
+                while True:
+                    chunk = await loop.run_in_executor(None, next, chunks, None)
+                    if chunk is None:
+                        break
+                    self._check_deadline(started)
+                    yield chunk
+                    self._sent(chunk)
+            finally:
+                chunks.close()
+        yield self._tail
+
+
+class _AsyncBody:
+    def __init__(self, encoder: MultipartEncoder):
+        self.encoder = encoder
+
+    @property
+    def rewindable(self) -> bool:
+        return self.encoder.rewindable
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self.encoder.__aiter__()
+
+
+__all__ = ["MultipartEncoder", "UploadTimeout"]
@@ -0,0 +1,230 @@
+"""Packaging of downloaded videos before they are sent to the user.
+
+Videos are already compressed, so deflating them into a zip burns a full CPU
+pass and a second on-disk copy for about 0% size gain. The packaging mode is
+selected per deployment with `BOT_PACKAGING`:
+
+- `raw`     send the downloaded file as is (no zip, no copy)
+- `stored`  zip without compression (`ZIP_STORED`); default
+- `stream`  stored zip generated on the fly straight into the upload body,
+            without a temporary file
+- `deflate` legacy behavior (`ZIP_DEFLATED`)
+
+Each packaging run logs its input/output bytes, extra bytes written to disk
+and CPU time so the modes can be compared in production.
+"""
+
+import binascii
+import os
+import struct
+import threading
+import time
+import zipfile
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .logger import get_logger
+from .metrics import PACKAGING_BYTES, PACKAGING_SECONDS
+
+
+logger = get_logger(__name__)
+
+MODES = ("raw", "stored", "stream", "deflate")
+DEFAULT_MODE = "stored"
+ZIP_NAME = "video.zip"
+
+_CHUNK_SIZE = 256 * 1024
+_ZIP32_LIMIT = 0xFFFFFFFF
+# "version needed to extract" 2.0 and the data-descriptor flag (bit 3)
+_VERSION = 20
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+# "made by" Unix, regular file with 0644 permissions
+_MADE_BY = 3 << 8 | _VERSION
+_EXTERNAL_ATTR = 0o100644 << 16
+# zip records; the local and central headers are followed by the entry name
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_DATA_DESCRIPTOR = struct.Struct("<4s3L")
+_CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+_END_OF_CENTRAL_DIR = struct.Struct("<4s4H2LH")
+ZIP_END_SIZE = _END_OF_CENTRAL_DIR.size
+
+
+def packaging_mode() -> str:
+    mode = os.getenv("BOT_PACKAGING", DEFAULT_MODE).lower()
+    if mode not in MODES:
+        logger.warning("Unknown BOT_PACKAGING %r; using %s", mode, DEFAULT_MODE)
+        return DEFAULT_MODE
+    return mode
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    t = time.localtime(timestamp)
+    year = max(t.tm_year, 1980)
+    dos_date = (year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+    dos_time = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+    return dos_date, dos_time
+
+
+def stored_entry_size(size: int, arcname: str) -> int:
+    """Bytes a `size`-byte file named `arcname` adds to a `StreamingZip`, headers included.
+
+    An archive's length is `ZIP_END_SIZE` plus this for every entry.
+    """
+    name = len(arcname.encode("utf-8"))
+    return _LOCAL_HEADER.size + name + size + _DATA_DESCRIPTOR.size + _CENTRAL_HEADER.size + name
+
+
+class _ZipEntry:
+    __slots__ = ("path", "source", "name", "size", "flags", "date", "time")
+
+    def __init__(self, path: Optional[str], arcname: Optional[str],
+                 source: Optional[Iterable[bytes]] = None, size: Optional[int] = None):
+        self.path = path
+        self.source = source
+        self.name = (arcname or os.path.basename(path)).encode("utf-8")
+        self.size = os.path.getsize(path) if size is None else size
+        self.flags = _FLAG_DATA_DESCRIPTOR | (_FLAG_UTF8 if not self.name.isascii() else 0)
+        self.date, self.time = _dos_datetime(os.path.getmtime(path) if path else time.time())
+
+
+class StreamingZip:
+    """A `ZIP_STORED` archive generated as a byte stream.
+
+    `files` is a single path or a sequence of `(path, arcname)` pairs. CRCs
+    are computed while the files are read and written in trailing data
+    descriptors, so the archive needs no temp file and no second pass. Its
+    exact size is known up front (`len`), which lets the upload carry a
+    `Content-Length`. Archives of 4 GiB or more are not supported (no zip64).
+    """
+
+    def __init__(self, files: Union[str, Sequence[Tuple[str, Optional[str]]]], arcname: Optional[str] = None,
+                 chunk_size: int = _CHUNK_SIZE):
+        if isinstance(files, str):
+            files = [(files, arcname)]
+        self._layout([_ZipEntry(path, name) for path, name in files], chunk_size)
+
+    @classmethod
+    def from_stream(cls, source: Iterable[bytes], size: int, arcname: str,
+                    chunk_size: int = _CHUNK_SIZE) -> "StreamingZip":
+        """A one-entry archive whose `size` bytes come from `source` (iterated once)."""
+        archive = cls.__new__(cls)
+        archive._layout([_ZipEntry(None, arcname, source=source, size=size)], chunk_size)
+        return archive
+
+    def _layout(self, entries: List[_ZipEntry], chunk_size: int) -> None:
+        self.entries = entries
+        self.chunk_size = chunk_size
+        self._central_offset = sum(_LOCAL_HEADER.size + len(e.name) + e.size + _DATA_DESCRIPTOR.size
+                                   for e in self.entries)
+        self._central_size = sum(_CENTRAL_HEADER.size + len(e.name) for e in self.entries)
+        self.len = self._central_offset + self._central_size + ZIP_END_SIZE
+        if self.len >= _ZIP32_LIMIT:
+            raise ValueError("StreamingZip does not support archives of 4 GiB or more")
+
+    def __len__(self) -> int:
+        return self.len
+
+    @property
+    def rewindable(self) -> bool:
+        """True unless an entry comes from a one-shot stream (`from_stream`)."""
+        return all(entry.source is None for entry in self.entries)
+
+    def _read(self, entry: _ZipEntry) -> Iterator[bytes]:
+        if entry.source is not None:
+            yield from entry.source
+            return
+        with open(entry.path, "rb") as fh:
+            while True:
+                chunk = fh.read(self.chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def __iter__(self) -> Iterator[bytes]:
+        central = []
+        offset = 0
+        for entry in self.entries:
+            name = entry.name
+            # crc and sizes live in the data descriptor, so they are zero here
+            yield _LOCAL_HEADER.pack(b"PK\x03\x04", _VERSION, entry.flags, zipfile.ZIP_STORED,
+                                     entry.time, entry.date, 0, 0, 0, len(name), 0) + name
+            crc = 0
+            read = 0
+            for chunk in self._read(entry):
+                crc = binascii.crc32(chunk, crc)
+                read += len(chunk)
+                yield chunk
+            if read != entry.size:
+                raise IOError(f"{entry.path or entry.name.decode()} changed size while streaming"
+                              f" ({read} != {entry.size})")
+            yield _DATA_DESCRIPTOR.pack(b"PK\x07\x08", crc, read, read)
+            central.append(_CENTRAL_HEADER.pack(b"PK\x01\x02", _MADE_BY, _VERSION, entry.flags,
+                                                zipfile.ZIP_STORED, entry.time, entry.date, crc, read, read,
+                                                len(name), 0, 0, 0, 0, _EXTERNAL_ATTR, offset) + name)
+            offset += _LOCAL_HEADER.size + len(name) + read + _DATA_DESCRIPTOR.size
+        count = len(self.entries)
+        end = _END_OF_CENTRAL_DIR.pack(b"PK\x05\x06", 0, 0, count, count, self._central_size, offset, 0)
+        yield b"".join(central) + end
+
+
+class Package:
+    """What gets sent to the user: a file on disk or a stream of known size."""
+
+    def __init__(self, mode: str, filename: str, size: int,
+                 path: Optional[str] = None, stream: Optional[StreamingZip] = None):
+        self.mode = mode
+        self.filename = filename
+        self.size = size
+        self.path = path
+        self.stream = stream
+        # a package may be shared by several chats (see services._flights)
+        self._lock = threading.Lock()
+
+    def materialize(self, out_dir: str) -> str:
+        """Return a path for the package, writing the stream to disk if needed."""
+        with self._lock:
+            if self.path is None:
+                path = os.path.join(out_dir, self.filename)
+                with open(path, "wb") as fh:
+                    for chunk in self.stream:
+                        fh.write(chunk)
+                self.path = path
+            return self.path
+
+
+def build_package(downloaded: str, out_dir: str, mode: Optional[str] = None) -> Package:
+    """Package `downloaded` according to `mode` (default: `BOT_PACKAGING`)."""
+    mode = mode or packaging_mode()
+    started = time.perf_counter()
+    cpu_start = time.process_time()
+    input_size = os.path.getsize(downloaded)
+    disk_written = 0
+
+    if mode == "raw":
+        package = Package(mode, os.path.basename(downloaded), input_size, path=downloaded)
+    elif mode == "stream":
+        try:
+            stream = StreamingZip(downloaded)
+        except ValueError:
+            # too big for a zip32 archive; zipfile writes zip64
+            return build_package(downloaded, out_dir, "stored")
+        package = Package(mode, ZIP_NAME, stream.len, stream=stream)
+    else:
+        compression = zipfile.ZIP_DEFLATED if mode == "deflate" else zipfile.ZIP_STORED
+        zip_path = os.path.join(out_dir, ZIP_NAME)
+        with zipfile.ZipFile(zip_path, "w", compression, allowZip64=True) as zf:
+            zf.write(downloaded, arcname=os.path.basename(downloaded))
+        disk_written = os.path.getsize(zip_path)
+        package = Package(mode, ZIP_NAME, disk_written, path=zip_path)
+
+    PACKAGING_SECONDS.observe(time.perf_counter() - started, mode=mode)
+    PACKAGING_BYTES.inc(input_size, mode=mode, direction="in")
+    PACKAGING_BYTES.inc(package.size, mode=mode, direction="out")
+    logger.info("Packaged %s mode=%s input=%d output=%d disk_written=%d cpu=%.3fs",
+                os.path.basename(downloaded), mode, input_size, package.size, disk_written,
+                time.process_time() - cpu_start)
+    return package
+
+
+__all__ = ["MODES", "Package", "StreamingZip", "ZIP_END_SIZE", "build_package", "packaging_mode",
+           "stored_entry_size"]
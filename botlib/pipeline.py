@@ -0,0 +1,187 @@
+"""Stream a video from its source straight into the Telegram upload.
+
+The regular path downloads the whole file, packages it and only then starts
+uploading, so a job takes the sum of both stages and up to twice the video's
+size in temp disk. For formats served as one plain HTTP body (see
+`formats.single_stream_format`), `open_stream` instead starts a thread that
+reads the source into a `BoundedPipe`; the multipart upload consumes the pipe
+as it fills, optionally through `StreamingZip`, so uploading overlaps with
+downloading and nothing is written to disk.
+
+The pipe holds at most `BOT_PIPELINE_BUFFER` bytes: a slow upload holds the
+download back instead of piling it up in memory.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .cache import get_default_cache
+from .downloader import probe, video_key
+from .formats import single_stream_format
+from .http_client import DEFAULT_TIMEOUT, get_session
+from .logger import get_logger
+from .metrics import DOWNLOAD_BYTES, DOWNLOAD_SECONDS
+from .packaging import ZIP_END_SIZE, ZIP_NAME, Package, StreamingZip, packaging_mode, stored_entry_size
+
+
+logger = get_logger(__name__)
+
+DEFAULT_BUFFER = 8 * 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+
+_EOF = object()
+
+
+class PipeClosed(Exception):
+    """The reading side of a `BoundedPipe` went away."""
+
+
+class BoundedPipe:
+    """A bounded queue of byte chunks from one producer thread to one reader.
+
+    The producer calls `write()` (blocking while the pipe is full) and then
+    `close()`, passing the exception if it failed, which is re-raised to
+    the reader. The reader iterates over the pipe and calls `abort()` when it
+    stops early, which makes the producer's next `write()` raise `PipeClosed`.
+    The pipe can be read only once: iterating it again (e.g. an HTTP retry)
+    raises `PipeClosed` instead of waiting for chunks that already went by.
+    """
+
+    rewindable = False
+
+    def __init__(self, max_chunks: int):
+        self._queue: "queue.Queue[Any]" = queue.Queue(max(1, max_chunks))
+        self._aborted = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._read = False
+
+    def write(self, chunk: Any) -> None:
+        while True:
+            if self._aborted.is_set():
+                raise PipeClosed("reader stopped")
+            try:
+                self._queue.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        self._error = error
+        try:
+            self.write(_EOF)
+        except PipeClosed:
+            pass
+
+    def abort(self) -> None:
+        self._aborted.set()
+        # free the slots so a blocked writer notices right away
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self._read or self._aborted.is_set():
+            raise PipeClosed("the pipe was already read")
+        self._read = True
+        while True:
+            chunk = self._queue.get()
+            if chunk is _EOF:
+                if self._error is not None:
+                    raise IOError(f"source failed mid-stream: {self._error}") from self._error
+                return
+            yield chunk
+
+
+def _pump(response, size: int, pipe: BoundedPipe, started: float) -> None:
+    read = 0
+    try:
+        with response:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                read += len(chunk)
+                if read > size:
+                    raise IOError(f"source sent more than the expected {size} bytes")
+                pipe.write(chunk)
+        if read != size:
+            raise IOError(f"source ended after {read} of {size} bytes")
+    except PipeClosed:
+        logger.info("Streaming download aborted after %d bytes", read)
+        DOWNLOAD_SECONDS.observe(time.perf_counter() - started, result="error")
+        return
+    except Exception as exc:
+        logger.warning("Streaming download failed after %d bytes: %s", read, exc)
+        DOWNLOAD_SECONDS.observe(time.perf_counter() - started, result="error")
+        pipe.close(exc)
+        return
+    pipe.close()
+    DOWNLOAD_SECONDS.observe(time.perf_counter() - started, result="ok")
+    DOWNLOAD_BYTES.inc(size, source="network")
+
+
+def _entry_name(info: Dict[str, Any], fmt: Dict[str, Any]) -> str:
+    title = str(info.get("title") or info.get("id") or "video")
+    for bad in "/\\\0":
+        title = title.replace(bad, "_")
+    return f"{title.strip()[:200] or 'video'}.{fmt.get('ext') or 'mp4'}"
+
+
+def _archive_size(info: Dict[str, Any], fmt: Dict[str, Any]) -> int:
+    return stored_entry_size(int(fmt["filesize"]), _entry_name(info, fmt)) + ZIP_END_SIZE
+
+
+def open_stream(url: str, max_bytes: int, mode: Optional[str] = None) -> Optional[Tuple[Package, BoundedPipe]]:
+    """Start streaming `url` and return `(package, pipe)`, or None to use the regular path.
+
+    None means the video is already in the download cache, no format can be
+    streamed within `max_bytes`, or the source did not answer as expected.
+    `package.stream` yields the packaged bytes (a stored zip, or the video
+    itself in `raw` mode); the caller must `pipe.abort()` when done with it.
+    """
+    cache = get_default_cache()
+    if cache is not None and cache.get(video_key(url)):
+        return None
+    info = probe(url)
+    if info is None:
+        return None
+    mode = mode or packaging_mode()
+    if mode == "raw":
+        fmt = single_stream_format(info, max_bytes)
+    else:
+        # leave room for the zip records around the entry, then check the exact
+        # archive size: the entry name depends on the chosen format's extension
+        fmt = single_stream_format(info, max_bytes - stored_entry_size(0, _entry_name(info, {})) - ZIP_END_SIZE)
+        if fmt is not None and _archive_size(info, fmt) > max_bytes:
+            fmt = None
+    if fmt is None:
+        return None
+    name = _entry_name(info, fmt)
+    size = int(fmt["filesize"])
+
+    started = time.perf_counter()
+    response = get_session().get(fmt["url"], headers=fmt.get("http_headers") or {}, stream=True,
+                                 timeout=DEFAULT_TIMEOUT)
+    length = response.headers.get("Content-Length")
+    if not response.ok or (length is not None and int(length) != size):
+        logger.info("Source of %s answered %s (length %s, expected %d); not streaming",
+                    url, response.status_code, length, size)
+        response.close()
+        return None
+
+    buffer = int(os.getenv("BOT_PIPELINE_BUFFER", str(DEFAULT_BUFFER)))
+    pipe = BoundedPipe(buffer // CHUNK_SIZE)
+    if mode == "raw":
+        package = Package("raw", name, size, stream=pipe)
+    else:
+        archive = StreamingZip.from_stream(pipe, size, name)
+        package = Package("stream", ZIP_NAME, archive.len, stream=archive)
+    threading.Thread(target=_pump, args=(response, size, pipe, started),
+                     name="bot-pipeline", daemon=True).start()
+    logger.info("Streaming %s (format %s, %d bytes) straight into the upload", url, fmt.get("format_id"), size)
+    return package, pipe
+
+
+__all__ = ["BoundedPipe", "PipeClosed", "open_stream"]
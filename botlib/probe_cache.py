@@ -0,0 +1,161 @@
+"""TTL cache for yt-dlp metadata (`extract_info(download=False)` results).
+
+Extraction alone can take seconds (page scraping, signature deciphering), so
+the probe stage of `botlib.downloader` keeps its results here. Entries live
+in a bounded in-memory LRU and, when a directory is configured, as JSON files
+that survive restarts. Keep the TTL short: format URLs inside an info dict
+are often signed and expire after a few hours.
+
+Entries are stored serialized, so every `get` returns a private copy that
+yt-dlp may mutate while processing it.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+DEFAULT_TTL = 30 * 60
+DEFAULT_MAX_ENTRIES = 512
+
+
+def _digest(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class ProbeCache:
+    """Probe results by video key, in memory and optionally on disk.
+
+    Usage:
+      probes = ProbeCache(ttl=600, root="/var/cache/bot/probes")
+      info = probes.get(key)
+      if info is None:
+          info = extract(url)
+          probes.put(key, info)
+      probes.invalidate(key)
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, root: Optional[str] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, clock: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self.root = root
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        if root:
+            os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, _digest(key) + ".json")
+
+    def _remember(self, key: str, expires: float, data: str) -> None:
+        with self._lock:
+            self._memory[key] = (expires, data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[Tuple[float, str]]:
+        if not self.root:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if entry.get("key") != key:
+            return None
+        return float(entry.get("expires", 0)), json.dumps(entry.get("info"))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached info for `key`, or None if absent/expired."""
+        now = self._clock()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+        if cached is None:
+            cached = self._load(key)
+            if cached is not None and cached[0] > now:
+                self._remember(key, *cached)
+        if cached is None:
+            return None
+        expires, data = cached
+        if expires <= now:
+            self.invalidate(key)
+            return None
+        return json.loads(data)
+
+    def put(self, key: str, info: Dict[str, Any]) -> None:
+        # default=str keeps odd values (dates, sets) from breaking the cache
+        data = json.dumps(info, default=str)
+        expires = self._clock() + self.ttl
+        self._remember(key, expires, data)
+        if not self.root:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write('{"key": %s, "expires": %r, "info": %s}' % (json.dumps(key), expires, data))
+            os.replace(tmp, self._path(key))
+        except OSError:
+            logger.warning("Could not persist probe for %s", key, exc_info=True)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def invalidate(self, key: str) -> None:
+        """Forget `key` (e.g. after its format URLs turned out to be stale)."""
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.root:
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self.root:
+            for name in os.listdir(self.root):
+                if name.endswith(".json"):
+                    try:
+                        os.unlink(os.path.join(self.root, name))
+                    except OSError:
+                        pass
+
+
+_default_probes: Optional[ProbeCache] = None
+_default_lock = threading.Lock()
+
+
+def get_default_probe_cache() -> Optional[ProbeCache]:
+    """Return the process-wide probe cache, or None when `BOT_PROBE_TTL=0`.
+
+    `BOT_PROBE_TTL` is in seconds (default 1800). Set `BOT_PROBE_CACHE_DIR`
+    to also keep probes on disk across restarts.
+    """
+    global _default_probes
+    ttl = float(os.getenv("BOT_PROBE_TTL", str(DEFAULT_TTL)))
+    if ttl <= 0:
+        return None
+    root = os.getenv("BOT_PROBE_CACHE_DIR") or None
+    with _default_lock:
+        if _default_probes is None or _default_probes.root != root or _default_probes.ttl != ttl:
+            _default_probes = ProbeCache(ttl=ttl, root=root)
+        return _default_probes
+
+
+__all__ = ["ProbeCache", "get_default_probe_cache"]
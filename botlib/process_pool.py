@@ -0,0 +1,239 @@
+"""Run CPU-heavy jobs (yt-dlp extraction, ffmpeg merges) in worker processes.
+
+yt-dlp holds the GIL for long stretches while extracting, which starves the
+polling loop and the FastAPI event loop. `ProcessPool` keeps a few warm
+worker processes (yt-dlp is imported once per worker, not per job) and runs
+one job at a time in each of them:
+
+- every job has a wall-clock limit; a worker that exceeds it is killed
+  together with its process group (so a hung ffmpeg goes too) and replaced;
+- each worker runs under an address-space limit (`RLIMIT_AS`), inherited by
+  the ffmpeg processes it starts;
+- workers are recycled after `max_jobs` jobs to shed leaked memory.
+
+Jobs must be picklable: a module-level function plus picklable arguments.
+Metrics recorded inside a worker stay in that worker's registry.
+"""
+
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from typing import Any, Callable, Optional
+
+from .logger import get_logger
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None  # type: ignore
+
+
+logger = get_logger(__name__)
+
+DEFAULT_TIMEOUT = 1800.0
+DEFAULT_MAX_JOBS = 50
+
+
+class PoolError(Exception):
+    """Base class for jobs that did not produce a result."""
+
+
+class JobTimeout(PoolError):
+    """The job exceeded its time limit; its worker was killed."""
+
+
+class WorkerCrashed(PoolError):
+    """The worker process died while running the job (e.g. out of memory)."""
+
+
+def warm_downloader() -> None:
+    """Pay yt-dlp's import and extractor-table cost before the first job."""
+    from . import downloader
+
+    downloader._extractor_classes()
+
+
+def _worker_main(conn, memory_limit: Optional[int], warm: Optional[Callable[[], None]]) -> None:
+    if hasattr(os, "setpgrp"):
+        # own process group, so a kill also reaches ffmpeg children
+        os.setpgrp()
+    if memory_limit and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    if warm is not None:
+        try:
+            warm()
+        except Exception:
+            logger.exception("Worker warm-up failed")
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        func, args, kwargs = message
+        try:
+            reply = ("ok", func(*args, **kwargs))
+        except BaseException as exc:
+            reply = ("error", exc)
+        try:
+            conn.send(reply)
+        except Exception:
+            # unpicklable result or exception; report something that pickles
+            conn.send(("error", RuntimeError(repr(reply[1]))))
+
+
+class _Worker:
+    def __init__(self, ctx, memory_limit: Optional[int], warm: Optional[Callable[[], None]]):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child, memory_limit, warm),
+                                   name="bot-download-worker", daemon=True)
+        self.process.start()
+        child.close()
+        self.jobs = 0
+
+    def kill(self) -> None:
+        pid = self.process.pid
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except (AttributeError, OSError):
+            self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class ProcessPool:
+    """A fixed number of warm worker processes running one job each.
+
+    Usage:
+      pool = ProcessPool(size=2, timeout=600, memory_limit=2 * 2**30)
+      path = pool.run(download_video, url, out_dir, max_bytes=budget)
+      pool.close()
+    """
+
+    def __init__(self, size: int = 2, timeout: float = DEFAULT_TIMEOUT,
+                 memory_limit: Optional[int] = None, max_jobs: int = DEFAULT_MAX_JOBS,
+                 warm: Optional[Callable[[], None]] = warm_downloader):
+        self.size = size
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_jobs = max_jobs
+        self._warm = warm
+        # spawn: forking a process that runs threads can copy held locks
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self.memory_limit, self._warm)
+
+    def _give_back(self, worker: _Worker, healthy: bool) -> None:
+        with self._lock:
+            closed = self._closed
+        if healthy and not closed and worker.jobs < self.max_jobs and worker.process.is_alive():
+            self._idle.put(worker)
+            return
+        if healthy:
+            worker.stop()
+        else:
+            worker.kill()
+        if not closed:
+            # replace it now so the new worker is warm by the next job
+            self._idle.put(self._spawn())
+
+    def run(self, func: Callable[..., Any], *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+        """Run `func(*args, **kwargs)` in a worker and return its result.
+
+        Exceptions raised by `func` are re-raised here. Raises `JobTimeout`
+        or `WorkerCrashed` when the job was killed or its worker died.
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ProcessPool is closed")
+        worker = self._idle.get()
+        healthy = False
+        try:
+            worker.jobs += 1
+            worker.conn.send((func, args, kwargs))
+            limit = self.timeout if timeout is None else timeout
+            if not worker.conn.poll(limit):
+                logger.warning("Job %s exceeded %.0fs; killing worker %s",
+                               getattr(func, "__name__", func), limit, worker.process.pid)
+                raise JobTimeout(f"job exceeded {limit:.0f}s")
+            status, value = worker.conn.recv()
+            healthy = not isinstance(value, MemoryError)
+        except (EOFError, OSError) as exc:
+            logger.warning("Worker %s died (exit code %s)", worker.process.pid, worker.process.exitcode)
+            raise WorkerCrashed("worker process died") from exc
+        finally:
+            self._give_back(worker, healthy)
+        if status == "error":
+            raise value
+        return value
+
+    def close(self) -> None:
+        """Stop idle workers; workers busy with a job stop when it finishes."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            worker.stop()
+
+
+_default_pool: Optional[ProcessPool] = None
+_default_lock = threading.Lock()
+
+
+def get_default_pool() -> Optional[ProcessPool]:
+    """Return the download pool, or None unless `BOT_DOWNLOAD_PROCESSES` > 0.
+
+    `BOT_DOWNLOAD_TIMEOUT` (seconds) and `BOT_DOWNLOAD_MEMORY_MB` (0 = no
+    limit) bound each job; workers are recycled after `BOT_POOL_MAX_JOBS`.
+    """
+    global _default_pool
+    size = int(os.getenv("BOT_DOWNLOAD_PROCESSES", "0"))
+    if size <= 0:
+        return None
+    with _default_lock:
+        if _default_pool is None:
+            memory_mb = int(os.getenv("BOT_DOWNLOAD_MEMORY_MB", "0"))
+            _default_pool = ProcessPool(
+                size=size,
+                timeout=float(os.getenv("BOT_DOWNLOAD_TIMEOUT", str(DEFAULT_TIMEOUT))),
+                memory_limit=memory_mb * 1024 * 1024 or None,
+                max_jobs=int(os.getenv("BOT_POOL_MAX_JOBS", str(DEFAULT_MAX_JOBS))),
+            )
+        return _default_pool
+
+
+def close_default_pool() -> None:
+    global _default_pool
+    with _default_lock:
+        pool, _default_pool = _default_pool, None
+    if pool is not None:
+        pool.close()
+
+
+__all__ = [
+    "JobTimeout", "PoolError", "ProcessPool", "WorkerCrashed",
+    "close_default_pool", "get_default_pool", "warm_downloader",
+]
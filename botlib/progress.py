@@ -0,0 +1,333 @@
+"""Live progress in a single, throttled status message.
+
+A multi-minute download with no feedback makes users resend their link,
+which multiplies the load. `ProgressReporter` sends one status message and
+keeps editing it (`editMessageText`) from yt-dlp's `progress_hooks` and the
+upload's progress callback. Edits are coalesced: at most one per
+`BOT_PROGRESS_INTERVAL` seconds goes out, intermediate states are dropped
+and the latest one is flushed by a timer, so progress never competes with
+real messages for the chat's rate-limit budget.
+
+`AsyncProgressReporter` does the same for async adapters: its edits are
+awaited by one task on the event loop, so neither progress callbacks nor
+the download threads ever wait for Telegram.
+
+`ProgressBroadcast` fans the progress of one shared (single-flight) download
+out to every chat waiting for it.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+DEFAULT_INTERVAL = 3.0
+
+
+def _message_id(result: Dict[str, Any]) -> Optional[int]:
+    body = result.get("body")
+    if isinstance(body, dict) and isinstance(body.get("result"), dict):
+        return body["result"].get("message_id")
+    return None
+
+
+def format_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if abs(n) < 1024:
+            return f"{n:.0f} B" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def _format_eta(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
+def describe_download(d: Dict[str, Any]) -> Optional[str]:
+    """Status text for a yt-dlp progress dict, or None when not worth showing."""
+    status = d.get("status")
+    if status == "finished":
+        return "Processing video..."
+    if status != "downloading":
+        return None
+    done = d.get("downloaded_bytes") or 0
+    total = d.get("total_bytes") or d.get("total_bytes_estimate")
+    if total:
+        text = f"Downloading: {min(done / total, 1.0):.0%} of {format_bytes(total)}"
+    else:
+        text = f"Downloading: {format_bytes(done)}"
+    speed = d.get("speed")
+    if speed:
+        text += f" at {format_bytes(speed)}/s"
+    eta = d.get("eta")
+    if eta:
+        text += f", ETA {_format_eta(eta)}"
+    return text
+
+
+class ProgressReporter:
+    """One status message in `chat_id`, edited at most every `min_interval` seconds.
+
+    Usage:
+      reporter = ProgressReporter(adapter, chat_id, "Downloading...")
+      opts["progress_hooks"] = [reporter.download_hook]
+      adapter.send_document(chat_id, path, progress=reporter.upload_progress)
+      reporter.finish()          # deletes the status message
+    """
+
+    def __init__(self, adapter, chat_id: int, text: str, min_interval: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.adapter = adapter
+        self.chat_id = chat_id
+        if min_interval is None:
+            min_interval = float(os.getenv("BOT_PROGRESS_INTERVAL", str(DEFAULT_INTERVAL)))
+        self.min_interval = min_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending: Optional[str] = None
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+        self._shown = text
+        self.message_id = _message_id(adapter.send_message(chat_id, text))
+        self._last = clock()
+
+    def _can_edit(self) -> bool:
+        return self.message_id is not None and hasattr(self.adapter, "edit_message_text")
+
+    def _emit(self, text: str, final: bool = False) -> None:
+        with self._send_lock:
+            if (self._closed and not final) or text == self._shown:
+                return
+            self._shown = text
+            try:
+                self.adapter.edit_message_text(self.chat_id, self.message_id, text)
+            except Exception:
+                logger.exception("Could not update progress message")
+
+    def update(self, text: str) -> None:
+        """Show `text` now, or within `min_interval` if an edit went out recently."""
+        if not self._can_edit():
+            return
+        with self._lock:
+            if self._closed:
+                return
+            now = self._clock()
+            wait = self._last + self.min_interval - now
+            if wait > 0:
+                self._pending = text
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self._flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._last = now
+            self._pending = None
+        self._emit(text)
+
+    def _flush(self) -> None:
+        with self._lock:
+            self._timer = None
+            text, self._pending = self._pending, None
+            self._last = self._clock()
+            if text is None or self._closed:
+                return
+        self._emit(text)
+
+    def download_hook(self, d: Dict[str, Any]) -> None:
+        """A yt-dlp `progress_hooks` entry."""
+        text = describe_download(d)
+        if text:
+            self.update(text)
+
+    def upload_progress(self, sent: int, total: Optional[int]) -> None:
+        """A `MultipartEncoder` progress callback."""
+        if total:
+            self.update(f"Uploading: {min(sent / total, 1.0):.0%} of {format_bytes(total)}")
+        else:
+            self.update(f"Uploading: {format_bytes(sent)}")
+
+    def finish(self, text: Optional[str] = None) -> None:
+        """Stop reporting; show `text` as the final state, or remove the message."""
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if text is not None:
+            if self._can_edit():
+                self._emit(text, final=True)
+            else:
+                self.adapter.send_message(self.chat_id, text)
+            return
+        delete = getattr(self.adapter, "delete_message", None)
+        if self.message_id is not None and delete is not None:
+            try:
+                delete(self.chat_id, self.message_id)
+            except Exception:
+                logger.exception("Could not delete progress message")
+
+
+def start_progress(adapter, chat_id: int, text: str) -> Optional[ProgressReporter]:
+    """Return a reporter, or None when disabled (`BOT_PROGRESS=0`) or unsupported."""
+    if os.getenv("BOT_PROGRESS", "1") == "0" or not hasattr(adapter, "edit_message_text"):
+        return None
+    return ProgressReporter(adapter, chat_id, text)
+
+
+class AsyncProgressReporter:
+    """`ProgressReporter` for async adapters; create it inside the event loop.
+
+    `update`, `download_hook` and `upload_progress` may be called from any
+    thread: they only record the latest text and wake a task on the loop,
+    which awaits at most one edit per `min_interval` seconds.
+
+    Usage:
+      reporter = await AsyncProgressReporter.start(adapter, chat_id, "Downloading...")
+      await adapter.send_document(chat_id, path, progress=reporter.upload_progress)
+      await reporter.finish()    # deletes the status message
+    """
+
+    def __init__(self, adapter, chat_id: int, message_id: Optional[int], text: str,
+                 min_interval: Optional[float] = None):
+        self.adapter = adapter
+        self.chat_id = chat_id
+        self.message_id = message_id
+        if min_interval is None:
+            min_interval = float(os.getenv("BOT_PROGRESS_INTERVAL", str(DEFAULT_INTERVAL)))
+        self.min_interval = min_interval
+        self._loop = asyncio.get_running_loop()
+        # guards `_pending` and `_closed` only; never held across an await
+        self._lock = threading.Lock()
+        self._pending: Optional[str] = None
+        self._closed = False
+        self._shown = text
+        self._last = self._loop.time()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._run()) if self._can_edit() else None
+
+    @classmethod
+    async def start(cls, adapter, chat_id: int, text: str,
+                    min_interval: Optional[float] = None) -> "AsyncProgressReporter":
+        """Send the status message and return its reporter."""
+        result = await adapter.send_message(chat_id, text)
+        return cls(adapter, chat_id, _message_id(result), text, min_interval)
+
+    def _can_edit(self) -> bool:
+        return self.message_id is not None and hasattr(self.adapter, "edit_message_text")
+
+    async def _edit(self, text: str) -> None:
+        self._shown = text
+        try:
+            await self.adapter.edit_message_text(self.chat_id, self.message_id, text)
+        except Exception:
+            logger.exception("Could not update progress message")
+
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(max(0.0, self._last + self.min_interval - self._loop.time()))
+            self._wake.clear()
+            with self._lock:
+                text, self._pending = self._pending, None
+            if text is None or text == self._shown:
+                continue
+            self._last = self._loop.time()
+            await self._edit(text)
+
+    def update(self, text: str) -> None:
+        """Show `text` now, or within `min_interval` if an edit went out recently."""
+        if self._task is None:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            self._pending = text
+        try:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        except RuntimeError:
+            # the loop is gone; nobody is left to see the message
+            pass
+
+    def download_hook(self, d: Dict[str, Any]) -> None:
+        """A yt-dlp `progress_hooks` entry."""
+        text = describe_download(d)
+        if text:
+            self.update(text)
+
+    def upload_progress(self, sent: int, total: Optional[int]) -> None:
+        """A `MultipartEncoder` progress callback."""
+        if total:
+            self.update(f"Uploading: {min(sent / total, 1.0):.0%} of {format_bytes(total)}")
+        else:
+            self.update(f"Uploading: {format_bytes(sent)}")
+
+    async def finish(self, text: Optional[str] = None) -> None:
+        """Stop reporting; show `text` as the final state, or remove the message."""
+        with self._lock:
+            self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if text is not None:
+            if self._can_edit():
+                if text != self._shown:
+                    await self._edit(text)
+            else:
+                await self.adapter.send_message(self.chat_id, text)
+            return
+        delete = getattr(self.adapter, "delete_message", None)
+        if self.message_id is not None and delete is not None:
+            try:
+                await delete(self.chat_id, self.message_id)
+            except Exception:
+                logger.exception("Could not delete progress message")
+
+
+async def start_progress_async(adapter, chat_id: int, text: str) -> Optional[AsyncProgressReporter]:
+    """Async counterpart of `start_progress`."""
+    if os.getenv("BOT_PROGRESS", "1") == "0" or not hasattr(adapter, "edit_message_text"):
+        return None
+    return await AsyncProgressReporter.start(adapter, chat_id, text)
+
+
+class ProgressBroadcast:
+    """Route progress of shared jobs to all reporters subscribed to their key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners: Dict[Any, List[ProgressReporter]] = {}
+
+    def subscribe(self, key: Any, reporter: ProgressReporter) -> None:
+        with self._lock:
+            self._listeners.setdefault(key, []).append(reporter)
+
+    def unsubscribe(self, key: Any, reporter: ProgressReporter) -> None:
+        with self._lock:
+            listeners = self._listeners.get(key)
+            if listeners and reporter in listeners:
+                listeners.remove(reporter)
+                if not listeners:
+                    del self._listeners[key]
+
+    def hook(self, key: Any) -> Callable[[Dict[str, Any]], None]:
+        """A yt-dlp progress hook forwarding to the current subscribers of `key`."""
+        def _hook(d: Dict[str, Any]) -> None:
+            with self._lock:
+                listeners = list(self._listeners.get(key, ()))
+            for reporter in listeners:
+                reporter.download_hook(d)
+
+        return _hook
+
+
+__all__ = ["AsyncProgressReporter", "ProgressBroadcast", "ProgressReporter", "describe_download", "format_bytes",
+           "start_progress", "start_progress_async"]
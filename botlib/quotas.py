@@ -0,0 +1,164 @@
+"""Daily per-chat usage accounting and quotas.
+
+Every chat is charged the bytes it was sent and the seconds its downloads
+took. Usage lives in memory as one small `[day, bytes, seconds]` list per
+chat and is written to a JSON file (`BOT_QUOTA_FILE`) at most every
+`BOT_QUOTA_FLUSH` seconds, so a restart keeps today's totals without a
+disk write per job. Counters reset at midnight UTC.
+
+A chat over `BOT_QUOTA_DAILY_MB` or `BOT_QUOTA_DAILY_SECONDS` gets no new
+downloads until the next day; re-sending a video Telegram already has (by
+`file_id`) is free and stays allowed.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 60.0
+DAY = 86400
+
+
+class QuotaLedger:
+    """Thread-safe daily usage per chat, with optional limits and persistence.
+
+    Usage:
+      ledger = QuotaLedger(max_bytes=2 * 2**30, path="/var/lib/bot/quotas.json")
+      if ledger.exceeded(chat_id) is None:
+          ...
+          ledger.charge(chat_id, nbytes=size, seconds=elapsed)
+    """
+
+    def __init__(self, max_bytes: int = 0, max_seconds: float = 0, path: Optional[str] = None,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, clock: Callable[[], float] = time.time):
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.path = path
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        # chat -> [day, bytes, seconds]
+        self._usage: Dict[Hashable, List[float]] = {}
+        self._dirty = False
+        self._flushed = clock()
+        if path:
+            self._load()
+
+    def _today(self) -> int:
+        return int(self._clock() // DAY)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable quota file %s", self.path, exc_info=True)
+            return
+        today = self._today()
+        for chat, entry in data.items():
+            if entry[0] == today:
+                # JSON object keys are strings; chat ids are ints
+                self._usage[int(chat) if chat.lstrip("-").isdigit() else chat] = entry
+
+    def usage(self, chat: Hashable) -> Dict[str, float]:
+        with self._lock:
+            entry = self._usage.get(chat)
+            if entry is None or entry[0] != self._today():
+                return {"bytes": 0, "seconds": 0.0}
+            return {"bytes": int(entry[1]), "seconds": entry[2]}
+
+    def exceeded(self, chat: Hashable) -> Optional[str]:
+        """Which daily quota `chat` used up ("bytes" or "seconds"), or None."""
+        used = self.usage(chat)
+        if self.max_bytes and used["bytes"] >= self.max_bytes:
+            return "bytes"
+        if self.max_seconds and used["seconds"] >= self.max_seconds:
+            return "seconds"
+        return None
+
+    def charge(self, chat: Hashable, nbytes: int = 0, seconds: float = 0.0) -> None:
+        today = self._today()
+        with self._lock:
+            entry = self._usage.get(chat)
+            if entry is None or entry[0] != today:
+                entry = self._usage[chat] = [today, 0, 0.0]
+            entry[1] += nbytes
+            entry[2] += seconds
+            self._dirty = True
+        if self.path and self._clock() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write today's usage to `path` (atomically) if anything changed."""
+        if not self.path:
+            return
+        today = self._today()
+        with self._lock:
+            if not self._dirty:
+                return
+            # yesterday's entries are dead weight; drop them while we're here
+            for chat in [c for c, entry in self._usage.items() if entry[0] != today]:
+                del self._usage[chat]
+            data = {str(chat): entry for chat, entry in self._usage.items()}
+            self._dirty = False
+            self._flushed = self._clock()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".quotas-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(data, fh, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError:
+            logger.warning("Could not write quota file %s", self.path, exc_info=True)
+            os.unlink(tmp)
+            with self._lock:
+                self._dirty = True
+
+
+_default_ledger: Optional[QuotaLedger] = None
+_default_lock = threading.Lock()
+
+
+def get_default_ledger() -> Optional[QuotaLedger]:
+    """Return the process-wide ledger, or None when no quota is configured.
+
+    Limits come from `BOT_QUOTA_DAILY_MB` and `BOT_QUOTA_DAILY_SECONDS`
+    (0 = unlimited); `BOT_QUOTA_FILE` enables persistence.
+    """
+    global _default_ledger
+    max_bytes = int(float(os.getenv("BOT_QUOTA_DAILY_MB", "0")) * 1024 * 1024)
+    max_seconds = float(os.getenv("BOT_QUOTA_DAILY_SECONDS", "0"))
+    if not max_bytes and not max_seconds:
+        return None
+    path = os.getenv("BOT_QUOTA_FILE") or None
+    with _default_lock:
+        ledger = _default_ledger
+        if ledger is None or ledger.path != path:
+            if ledger is not None:
+                ledger.flush()
+            ledger = _default_ledger = QuotaLedger(
+                path=path, flush_interval=float(os.getenv("BOT_QUOTA_FLUSH", str(DEFAULT_FLUSH_INTERVAL))))
+        ledger.max_bytes = max_bytes
+        ledger.max_seconds = max_seconds
+        return ledger
+
+
+def flush_default_ledger() -> None:
+    """Persist the process-wide ledger (call on shutdown)."""
+    ledger = _default_ledger
+    if ledger is not None:
+        ledger.flush()
+
+
+__all__ = ["QuotaLedger", "flush_default_ledger", "get_default_ledger"]
@@ -0,0 +1,172 @@
+"""Token-bucket rate limiting for outbound Telegram calls.
+
+Telegram allows roughly 30 messages per second per bot and about one message
+per second per chat; going faster gets 429 responses. `RateLimiter` keeps a
+global bucket plus one bucket per chat and delays calls until both have a
+token, so bursts are smoothed out instead of failing.
+
+Buckets use the GCRA formulation of a token bucket: each reservation books
+the next free slot, so waiting callers are served in order and the lock is
+never held while sleeping.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .logger import get_logger
+from .metrics import THROTTLED_CALLS, THROTTLED_SECONDS
+
+
+logger = get_logger(__name__)
+
+DEFAULT_GLOBAL_RATE = 30.0
+DEFAULT_GLOBAL_BURST = 30
+DEFAULT_CHAT_RATE = 1.0
+DEFAULT_CHAT_BURST = 3
+# idle per-chat buckets are dropped once this many are tracked
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """A bucket refilled at `rate` tokens per second holding up to `burst` tokens."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1.0 / rate
+        self.tolerance = (max(burst, 1) - 1) * self.interval
+        self._tat = 0.0  # theoretical arrival time of the next conforming call
+
+    def reserve(self, at: float) -> float:
+        """Book one token for a call made at `at`; return when it may proceed."""
+        tat = max(self._tat, at)
+        start = max(at, tat - self.tolerance)
+        self._tat = tat + self.interval
+        return start
+
+    def idle(self, now: float) -> bool:
+        """True when the bucket is full again (it can be forgotten)."""
+        return self._tat <= now
+
+
+class RateLimiter:
+    """Global plus per-chat token buckets shared by all calls of one bot.
+
+    Usage:
+      limiter = RateLimiter()
+      limiter.acquire(chat_id)          # blocks until the call may go out
+      await limiter.acquire_async(chat_id)
+    """
+
+    def __init__(self,
+                 global_rate: float = DEFAULT_GLOBAL_RATE,
+                 global_burst: int = DEFAULT_GLOBAL_BURST,
+                 chat_rate: float = DEFAULT_CHAT_RATE,
+                 chat_burst: int = DEFAULT_CHAT_BURST,
+                 clock: Callable[[], float] = time.monotonic):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: Dict[Hashable, TokenBucket] = {}
+        self._calls = 0
+        self._throttled_calls = 0
+        self._throttled_seconds = 0.0
+        self._max_wait = 0.0
+
+    def _reserve_chat(self, chat_id: Optional[Hashable]) -> float:
+        if chat_id is None:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                if len(self._chats) >= MAX_CHAT_BUCKETS:
+                    self._prune(now)
+                bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            return bucket.reserve(now) - now
+
+    def _reserve_global(self) -> float:
+        with self._lock:
+            now = self._clock()
+            return self._global.reserve(now) - now
+
+    def _record(self, wait: float) -> None:
+        with self._lock:
+            self._calls += 1
+            if wait > 0:
+                self._throttled_calls += 1
+                self._throttled_seconds += wait
+                self._max_wait = max(self._max_wait, wait)
+        if wait > 0:
+            THROTTLED_CALLS.inc()
+            THROTTLED_SECONDS.inc(wait)
+
+    def _prune(self, now: float) -> None:
+        for key in [k for k, b in self._chats.items() if b.idle(now)]:
+            del self._chats[key]
+
+    # The chat slot is waited for first and the global token is only booked
+    # once the call is ready to go, so a call queued behind its chat never
+    # holds back other chats.
+
+    def acquire(self, chat_id: Optional[Hashable] = None) -> float:
+        """Block until a call to `chat_id` may be sent; returns seconds waited."""
+        total = 0.0
+        for reserve in (lambda: self._reserve_chat(chat_id), self._reserve_global):
+            wait = reserve()
+            if wait > 0:
+                time.sleep(wait)
+                total += wait
+        self._record(total)
+        return total
+
+    async def acquire_async(self, chat_id: Optional[Hashable] = None) -> float:
+        total = 0.0
+        for reserve in (lambda: self._reserve_chat(chat_id), self._reserve_global):
+            wait = reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                total += wait
+        self._record(total)
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters describing how much outbound calls were throttled."""
+        with self._lock:
+            return {
+                "calls": self._calls,
+                "throttled_calls": self._throttled_calls,
+                "throttled_seconds": self._throttled_seconds,
+                "max_wait_seconds": self._max_wait,
+                "tracked_chats": len(self._chats),
+            }
+
+
+_default_limiter: Optional[RateLimiter] = None
+_default_lock = threading.Lock()
+
+
+def get_default_limiter() -> Optional[RateLimiter]:
+    """Return the process-wide limiter, or None when `TELEGRAM_RATE_LIMIT=0`.
+
+    Limits come from `TELEGRAM_GLOBAL_RATE`/`TELEGRAM_GLOBAL_BURST` and
+    `TELEGRAM_CHAT_RATE`/`TELEGRAM_CHAT_BURST`.
+    """
+    global _default_limiter
+    if os.getenv("TELEGRAM_RATE_LIMIT", "1") == "0":
+        return None
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter(
+                global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", str(DEFAULT_GLOBAL_RATE))),
+                global_burst=int(os.getenv("TELEGRAM_GLOBAL_BURST", str(DEFAULT_GLOBAL_BURST))),
+                chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", str(DEFAULT_CHAT_RATE))),
+                chat_burst=int(os.getenv("TELEGRAM_CHAT_BURST", str(DEFAULT_CHAT_BURST))),
+            )
+        return _default_limiter
+
+
+__all__ = ["RateLimiter", "TokenBucket", "get_default_limiter"]
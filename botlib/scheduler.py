@@ -0,0 +1,230 @@
+"""Fair scheduling of updates between chats, with a priority lane.
+
+The `Dispatcher` asks a `FairScheduler` which queued update a free worker
+should run next:
+
+- Updates are queued per chat (its *flow*), in arrival order, and start in
+  that order. At most `BOT_CHAT_CONCURRENCY` updates of a chat run at once
+  (1 keeps them strictly sequential).
+- Between chats, weighted fair queuing: each chat has a virtual time that
+  advances by the seconds its updates kept a worker busy divided by its
+  weight (`BOT_CHAT_WEIGHTS`, e.g. `12345=2,67890=0.5`). The ready flow with
+  the smallest virtual time runs next, so a chat spamming long videos falls
+  behind chats that asked for little. A chat that goes idle and comes back
+  restarts at the current virtual time instead of cashing in on credit.
+- The `priority` lane holds updates that are cheap to serve: no download at
+  all, a video already in the download cache or `file_id` store, or one
+  probed as shorter than `BOT_SHORT_VIDEO_SECONDS`. The lane only reorders
+  chats: a chat whose next update is a priority one is picked before the
+  others, and `BOT_PRIORITY_WORKERS` workers are kept free of normal
+  downloads so a cache hit never waits behind another chat's 2 GB one. It
+  still waits for its own chat's earlier updates.
+
+The scheduler is not thread-safe; the dispatcher calls it under its lock.
+"""
+
+import itertools
+import os
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+PRIORITY = "priority"
+NORMAL = "normal"
+LANES = (PRIORITY, NORMAL)
+
+DEFAULT_CHAT_CONCURRENCY = 1
+DEFAULT_PRIORITY_WORKERS = 1
+DEFAULT_SHORT_VIDEO_SECONDS = 120
+
+
+def _cached(url: str) -> bool:
+    from .cache import get_default_cache
+    from .downloader import known_video_key
+    from .file_id_store import get_default_store, package_key
+    from .packaging import packaging_mode
+
+    store = get_default_store()
+    cache = get_default_cache()
+    if store is None and cache is None:
+        return False
+    key = known_video_key(url)
+    return bool((store is not None and store.get(package_key(key, packaging_mode())))
+                or (cache is not None and cache.get(key)))
+
+
+def _short(url: str) -> bool:
+    from .downloader import known_video_key
+    from .probe_cache import get_default_probe_cache
+
+    probes = get_default_probe_cache()
+    info = probes.get(known_video_key(url)) if probes is not None else None
+    duration = (info or {}).get("duration")
+    limit = float(os.getenv("BOT_SHORT_VIDEO_SECONDS", str(DEFAULT_SHORT_VIDEO_SECONDS)))
+    return duration is not None and float(duration) <= limit
+
+
+def classify_update(update: Dict[str, Any]) -> str:
+    """The lane for `update`; looks only at local caches, never the network.
+
+    Runs on the ingress path (the polling thread or the webhook's event
+    loop), so it never loads yt-dlp either: cache keys come from
+    `known_video_key`, and a URL no worker has resolved yet is NORMAL.
+    """
+    from .services import URL_RE
+
+    msg = update.get("message") or update.get("edited_message") or {}
+    urls = URL_RE.findall(msg.get("text") or "")
+    if not urls:
+        return PRIORITY
+    if len(set(urls)) > 1:
+        return NORMAL
+    try:
+        return PRIORITY if _cached(urls[0]) or _short(urls[0]) else NORMAL
+    except Exception:
+        logger.debug("Could not classify %s", urls[0], exc_info=True)
+        return NORMAL
+
+
+def parse_weights(value: str) -> Dict[Hashable, float]:
+    """Parse `BOT_CHAT_WEIGHTS` (`chat=weight,...`)."""
+    weights: Dict[Hashable, float] = {}
+    for item in value.split(","):
+        chat, sep, weight = item.strip().partition("=")
+        if not sep:
+            continue
+        chat = chat.strip()
+        weights[int(chat) if chat.lstrip("-").isdigit() else chat] = float(weight)
+    return weights
+
+
+class _Flow:
+    __slots__ = ("chat", "queue", "running")
+
+    def __init__(self, chat: Hashable):
+        self.chat = chat
+        # (arrival sequence, lane, update)
+        self.queue: Deque[Tuple[int, str, Dict[str, Any]]] = deque()
+        self.running = 0
+
+
+class FairScheduler:
+    """Pick the next update to run: priority lane first, then the fairest chat.
+
+    Usage (under the caller's lock):
+      scheduler.push(update)
+      run, update = scheduler.pop()      # None when nothing may start now
+      ...run it...
+      scheduler.done(run, elapsed_seconds)
+    """
+
+    def __init__(self, key: Callable[[Dict[str, Any]], Hashable], workers: int,
+                 per_chat: int = DEFAULT_CHAT_CONCURRENCY, priority_workers: int = DEFAULT_PRIORITY_WORKERS,
+                 weights: Optional[Dict[Hashable, float]] = None,
+                 classify: Optional[Callable[[Dict[str, Any]], str]] = None):
+        self.key = key
+        self.per_chat = max(1, per_chat)
+        # one worker always remains for normal updates
+        self.priority_workers = max(0, min(priority_workers, workers - 1))
+        self.normal_slots = max(1, workers - self.priority_workers)
+        self.weights = weights or {}
+        self.classify = classify
+        self._flows: Dict[Hashable, _Flow] = {}
+        self._vtime: Dict[Hashable, float] = {}
+        self._now = 0.0
+        self._seq = itertools.count()
+        self._pending = {lane: 0 for lane in LANES}
+        self._running = {lane: 0 for lane in LANES}
+
+    @classmethod
+    def from_env(cls, key: Callable[[Dict[str, Any]], Hashable], workers: int) -> "FairScheduler":
+        return cls(
+            key, workers,
+            per_chat=int(os.getenv("BOT_CHAT_CONCURRENCY", str(DEFAULT_CHAT_CONCURRENCY))),
+            priority_workers=int(os.getenv("BOT_PRIORITY_WORKERS", str(DEFAULT_PRIORITY_WORKERS))),
+            weights=parse_weights(os.getenv("BOT_CHAT_WEIGHTS", "")),
+            classify=classify_update,
+        )
+
+    @property
+    def pending(self) -> int:
+        return sum(self._pending.values())
+
+    def lane_of(self, update: Dict[str, Any]) -> str:
+        """Classify `update`; call outside the caller's lock, it may touch disk."""
+        return self.classify(update) if self.classify is not None else NORMAL
+
+    def push(self, update: Dict[str, Any], lane: str = NORMAL) -> None:
+        chat = self.key(update)
+        if not self._active(chat):
+            # an idle chat resumes at the current virtual time: no saved-up credit
+            self._vtime[chat] = max(self._vtime.get(chat, 0.0), self._now)
+        flow = self._flows.get(chat)
+        if flow is None:
+            flow = self._flows[chat] = _Flow(chat)
+        flow.queue.append((next(self._seq), lane, update))
+        self._pending[lane] += 1
+
+    def pop(self) -> Optional[Tuple[Tuple[_Flow, str], Dict[str, Any]]]:
+        """The next `((flow, lane), update)` to run, or None.
+
+        Only the head of each chat's queue is eligible, so the lane decides
+        which chat goes next but never reorders a chat's own updates.
+        """
+        for lane in LANES:
+            if lane == NORMAL and self._running[NORMAL] >= self.normal_slots:
+                continue
+            best = None
+            best_tag = None
+            for flow in self._flows.values():
+                if not flow.queue or flow.queue[0][1] != lane or flow.running >= self.per_chat:
+                    continue
+                tag = (self._vtime.get(flow.chat, 0.0), flow.queue[0][0])
+                if best_tag is None or tag < best_tag:
+                    best, best_tag = flow, tag
+            if best is not None:
+                _, _, update = best.queue.popleft()
+                best.running += 1
+                self._pending[lane] -= 1
+                self._running[lane] += 1
+                self._now = max(self._now, best_tag[0])
+                return (best, lane), update
+        return None
+
+    def done(self, run: Tuple[_Flow, str], elapsed: float) -> None:
+        flow, lane = run
+        flow.running -= 1
+        self._running[lane] -= 1
+        self._vtime[flow.chat] = self._vtime.get(flow.chat, self._now) + elapsed / self.weights.get(flow.chat, 1.0)
+        if not flow.queue and not flow.running:
+            self._flows.pop(flow.chat, None)
+        if not self._active(flow.chat) and self._vtime[flow.chat] <= self._now:
+            # it would restart at `_now` anyway; keep the table small
+            del self._vtime[flow.chat]
+
+    def clear(self) -> int:
+        """Drop every queued update; returns how many were dropped."""
+        dropped = self.pending
+        for flow in list(self._flows.values()):
+            flow.queue.clear()
+            if not flow.running:
+                del self._flows[flow.chat]
+        self._pending = {lane: 0 for lane in LANES}
+        return dropped
+
+    def _active(self, chat: Hashable) -> bool:
+        return chat in self._flows
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": dict(self._pending),
+            "running": dict(self._running),
+            "active_chats": len(self._flows),
+        }
+
+
+__all__ = ["FairScheduler", "LANES", "NORMAL", "PRIORITY", "classify_update", "parse_weights"]
@@ -5,16 +5,37 @@ update dicts (as returned by Telegram getUpdates) and use the adapter to
 perform side effects.
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
+import asyncio
+import contextvars
+import functools
 import os
 import re
-import shutil
-import tempfile
-import zipfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 from .logger import get_logger
-from .downloader import download_video
+from .cache import normalize_url
+from .downloader import download_video, video_key
+from .file_id_store import get_default_store, package_key
+from .job_store import DOWNLOADING, FAILED, UPLOADING, mark_current
+from .packaging import ZIP_END_SIZE, Package, StreamingZip, build_package, packaging_mode, stored_entry_size
+from .pipeline import open_stream
+from .process_pool import PoolError, get_default_pool
+from .progress import (
+    AsyncProgressReporter,
+    ProgressBroadcast,
+    ProgressReporter,
+    start_progress,
+    start_progress_async,
+)
+from .quotas import get_default_ledger
+from .singleflight import SingleFlight
+from .storage import get_default_storage
+from .workspace import get_default_workspace
 
 
 logger = get_logger(__name__)
@@ -22,78 +43,762 @@ logger = get_logger(__name__)
 
 URL_RE = re.compile(r"https?://\S+")
 
+DEFAULT_MAX_URLS = 20
+DEFAULT_USER_CONCURRENCY = 3
+DEFAULT_MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+# sendMediaGroup takes 2-10 items
+MEDIA_GROUP_SIZE = 10
+# threads downloading for `handle_update_async`
+DEFAULT_ASYNC_DOWNLOADS = 32
 
-def handle_update(update: Dict[str, Any], adapter) -> None:
-    """Handle a single update. If text contains a URL, download video and send a zip.
+# concurrent requests for the same URL share one download/packaging job
+_flights = SingleFlight()
+# ...and every chat waiting for it sees the shared download's progress
+_progress = ProgressBroadcast()
 
-    Otherwise, echo the text back.
-    """
+
+def _sent_file_id(result: Dict[str, Any]) -> Optional[str]:
+    """Extract the `file_id` of the document Telegram stored for a send call."""
+    body = result.get("body")
+    if not isinstance(body, dict):
+        return None
+    message = body.get("result") or {}
+    for kind in ("document", "video", "animation"):
+        media = message.get(kind)
+        if isinstance(media, dict) and media.get("file_id"):
+            return media["file_id"]
+    return None
+
+
+def _resend_known_file(store, key: str, chat_id: int, adapter) -> bool:
+    """Send a previously uploaded file by `file_id`; True if Telegram accepted it."""
+    file_id = store.get(key)
+    send_by_id = getattr(adapter, "send_document_by_id", None)
+    if not file_id or send_by_id is None:
+        return False
+    result = send_by_id(chat_id, file_id)
+    if result.get("ok"):
+        logger.info("Resent %s by file_id", key)
+        return True
+    # the file_id may have been revoked; forget it and upload again
+    logger.info("Stored file_id for %s was rejected; re-uploading", key)
+    store.delete(key)
+    return False
+
+
+def _quota_refused(chat_id: int) -> Optional[str]:
+    """The refusal to send when `chat_id` used up today's download quota, else None."""
+    ledger = get_default_ledger()
+    used_up = ledger.exceeded(chat_id) if ledger is not None else None
+    if used_up is None:
+        return None
+    logger.info("Chat %s reached its daily %s quota", chat_id, used_up)
+    mark_current(FAILED, f"daily {used_up} quota reached")
+    return "You've reached today's download limit. Please try again tomorrow."
+
+
+def _charge(chat_id: int, nbytes: int = 0, seconds: float = 0.0) -> None:
+    ledger = get_default_ledger()
+    if ledger is not None:
+        ledger.charge(chat_id, nbytes, seconds)
+
+
+def _parse_message(update: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+    """Return `(chat_id, text)` for message updates, None for anything else."""
     msg = update.get("message") or update.get("edited_message")
     if not msg:
         logger.debug("Ignoring non-message update: %s", update)
-        return
+        return None
 
     chat = msg.get("chat", {})
     chat_id = chat.get("id")
-    text = msg.get("text")
     if chat_id is None:
         logger.debug("Message missing chat_id: %s", msg)
+        return None
+    return chat_id, msg.get("text") or ""
+
+
+def _find_urls(text: str) -> List[str]:
+    """All distinct URLs in `text`, in order, capped at `BOT_MAX_URLS`."""
+    urls = list(dict.fromkeys(URL_RE.findall(text)))
+    return urls[:int(os.getenv("BOT_MAX_URLS", str(DEFAULT_MAX_URLS)))]
+
+
+def _sender_id(update: Dict[str, Any], chat_id: int) -> int:
+    msg = update.get("message") or update.get("edited_message") or {}
+    return (msg.get("from") or {}).get("id", chat_id)
+
+
+def _max_upload_bytes(adapter=None) -> int:
+    """`TELEGRAM_MAX_UPLOAD_BYTES`, else the adapter's limit (2000 MB on a local Bot API server)."""
+    value = os.getenv("TELEGRAM_MAX_UPLOAD_BYTES")
+    if value:
+        return int(value)
+    return getattr(adapter, "max_upload_bytes", DEFAULT_MAX_UPLOAD_BYTES)
+
+
+# room left for the zip container when planning the download format
+_PACKAGING_HEADROOM = 64 * 1024
+
+
+def _stream_sender(adapter, package: Package):
+    """The adapter's `send_document_stream` if `package` should be streamed, else None."""
+    # a local Bot API server reads files from disk, which beats streaming them over HTTP
+    if package.path is not None or getattr(adapter, "local_files", None):
+        return None
+    return getattr(adapter, "send_document_stream", None)
+
+
+def _send_package(adapter, chat_id: int, package: Package, temp_dir: str,
+                  reporter: Optional[ProgressReporter] = None) -> Dict[str, Any]:
+    """Upload `package`, streaming it when the adapter supports that."""
+    kwargs = {"progress": reporter.upload_progress} if reporter is not None else {}
+    send_stream = _stream_sender(adapter, package)
+    if send_stream is not None:
+        return send_stream(chat_id, package.stream, package.size, package.filename, **kwargs)
+    return adapter.send_document(chat_id, package.materialize(temp_dir), filename=package.filename, **kwargs)
+
+
+def _fallback_upload(zip_path: str) -> Optional[str]:
+    """Offload a file that is too large for Telegram to the configured storage.
+
+    Returns the download link, or None when offloading is disabled or failed.
+    """
+    try:
+        storage = get_default_storage()
+        if storage is None:
+            return None
+        return storage.upload(zip_path)
+    except Exception:
+        logger.exception("Fallback upload failed")
+        return None
+
+
+class _Prepared:
+    """The shared outcome of downloading and packaging one URL."""
+
+    __slots__ = ("temp_dir", "downloaded", "package", "too_large", "link")
+
+    def __init__(self, temp_dir: str, package: Optional[Package] = None,
+                 too_large: bool = False, link: Optional[str] = None, downloaded: Optional[str] = None):
+        self.temp_dir = temp_dir
+        self.downloaded = downloaded
+        self.package = package
+        self.too_large = too_large
+        self.link = link
+
+
+def _run_download(url: str, out_dir: str, max_bytes: int) -> Optional[str]:
+    """Call `download_video`, in a worker process when a pool is configured.
+
+    Download progress is only reported for in-process downloads; hooks
+    cannot cross into a worker process.
+    """
+    pool = get_default_pool()
+    if pool is None:
+        return download_video(url, out_dir, max_bytes=max_bytes,
+                              progress_hooks=[_progress.hook(normalize_url(url))])
+    try:
+        return pool.run(download_video, url, out_dir, max_bytes=max_bytes)
+    except PoolError as exc:
+        logger.warning("Download of %s aborted: %s", url, exc)
+        return None
+
+
+def _prepare(url: str, limit: int) -> _Prepared:
+    """Download and package `url`; oversized packages go to the fallback host.
+
+    Runs once per burst of identical requests (see `_flights`), so everything
+    that costs bandwidth or disk happens here rather than per chat. The
+    download directory is stable per URL, so a retry after a crash resumes
+    the partial download instead of starting over.
+    """
+    temp_dir = get_default_workspace().acquire(normalize_url(url))
+    try:
+        budget = max(limit - _PACKAGING_HEADROOM, 1)
+        downloaded = _run_download(url, temp_dir, budget)
+        if not downloaded:
+            return _Prepared(temp_dir)
+        package = build_package(downloaded, temp_dir)
+        if package.size <= limit:
+            return _Prepared(temp_dir, package, downloaded=downloaded)
+        link = _fallback_upload(package.materialize(temp_dir))
+        return _Prepared(temp_dir, package, too_large=True, link=link, downloaded=downloaded)
+    except BaseException:
+        get_default_workspace().release(temp_dir, done=False)
+        raise
+
+
+def _discard_prepared(prepared: _Prepared) -> None:
+    # keep partial downloads of failed jobs around so the next attempt resumes
+    get_default_workspace().release(prepared.temp_dir, done=prepared.package is not None)
+
+
+class _UserSlots:
+    """Caps how many downloads one user runs at once, across all their chats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots: Dict[int, List[Any]] = {}
+
+    @contextmanager
+    def slot(self, user_id: int):
+        limit = int(os.getenv("BOT_USER_CONCURRENCY", str(DEFAULT_USER_CONCURRENCY)))
+        with self._lock:
+            entry = self._slots.get(user_id)
+            if entry is None:
+                entry = self._slots[user_id] = [threading.BoundedSemaphore(limit), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._slots[user_id]
+
+
+_user_slots = _UserSlots()
+
+
+class _BatchItem:
+    __slots__ = ("index", "url", "flight", "prepared", "error")
+
+    def __init__(self, index: int, url: str):
+        self.index = index
+        self.url = url
+        self.flight = normalize_url(url)
+        self.prepared: Optional[_Prepared] = None
+        self.error: Optional[str] = None
+
+    @property
+    def arcname(self) -> str:
+        return f"{self.index:02d}-{os.path.basename(self.prepared.downloaded)}"
+
+
+def _batch_progress(items: List[_BatchItem], finished: int) -> str:
+    failed = sum(1 for item in items if item.error)
+    text = f"Downloading {len(items)} links: {finished}/{len(items)} done"
+    return text + (f", {failed} failed" if failed else "")
+
+
+def _batch_summary(items: List[_BatchItem]) -> str:
+    sent = [item for item in items if item.error is None]
+    lines = [f"Sent {len(sent)} of {len(items)} videos."]
+    for item in items:
+        if item.error:
+            lines.append(f"{item.index}. {item.url} — {item.error}")
+    return "\n".join(lines)
+
+
+def _archive_parts(items: List[_BatchItem], limit: int) -> List[List[_BatchItem]]:
+    """Split `items` into consecutive groups whose stored zip fits in `limit` bytes.
+
+    Sizes include every entry's zip headers, so each part's `StreamingZip`
+    is exactly as large as planned here.
+    """
+    parts: List[List[_BatchItem]] = []
+    current: List[_BatchItem] = []
+    size = ZIP_END_SIZE
+    for item in items:
+        cost = stored_entry_size(os.path.getsize(item.prepared.downloaded), item.arcname)
+        if current and size + cost > limit:
+            parts.append(current)
+            current, size = [], ZIP_END_SIZE
+        current.append(item)
+        size += cost
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _archives(items: List[_BatchItem], limit: int) -> List[Tuple[List[_BatchItem], Package]]:
+    """The streamed zip archives delivering `items`, with the items each one holds."""
+    parts = _archive_parts(items, limit)
+    archives = []
+    for number, part in enumerate(parts, 1):
+        archive = StreamingZip([(item.prepared.downloaded, item.arcname) for item in part])
+        name = "videos.zip" if len(parts) == 1 else f"videos-{number}.zip"
+        archives.append((part, Package("stream", name, archive.len, stream=archive)))
+    return archives
+
+
+def _media_groups(adapter, items: List[_BatchItem]) -> List[List[_BatchItem]]:
+    """`items` in media groups when `BOT_BATCH_MODE=media_group` and the adapter can send them, else []."""
+    if os.getenv("BOT_BATCH_MODE", "archive").lower() != "media_group" or not hasattr(adapter, "send_media_group"):
+        return []
+    return [items[start:start + MEDIA_GROUP_SIZE] for start in range(0, len(items), MEDIA_GROUP_SIZE)]
+
+
+def _deliver_batch(adapter, chat_id: int, items: List[_BatchItem], work_dir: str,
+                   reporter: Optional[ProgressReporter] = None) -> None:
+    """Send the prepared videos as media groups or as streamed zip archives.
+
+    `BOT_BATCH_MODE` selects `archive` (default) or `media_group`. Items whose
+    upload fails get an error for the summary.
+    """
+    groups = _media_groups(adapter, items)
+    for group in groups:
+        if len(group) == 1:
+            item = group[0]
+            result = adapter.send_document(chat_id, item.prepared.downloaded, filename=item.arcname)
+        else:
+            result = adapter.send_media_group(chat_id, [(i.prepared.downloaded, i.arcname) for i in group])
+        if not result.get("ok"):
+            for item in group:
+                item.error = "upload failed"
+    if groups:
         return
 
-    if text:
-        # Look for first URL in text
-        m = URL_RE.search(text)
-        if m:
-            url = m.group(0)
-            logger.info("Detected URL in message: %s", url)
-            temp_dir = tempfile.mkdtemp(prefix="bot_dl_")
-            try:
-                downloaded = download_video(url, temp_dir)
-                if not downloaded:
-                    adapter.send_message(chat_id, "Sorry, I couldn't download that video.")
-                    return
-
-                # create a zip archive containing the downloaded file
-                zip_path = os.path.join(temp_dir, "video.zip")
-                with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-                    arcname = os.path.basename(downloaded)
-                    zf.write(downloaded, arcname=arcname)
-
-                # If file is too large for Telegram, optionally upload to transfer.sh and send link
-                max_bytes = int(os.getenv("TELEGRAM_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
-                size = os.path.getsize(zip_path)
-                if size > max_bytes:
-                    # try to upload to transfer.sh as a fallback
-                    try:
-                        import requests
-
-                        with open(zip_path, "rb") as fh:
-                            files = {"file": ("video.zip", fh)}
-                            r = requests.post("https://transfer.sh/", files=files, timeout=60)
-                        if r.status_code == 200:
-                            link = r.text.strip()
-                            adapter.send_message(chat_id, f"File too large to send via Telegram. Download it here: {link}")
-                        else:
-                            adapter.send_message(chat_id, "File too large to send, and fallback upload failed.")
-                    except Exception:
-                        adapter.send_message(chat_id, "File too large and fallback upload failed.")
-                else:
-                    result = adapter.send_document(chat_id, zip_path, filename="video.zip")
-                    if not result.get("ok"):
-                        adapter.send_message(chat_id, "Failed to upload the video.")
+    for part, package in _archives(items, _max_upload_bytes(adapter)):
+        result = _send_package(adapter, chat_id, package, work_dir, reporter)
+        if not result.get("ok"):
+            for item in part:
+                item.error = "upload failed"
+
+
+def _prepare_item(item: _BatchItem, user_id: int, max_bytes: int) -> None:
+    """Download and package one batch item, recording why it can't be sent."""
+    try:
+        with _user_slots.slot(user_id):
+            item.prepared = _flights.acquire(item.flight, lambda: _prepare(item.url, max_bytes),
+                                             _discard_prepared)
+    except Exception:
+        logger.exception("Batch download of %s failed", item.url)
+        item.error = "download failed"
+        return
+    if item.prepared.package is None:
+        item.error = "download failed"
+    elif item.prepared.too_large:
+        link = item.prepared.link
+        item.error = f"too large, download it here: {link}" if link else "too large to send"
+
+
+def _handle_batch(urls: List[str], chat_id: int, user_id: int, update_id: Any, adapter) -> None:
+    """Download several URLs concurrently and deliver them together.
+
+    At most `BOT_USER_CONCURRENCY` downloads run at once per user. Progress
+    and per-link failures are reported in one status message that is edited
+    as items finish.
+    """
+    items = [_BatchItem(i, url) for i, url in enumerate(urls, 1)]
+    max_bytes = _max_upload_bytes(adapter)
+    status = ProgressReporter(adapter, chat_id, _batch_progress(items, 0))
+    finished = [0]
+    finished_lock = threading.Lock()
+
+    def prepare(item: _BatchItem) -> None:
+        _prepare_item(item, user_id, max_bytes)
+        with finished_lock:
+            finished[0] += 1
+            text = _batch_progress(items, finished[0])
+        status.update(text)
+
+    workspace = get_default_workspace()
+    work_dir = workspace.acquire(f"batch:{chat_id}:{update_id}")
+    try:
+        limit = int(os.getenv("BOT_USER_CONCURRENCY", str(DEFAULT_USER_CONCURRENCY)))
+        with ThreadPoolExecutor(max_workers=max(1, min(limit, len(items)))) as pool:
+            list(pool.map(prepare, items))
+        ready = [item for item in items if item.error is None]
+        if ready:
+            mark_current(UPLOADING)
+            status.update(f"Uploading {len(ready)} videos...")
+            _deliver_batch(adapter, chat_id, ready, work_dir, status)
+            _charge(chat_id, sum(item.prepared.package.size for item in ready if item.error is None))
+    finally:
+        for item in items:
+            if item.prepared is not None:
+                _flights.release(item.flight)
+        workspace.release(work_dir)
+    if any(item.error for item in items):
+        mark_current(FAILED, "some links failed")
+    status.finish(_batch_summary(items))
+
+
+def _deliver(adapter, chat_id: int, prepared: _Prepared, store, key: Optional[str],
+             reporter: Optional[ProgressReporter]) -> None:
+    """Send one prepared video (or the reason it can't be sent) to `chat_id`."""
+    package = prepared.package
+    if package is None:
+        mark_current(FAILED, "download failed")
+        adapter.send_message(chat_id, "Sorry, I couldn't download that video.")
+        return
+    mark_current(UPLOADING)
+    if prepared.too_large:
+        # If file is too large for Telegram, it was offloaded to external storage instead
+        if prepared.link:
+            adapter.send_message(chat_id, f"File too large to send via Telegram. Download it here: {prepared.link}")
+        else:
+            mark_current(FAILED, "fallback upload failed")
+            adapter.send_message(chat_id, "File too large to send, and fallback upload failed.")
+        return
+    if reporter is not None:
+        reporter.update("Uploading...")
+    result = _send_package(adapter, chat_id, package, prepared.temp_dir, reporter)
+    if not result.get("ok"):
+        mark_current(FAILED, "upload failed")
+        adapter.send_message(chat_id, "Failed to upload the video.")
+    else:
+        _charge(chat_id, package.size)
+        if store is not None:
+            file_id = _sent_file_id(result)
+            if file_id:
+                store.put(key, file_id)
+
+
+def _stream_through(url: str, adapter, chat_id: int, store, key: Optional[str],
+                    reporter: Optional[ProgressReporter]) -> bool:
+    """Pipe `url` from its source straight into the upload (`BOT_PIPELINE=1`).
+
+    Only single-stream formats qualify (see `botlib.pipeline`). Returns False
+    whenever the regular download-then-upload path should run instead,
+    including when streaming failed part way. Streams are per chat: unlike
+    `_prepare`, they are not shared between concurrent requests.
+    """
+    if (os.getenv("BOT_PIPELINE", "0") != "1" or not hasattr(adapter, "send_document_stream")
+            or getattr(adapter, "local_files", None)):
+        return False
+    try:
+        opened = open_stream(url, _max_upload_bytes(adapter))
+    except Exception:
+        logger.warning("Could not stream %s; downloading it first", url, exc_info=True)
+        return False
+    if opened is None:
+        return False
+    package, pipe = opened
+    kwargs = {"progress": reporter.upload_progress} if reporter is not None else {}
+    try:
+        result = adapter.send_document_stream(chat_id, package.stream, package.size, package.filename, **kwargs)
+    except Exception:
+        logger.warning("Streaming upload of %s failed; downloading it first", url, exc_info=True)
+        return False
+    finally:
+        pipe.abort()
+    if not result.get("ok"):
+        logger.warning("Streaming upload of %s was rejected; downloading it first", url)
+        return False
+    _charge(chat_id, package.size)
+    if store is not None:
+        file_id = _sent_file_id(result)
+        if file_id:
+            store.put(key, file_id)
+    return True
+
+
+def handle_update(update: Dict[str, Any], adapter) -> None:
+    """Handle a single update. If text contains a URL, download video and send it.
+
+    The video is packaged according to `BOT_PACKAGING` (a zip by default).
+    Messages with several URLs are downloaded concurrently and delivered
+    together (see `_handle_batch`). Concurrent updates carrying the same
+    (normalized) URL share a single download and packaging job; each chat
+    then gets its own upload. Adapters that can edit messages get a live
+    progress message that is removed once the video is sent. With
+    `BOT_PIPELINE=1`, videos in a single-stream format are piped from their
+    source into the upload without an intermediate file. Downloads count
+    towards the chat's daily quota (see `botlib.quotas`); re-sending a
+    known `file_id` does not.
+
+    Otherwise, echo the text back.
+    """
+    parsed = _parse_message(update)
+    if parsed is None:
+        return
+    chat_id, text = parsed
+
+    urls = _find_urls(text)
+    if len(urls) > 1:
+        logger.info("Detected %d URLs in message", len(urls))
+        refusal = _quota_refused(chat_id)
+        if refusal:
+            adapter.send_message(chat_id, refusal)
+            return
+        mark_current(DOWNLOADING)
+        started = time.monotonic()
+        try:
+            _handle_batch(urls, chat_id, _sender_id(update, chat_id), update.get("update_id"), adapter)
+        finally:
+            _charge(chat_id, seconds=time.monotonic() - started)
+        return
+    if urls:
+        url = urls[0]
+        logger.info("Detected URL in message: %s", url)
+        store = get_default_store()
+        key = package_key(video_key(url), packaging_mode()) if store is not None else None
+        if store is not None and _resend_known_file(store, key, chat_id, adapter):
+            return
+        refusal = _quota_refused(chat_id)
+        if refusal:
+            adapter.send_message(chat_id, refusal)
+            return
+        mark_current(DOWNLOADING)
+        flight = normalize_url(url)
+        reporter = start_progress(adapter, chat_id, "Downloading...")
+        if reporter is not None:
+            _progress.subscribe(flight, reporter)
+        started = time.monotonic()
+        try:
+            if _stream_through(url, adapter, chat_id, store, key, reporter):
                 return
-            finally:
-                try:
-                    shutil.rmtree(temp_dir)
-                except Exception:
-                    pass
+            limit = _max_upload_bytes(adapter)
+            with _flights.share(flight, lambda: _prepare(url, limit), _discard_prepared) as prepared:
+                if reporter is not None:
+                    _progress.unsubscribe(flight, reporter)
+                _deliver(adapter, chat_id, prepared, store, key, reporter)
+        finally:
+            _charge(chat_id, seconds=time.monotonic() - started)
+            if reporter is not None:
+                _progress.unsubscribe(flight, reporter)
+                reporter.finish()
+        return
 
     # Fallback echo behavior
-    text = text or ""
     reply = f"Echo: {text}"
     result = adapter.send_message(chat_id, reply)
     if not result.get("ok"):
         logger.warning("Failed to send reply: %s", result.get("error"))
 
 
-__all__ = ["handle_update"]
+_download_pool: Optional[ThreadPoolExecutor] = None
+_download_pool_lock = threading.Lock()
+
+
+def _get_download_pool() -> ThreadPoolExecutor:
+    # not the loop's default executor: a download holds its thread for
+    # minutes and must not starve the uploads' disk reads running there
+    global _download_pool
+    with _download_pool_lock:
+        if _download_pool is None:
+            _download_pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv("BOT_ASYNC_DOWNLOADS", str(DEFAULT_ASYNC_DOWNLOADS))),
+                thread_name_prefix="bot-async-download")
+        return _download_pool
+
+
+async def _download_in_pool(fn, *args: Any) -> Any:
+    """Run a download/packaging step in the download pool, keeping the job context."""
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(_get_download_pool(), call)
+
+
+async def _resend_known_file_async(store, key: str, chat_id: int, adapter) -> bool:
+    file_id = await asyncio.to_thread(store.get, key)
+    send_by_id = getattr(adapter, "send_document_by_id", None)
+    if not file_id or send_by_id is None:
+        return False
+    result = await send_by_id(chat_id, file_id)
+    if result.get("ok"):
+        logger.info("Resent %s by file_id", key)
+        return True
+    logger.info("Stored file_id for %s was rejected; re-uploading", key)
+    await asyncio.to_thread(store.delete, key)
+    return False
+
+
+async def _send_package_async(adapter, chat_id: int, package: Package, temp_dir: str,
+                              reporter: Optional[AsyncProgressReporter] = None) -> Dict[str, Any]:
+    kwargs = {"progress": reporter.upload_progress} if reporter is not None else {}
+    send_stream = _stream_sender(adapter, package)
+    if send_stream is not None:
+        return await send_stream(chat_id, package.stream, package.size, package.filename, **kwargs)
+    path = await asyncio.to_thread(package.materialize, temp_dir)
+    return await adapter.send_document(chat_id, path, filename=package.filename, **kwargs)
+
+
+async def _remember_file_id(store, key: Optional[str], result: Dict[str, Any]) -> None:
+    file_id = _sent_file_id(result) if store is not None else None
+    if file_id:
+        await asyncio.to_thread(store.put, key, file_id)
+
+
+async def _deliver_async(adapter, chat_id: int, prepared: _Prepared, store, key: Optional[str],
+                         reporter: Optional[AsyncProgressReporter]) -> None:
+    package = prepared.package
+    if package is None:
+        await asyncio.to_thread(mark_current, FAILED, "download failed")
+        await adapter.send_message(chat_id, "Sorry, I couldn't download that video.")
+        return
+    await asyncio.to_thread(mark_current, UPLOADING)
+    if prepared.too_large:
+        if prepared.link:
+            await adapter.send_message(chat_id,
+                                       f"File too large to send via Telegram. Download it here: {prepared.link}")
+        else:
+            await asyncio.to_thread(mark_current, FAILED, "fallback upload failed")
+            await adapter.send_message(chat_id, "File too large to send, and fallback upload failed.")
+        return
+    if reporter is not None:
+        reporter.update("Uploading...")
+    result = await _send_package_async(adapter, chat_id, package, prepared.temp_dir, reporter)
+    if not result.get("ok"):
+        await asyncio.to_thread(mark_current, FAILED, "upload failed")
+        await adapter.send_message(chat_id, "Failed to upload the video.")
+    else:
+        await asyncio.to_thread(_charge, chat_id, package.size)
+        await _remember_file_id(store, key, result)
+
+
+async def _stream_through_async(url: str, adapter, chat_id: int, store, key: Optional[str],
+                                reporter: Optional[AsyncProgressReporter]) -> bool:
+    """Async counterpart of `_stream_through`."""
+    if (os.getenv("BOT_PIPELINE", "0") != "1" or not hasattr(adapter, "send_document_stream")
+            or getattr(adapter, "local_files", None)):
+        return False
+    try:
+        opened = await _download_in_pool(open_stream, url, _max_upload_bytes(adapter))
+    except Exception:
+        logger.warning("Could not stream %s; downloading it first", url, exc_info=True)
+        return False
+    if opened is None:
+        return False
+    package, pipe = opened
+    kwargs = {"progress": reporter.upload_progress} if reporter is not None else {}
+    try:
+        result = await adapter.send_document_stream(chat_id, package.stream, package.size, package.filename,
+                                                    **kwargs)
+    except Exception:
+        logger.warning("Streaming upload of %s failed; downloading it first", url, exc_info=True)
+        return False
+    finally:
+        pipe.abort()
+    if not result.get("ok"):
+        logger.warning("Streaming upload of %s was rejected; downloading it first", url)
+        return False
+    await asyncio.to_thread(_charge, chat_id, package.size)
+    await _remember_file_id(store, key, result)
+    return True
+
+
+async def _deliver_batch_async(adapter, chat_id: int, items: List[_BatchItem], work_dir: str,
+                               reporter: Optional[AsyncProgressReporter] = None) -> None:
+    groups = _media_groups(adapter, items)
+    for group in groups:
+        if len(group) == 1:
+            item = group[0]
+            result = await adapter.send_document(chat_id, item.prepared.downloaded, filename=item.arcname)
+        else:
+            result = await adapter.send_media_group(chat_id, [(i.prepared.downloaded, i.arcname) for i in group])
+        if not result.get("ok"):
+            for item in group:
+                item.error = "upload failed"
+    if groups:
+        return
+
+    for part, package in await asyncio.to_thread(_archives, items, _max_upload_bytes(adapter)):
+        result = await _send_package_async(adapter, chat_id, package, work_dir, reporter)
+        if not result.get("ok"):
+            for item in part:
+                item.error = "upload failed"
+
+
+async def _handle_batch_async(urls: List[str], chat_id: int, user_id: int, update_id: Any, adapter) -> None:
+    """Async counterpart of `_handle_batch`."""
+    items = [_BatchItem(i, url) for i, url in enumerate(urls, 1)]
+    max_bytes = _max_upload_bytes(adapter)
+    status = await AsyncProgressReporter.start(adapter, chat_id, _batch_progress(items, 0))
+    limit = asyncio.Semaphore(max(1, int(os.getenv("BOT_USER_CONCURRENCY", str(DEFAULT_USER_CONCURRENCY)))))
+    finished = 0
+
+    async def prepare(item: _BatchItem) -> None:
+        nonlocal finished
+        async with limit:
+            await _download_in_pool(_prepare_item, item, user_id, max_bytes)
+        finished += 1
+        status.update(_batch_progress(items, finished))
+
+    workspace = get_default_workspace()
+    work_dir = await asyncio.to_thread(workspace.acquire, f"batch:{chat_id}:{update_id}")
+    try:
+        await asyncio.gather(*(prepare(item) for item in items))
+        ready = [item for item in items if item.error is None]
+        if ready:
+            await asyncio.to_thread(mark_current, UPLOADING)
+            status.update(f"Uploading {len(ready)} videos...")
+            await _deliver_batch_async(adapter, chat_id, ready, work_dir, status)
+            await asyncio.to_thread(_charge, chat_id,
+                                    sum(item.prepared.package.size for item in ready if item.error is None))
+    finally:
+        for item in items:
+            if item.prepared is not None:
+                await asyncio.to_thread(_flights.release, item.flight)
+        await asyncio.to_thread(workspace.release, work_dir)
+    if any(item.error for item in items):
+        await asyncio.to_thread(mark_current, FAILED, "some links failed")
+    await status.finish(_batch_summary(items))
+
+
+async def handle_update_async(update: Dict[str, Any], adapter) -> None:
+    """Async counterpart of `handle_update` for `AsyncTelegramAdapter`.
+
+    Same batches, progress messages, quotas, job states and `file_id`
+    reuse. Telegram calls are awaited on the event loop; only blocking work
+    leaves it: downloads and packaging run in a dedicated pool
+    (`BOT_ASYNC_DOWNLOADS` threads), disk and SQLite access in the default
+    executor.
+    """
+    parsed = _parse_message(update)
+    if parsed is None:
+        return
+    chat_id, text = parsed
+
+    urls = _find_urls(text)
+    if len(urls) > 1:
+        logger.info("Detected %d URLs in message", len(urls))
+        refusal = await asyncio.to_thread(_quota_refused, chat_id)
+        if refusal:
+            await adapter.send_message(chat_id, refusal)
+            return
+        await asyncio.to_thread(mark_current, DOWNLOADING)
+        started = time.monotonic()
+        try:
+            await _handle_batch_async(urls, chat_id, _sender_id(update, chat_id), update.get("update_id"), adapter)
+        finally:
+            await asyncio.to_thread(_charge, chat_id, 0, time.monotonic() - started)
+        return
+    if urls:
+        url = urls[0]
+        logger.info("Detected URL in message: %s", url)
+        store = get_default_store()
+        key = None
+        if store is not None:
+            key = package_key(await asyncio.to_thread(video_key, url), packaging_mode())
+            if await _resend_known_file_async(store, key, chat_id, adapter):
+                return
+        refusal = await asyncio.to_thread(_quota_refused, chat_id)
+        if refusal:
+            await adapter.send_message(chat_id, refusal)
+            return
+        await asyncio.to_thread(mark_current, DOWNLOADING)
+        flight = normalize_url(url)
+        reporter = await start_progress_async(adapter, chat_id, "Downloading...")
+        if reporter is not None:
+            _progress.subscribe(flight, reporter)
+        started = time.monotonic()
+        try:
+            if await _stream_through_async(url, adapter, chat_id, store, key, reporter):
+                return
+            limit = _max_upload_bytes(adapter)
+            # joining a flight blocks until its leader is done, so it happens in the pool too
+            prepared = await _download_in_pool(_flights.acquire, flight, lambda: _prepare(url, limit),
+                                               _discard_prepared)
+            try:
+                if reporter is not None:
+                    _progress.unsubscribe(flight, reporter)
+                await _deliver_async(adapter, chat_id, prepared, store, key, reporter)
+            finally:
+                await asyncio.to_thread(_flights.release, flight)
+        finally:
+            await asyncio.to_thread(_charge, chat_id, 0, time.monotonic() - started)
+            if reporter is not None:
+                _progress.unsubscribe(flight, reporter)
+                await reporter.finish()
+        return
+
+    result = await adapter.send_message(chat_id, f"Echo: {text}")
+    if not result.get("ok"):
+        logger.warning("Failed to send reply: %s", result.get("error"))
+
+
+__all__ = ["handle_update", "handle_update_async"]
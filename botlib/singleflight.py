@@ -0,0 +1,108 @@
+"""Coalesce concurrent work for the same key into a single execution.
+
+When a link goes viral many chats ask for the same URL within seconds.
+`SingleFlight` lets the first caller (the leader) run the job while every
+other caller for the same key waits and receives the same result. The result
+stays shared until the last participant releases it, at which point the
+optional `cleanup` runs once (e.g. to delete the shared temp directory).
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "refs", "cleanup")
+
+    def __init__(self, cleanup: Optional[Callable[[Any], None]]):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.refs = 1
+        self.cleanup = cleanup
+
+
+class SingleFlight:
+    """Share one execution of `produce()` among concurrent callers per key.
+
+    Usage:
+      flight = SingleFlight()
+      with flight.share(url, lambda: prepare(url), cleanup=remove) as prepared:
+          send(prepared)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def acquire(self, key: Hashable, produce: Callable[[], Any],
+                cleanup: Optional[Callable[[Any], None]] = None) -> Any:
+        """Return the shared result for `key`, running `produce` if nobody is.
+
+        Every successful `acquire` must be paired with `release(key)`. If
+        `produce` raises, all waiting callers get the same exception and no
+        release is needed.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.refs += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call(cleanup)
+                leader = True
+
+        if leader:
+            try:
+                call.result = produce()
+            except BaseException as exc:
+                call.error = exc
+                with self._lock:
+                    # failed jobs are not shared with later arrivals
+                    self._calls.pop(key, None)
+                raise
+            finally:
+                call.done.set()
+        else:
+            logger.info("Joining in-flight job for %s", key)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+        return call.result
+
+    def release(self, key: Hashable) -> None:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                return
+            call.refs -= 1
+            if call.refs > 0:
+                return
+            del self._calls[key]
+        if call.cleanup is not None:
+            try:
+                call.cleanup(call.result)
+            except Exception:
+                logger.exception("Cleanup for %s failed", key)
+
+    @contextmanager
+    def share(self, key: Hashable, produce: Callable[[], Any],
+              cleanup: Optional[Callable[[Any], None]] = None) -> Iterator[Any]:
+        result = self.acquire(key, produce, cleanup)
+        try:
+            yield result
+        finally:
+            self.release(key)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+__all__ = ["SingleFlight"]
@@ -0,0 +1,341 @@
+"""Offload storage for files that are too large to send through Telegram.
+
+`handle_update` used to POST such files to transfer.sh inline, as one
+buffered multipart body with a 60 s timeout, so big files (exactly the ones
+that need offloading) tended to time out. Uploads now go through a
+`StorageBackend` chosen with `BOT_STORAGE`:
+
+- `transfer_sh` (default): a streamed PUT to transfer.sh (`TRANSFER_SH_URL`
+  points it at a self-hosted instance);
+- `local`: the file is placed under `BOT_STORAGE_DIR` and served by
+  `bot_app` at `/files/...`; links carry an HMAC signature and expire;
+- `s3`: any S3-compatible store (AWS, MinIO, R2...) through `boto3`, with
+  parallel multipart uploads and presigned, expiring links;
+- `none`: no offloading; users are told the file is too large.
+
+Every backend streams from disk and retries failed requests (or parts) up to
+`BOT_STORAGE_RETRIES` times.
+"""
+
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+from urllib.parse import quote
+
+from .http_client import request
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+DEFAULT_LINK_TTL = 24 * 3600
+DEFAULT_TRANSFER_SH_URL = "https://transfer.sh"
+DEFAULT_TRANSFER_SH_TIMEOUT = 300.0
+DEFAULT_PART_SIZE = 16 * 1024 * 1024
+# S3 rejects multipart parts smaller than this (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_S3_CONCURRENCY = 4
+# longest lifetime S3 allows for a presigned URL
+MAX_PRESIGN_TTL = 7 * 24 * 3600
+
+_TOKEN_RE = re.compile(r"^[0-9]+-[A-Za-z0-9_-]+$")
+
+
+class StorageError(Exception):
+    """An upload to offload storage failed."""
+
+
+def _retry(func: Callable[[], T], what: str, retries: int, backoff: float) -> T:
+    """Call `func`, retrying up to `retries` times with exponential backoff."""
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as exc:
+            if attempt >= retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            logger.warning("%s failed (%s); retry %d/%d in %.1fs", what, exc, attempt + 1, retries, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+class StorageBackend:
+    """Interface: store a local file and return a link users can download it from."""
+
+    name = "none"
+
+    def __init__(self, retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF):
+        self.retries = retries
+        self.backoff = backoff
+
+    def upload(self, path: str, name: Optional[str] = None) -> str:
+        """Store `path` as `name` (default: its basename); raises `StorageError`."""
+        raise NotImplementedError
+
+
+class TransferShBackend(StorageBackend):
+    """transfer.sh (or a compatible self-hosted instance), via a streamed PUT."""
+
+    name = "transfer_sh"
+
+    def __init__(self, url: str = DEFAULT_TRANSFER_SH_URL, timeout: float = DEFAULT_TRANSFER_SH_TIMEOUT,
+                 max_days: Optional[int] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.max_days = max_days
+
+    def _put(self, path: str, name: str) -> str:
+        headers = {"Max-Days": str(self.max_days)} if self.max_days else {}
+        # a file object is streamed by requests instead of being read into memory
+        with open(path, "rb") as fh:
+            result = request("PUT", f"{self.url}/{quote(name)}", data=fh, headers=headers,
+                             timeout=self.timeout, retries=0)
+        if not result.get("ok"):
+            raise StorageError(f"transfer.sh returned {result.get('status')}: {result.get('error')}")
+        link = str(result.get("body") or "").strip()
+        if not link.startswith("http"):
+            raise StorageError(f"unexpected transfer.sh response: {link[:200]!r}")
+        return link
+
+    def upload(self, path: str, name: Optional[str] = None) -> str:
+        name = name or os.path.basename(path)
+        return _retry(lambda: self._put(path, name), "transfer.sh upload", self.retries, self.backoff)
+
+
+class LocalBackend(StorageBackend):
+    """Files under `root`, served over HTTP at `base_url` with signed, expiring links.
+
+    Usage:
+      store = LocalBackend("/srv/bot-files", "https://bot.example.com/files", secret)
+      link = store.upload(zip_path)          # .../files/<token>/<name>?expires=...&sig=...
+      path = store.resolve(token, name, expires, sig)   # in the HTTP handler
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, base_url: str, secret: str, ttl: float = DEFAULT_LINK_TTL,
+                 clock: Callable[[], float] = time.time, **kwargs: Any):
+        super().__init__(**kwargs)
+        if not secret:
+            raise ValueError("LocalBackend needs a secret to sign links (BOT_STORAGE_SECRET)")
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        self.ttl = ttl
+        self._secret = secret.encode("utf-8")
+        self._clock = clock
+        os.makedirs(root, exist_ok=True)
+
+    def sign(self, token: str, name: str, expires: int) -> str:
+        message = f"{token}/{name}:{expires}".encode("utf-8")
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()
+
+    def _store(self, path: str, target: str) -> None:
+        tmp = target + ".tmp"
+        try:
+            # a hard link costs nothing when the workspace is on the same filesystem
+            os.link(path, tmp)
+        except OSError:
+            shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+
+    def upload(self, path: str, name: Optional[str] = None) -> str:
+        name = os.path.basename(name or path)
+        self.purge()
+        expires = int(self._clock() + self.ttl)
+        token = f"{expires}-{secrets.token_urlsafe(12)}"
+        directory = os.path.join(self.root, token)
+        os.makedirs(directory)
+        try:
+            _retry(lambda: self._store(path, os.path.join(directory, name)), "local store",
+                   self.retries, self.backoff)
+        except Exception as exc:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise StorageError(f"could not store {name}: {exc}") from exc
+        return f"{self.base_url}/{token}/{quote(name)}?expires={expires}&sig={self.sign(token, name, expires)}"
+
+    def resolve(self, token: str, name: str, expires: int, sig: str) -> Optional[str]:
+        """Return the file behind a link, or None if it is forged, expired or gone."""
+        if not _TOKEN_RE.match(token) or name != os.path.basename(name) or name in ("", ".", ".."):
+            return None
+        if not hmac.compare_digest(self.sign(token, name, expires), sig or ""):
+            return None
+        if expires < self._clock():
+            return None
+        path = os.path.join(self.root, token, name)
+        return path if os.path.isfile(path) else None
+
+    def purge(self, now: Optional[float] = None) -> int:
+        """Delete stored files whose links have expired; returns how many."""
+        now = self._clock() if now is None else now
+        removed = 0
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return 0
+        for token in names:
+            if not _TOKEN_RE.match(token) or int(token.split("-", 1)[0]) >= now:
+                continue
+            shutil.rmtree(os.path.join(self.root, token), ignore_errors=True)
+            removed += 1
+        return removed
+
+
+class S3Backend(StorageBackend):
+    """An S3-compatible bucket; large files go up as parallel multipart uploads.
+
+    `client` is a boto3 S3 client (or anything with the same methods); by
+    default one is created for `endpoint_url` from the usual AWS_* settings.
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket: str, client: Any = None, endpoint_url: Optional[str] = None,
+                 prefix: str = "", part_size: int = DEFAULT_PART_SIZE,
+                 concurrency: int = DEFAULT_S3_CONCURRENCY, ttl: float = DEFAULT_LINK_TTL, **kwargs: Any):
+        super().__init__(**kwargs)
+        if client is None:
+            try:
+                import boto3
+            except ImportError as exc:
+                raise StorageError("the s3 storage backend needs `boto3`") from exc
+            client = boto3.client("s3", endpoint_url=endpoint_url or None)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.concurrency = max(1, concurrency)
+        self.ttl = min(ttl, MAX_PRESIGN_TTL)
+
+    def _put_object(self, path: str, key: str) -> None:
+        with open(path, "rb") as fh:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=fh)
+
+    def _upload_part(self, path: str, key: str, upload_id: str, number: int, offset: int,
+                     length: int) -> Dict[str, Any]:
+        with open(path, "rb") as fh:
+            fh.seek(offset)
+            data = fh.read(length)
+        resp = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                       PartNumber=number, Body=data)
+        return {"ETag": resp["ETag"], "PartNumber": number}
+
+    def _multipart(self, path: str, key: str, size: int) -> None:
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)["UploadId"]
+        ranges: List[Tuple[int, int, int]] = []
+        for number, offset in enumerate(range(0, size, self.part_size), start=1):
+            ranges.append((number, offset, min(self.part_size, size - offset)))
+
+        def send(part: Tuple[int, int, int]) -> Dict[str, Any]:
+            number, offset, length = part
+            return _retry(lambda: self._upload_part(path, key, upload_id, number, offset, length),
+                          f"S3 part {number}/{len(ranges)}", self.retries, self.backoff)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="s3-part") as pool:
+                parts = list(pool.map(send, ranges))
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                  MultipartUpload={"Parts": parts})
+        except BaseException:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            except Exception:
+                logger.warning("Could not abort multipart upload of %s", key, exc_info=True)
+            raise
+
+    def upload(self, path: str, name: Optional[str] = None) -> str:
+        name = os.path.basename(name or path)
+        key = f"{self.prefix}{uuid.uuid4().hex}/{name}"
+        size = os.path.getsize(path)
+        try:
+            if size <= self.part_size:
+                _retry(lambda: self._put_object(path, key), "S3 upload", self.retries, self.backoff)
+            else:
+                self._multipart(path, key, size)
+        except StorageError:
+            raise
+        except Exception as exc:
+            raise StorageError(f"S3 upload of {name} failed: {exc}") from exc
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=int(self.ttl))
+
+
+def _config() -> Tuple[str, ...]:
+    names = ("BOT_STORAGE", "BOT_STORAGE_RETRIES", "BOT_STORAGE_BACKOFF", "BOT_STORAGE_LINK_TTL",
+             "TRANSFER_SH_URL", "TRANSFER_SH_TIMEOUT", "TRANSFER_SH_MAX_DAYS",
+             "BOT_STORAGE_DIR", "BOT_STORAGE_PUBLIC_URL", "BOT_STORAGE_SECRET",
+             "BOT_S3_BUCKET", "BOT_S3_ENDPOINT", "BOT_S3_PREFIX", "BOT_S3_PART_MB", "BOT_S3_CONCURRENCY")
+    return tuple(os.getenv(name, "") for name in names)
+
+
+def _build() -> Optional[StorageBackend]:
+    kind = os.getenv("BOT_STORAGE", "transfer_sh").lower()
+    common = {
+        "retries": int(os.getenv("BOT_STORAGE_RETRIES", str(DEFAULT_RETRIES))),
+        "backoff": float(os.getenv("BOT_STORAGE_BACKOFF", str(DEFAULT_BACKOFF))),
+    }
+    ttl = float(os.getenv("BOT_STORAGE_LINK_TTL", str(DEFAULT_LINK_TTL)))
+    if kind in ("", "none", "off"):
+        return None
+    if kind == "transfer_sh":
+        max_days = os.getenv("TRANSFER_SH_MAX_DAYS")
+        return TransferShBackend(
+            url=os.getenv("TRANSFER_SH_URL", DEFAULT_TRANSFER_SH_URL),
+            timeout=float(os.getenv("TRANSFER_SH_TIMEOUT", str(DEFAULT_TRANSFER_SH_TIMEOUT))),
+            max_days=int(max_days) if max_days else None,
+            **common,
+        )
+    if kind == "local":
+        return LocalBackend(
+            root=os.getenv("BOT_STORAGE_DIR", "/var/lib/bot/files"),
+            base_url=os.getenv("BOT_STORAGE_PUBLIC_URL", "http://localhost:8000/files"),
+            secret=os.getenv("BOT_STORAGE_SECRET", ""),
+            ttl=ttl,
+            **common,
+        )
+    if kind == "s3":
+        return S3Backend(
+            bucket=os.getenv("BOT_S3_BUCKET", ""),
+            endpoint_url=os.getenv("BOT_S3_ENDPOINT"),
+            prefix=os.getenv("BOT_S3_PREFIX", ""),
+            part_size=int(os.getenv("BOT_S3_PART_MB", str(DEFAULT_PART_SIZE // 2**20))) * 2**20,
+            concurrency=int(os.getenv("BOT_S3_CONCURRENCY", str(DEFAULT_S3_CONCURRENCY))),
+            ttl=ttl,
+            **common,
+        )
+    raise ValueError(f"unknown BOT_STORAGE backend: {kind!r}")
+
+
+_default_storage: Optional[StorageBackend] = None
+_default_config: Optional[Tuple[str, ...]] = None
+_default_lock = threading.Lock()
+
+
+def get_default_storage() -> Optional[StorageBackend]:
+    """Return the backend configured via `BOT_STORAGE`, or None when disabled."""
+    global _default_storage, _default_config
+    config = _config()
+    with _default_lock:
+        if _default_config != config:
+            _default_storage = _build()
+            _default_config = config
+        return _default_storage
+
+
+__all__ = [
+    "LocalBackend", "S3Backend", "StorageBackend", "StorageError", "TransferShBackend",
+    "get_default_storage",
+]
@@ -2,18 +2,90 @@
 
 This adapter is deliberately small and depends only on the project's
 `http_client` so it's easy to test and swap implementations.
+
+It also talks to a self-hosted `telegram-bot-api` server started with
+`--local` (`TELEGRAM_API_URL` plus `TELEGRAM_LOCAL_MODE=1`): uploads may then
+be up to 2000 MB, and when the server can read the bot's download directory
+(`TELEGRAM_LOCAL_FILES`) files are sent as `file://` paths, so no bytes are
+uploaded at all. Note that a bot must call `logOut` on the cloud API once
+before it can be served by a local server.
 """
 
+import json
 import os
+import signal
+import threading
 import time
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
-from . import get, post
+from .http_client import DEFAULT_TIMEOUT, get, post, request
+from .multipart import MultipartEncoder, ProgressCallback, UploadTimeout
+from .dispatcher import Dispatcher
+from .job_store import JobStore, get_default_job_store, tracked_handler
 from .logger import get_logger
+from .metrics import TELEGRAM_UPLOAD_BYTES, observe_telegram
+from .rate_limit import RateLimiter, get_default_limiter
 
 
 logger = get_logger(__name__)
 
+UPLOAD_TIMEOUT = 120.0
+# total time budget for one upload, on top of the per-socket UPLOAD_TIMEOUT
+UPLOAD_DEADLINE = float(os.getenv("TELEGRAM_UPLOAD_DEADLINE", "900"))
+# finished jobs are kept this long (seconds) before run_polling prunes them
+JOB_RETENTION = float(os.getenv("BOT_JOB_RETENTION", str(7 * 24 * 3600)))
+
+DEFAULT_API_URL = "https://api.telegram.org"
+CLOUD_MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+# what a `telegram-bot-api --local` server accepts
+LOCAL_MAX_UPLOAD_BYTES = 2000 * 1024 * 1024
+
+
+class LocalFiles:
+    """Turns paths on the bot's disk into `file://` URIs a local Bot API server can open.
+
+    `bot_root` is where the shared volume is mounted for the bot and
+    `server_root` where the server sees it; with both empty, paths are the
+    same on both sides. Files outside `bot_root` have no URI and are uploaded.
+    """
+
+    def __init__(self, bot_root: str = "", server_root: str = ""):
+        self.bot_root = bot_root.rstrip("/")
+        self.server_root = server_root.rstrip("/")
+
+    @classmethod
+    def from_env(cls, value: Optional[str] = None) -> Optional["LocalFiles"]:
+        """Parse `TELEGRAM_LOCAL_FILES`: `1` (same paths), `/bot/dir=/server/dir`, or off."""
+        value = os.getenv("TELEGRAM_LOCAL_FILES", "") if value is None else value
+        if value in ("", "0"):
+            return None
+        if value == "1":
+            return cls()
+        bot_root, _, server_root = value.partition("=")
+        return cls(bot_root, server_root or bot_root)
+
+    def uri(self, path: str) -> Optional[str]:
+        path = os.path.abspath(path)
+        if self.bot_root:
+            if not path.startswith(self.bot_root + "/"):
+                return None
+            path = self.server_root + path[len(self.bot_root):]
+        return "file://" + path
+
+
+def api_settings(token: str, base_url: Optional[str], local_mode: Optional[bool],
+                 local_files: Optional[LocalFiles]) -> Tuple[str, bool, int, Optional[LocalFiles]]:
+    """Resolve `(base_url, local_mode, max_upload_bytes, local_files)` from arguments and env."""
+    if base_url is None:
+        base_url = f"{os.getenv('TELEGRAM_API_URL', DEFAULT_API_URL).rstrip('/')}/bot{token}"
+    if local_mode is None:
+        local_mode = os.getenv("TELEGRAM_LOCAL_MODE", "0") == "1"
+    if not local_mode:
+        return base_url, False, CLOUD_MAX_UPLOAD_BYTES, None
+    if local_files is None:
+        local_files = LocalFiles.from_env()
+    return base_url, True, LOCAL_MAX_UPLOAD_BYTES, local_files
+
 
 class TelegramAdapter:
     """Simple polling adapter for Telegram Bot API.
@@ -24,77 +96,228 @@ class TelegramAdapter:
       adapter.send_message(chat_id, "hi")
     """
 
-    def __init__(self, token: Optional[str] = None, base_url: Optional[str] = None):
+    def __init__(self, token: Optional[str] = None, base_url: Optional[str] = None,
+                 rate_limiter: Optional[RateLimiter] = None, local_mode: Optional[bool] = None,
+                 local_files: Optional[LocalFiles] = None):
         self.token = token or os.getenv("TELEGRAM_TOKEN")
         if not self.token:
             raise ValueError("Telegram token must be provided via constructor or TELEGRAM_TOKEN env")
-        self.base_url = base_url or f"https://api.telegram.org/bot{self.token}"
+        self.base_url, self.local_mode, self.max_upload_bytes, self.local_files = api_settings(
+            self.token, base_url, local_mode, local_files)
+        # outbound calls are smoothed to stay under Telegram's flood limits
+        self.rate_limiter = rate_limiter or get_default_limiter()
 
     def _url(self, method: str) -> str:
         return f"{self.base_url}/{method}"
 
+    def _throttle(self, chat_id: int) -> None:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(chat_id)
+
     def get_updates(self, offset: Optional[int] = None, timeout: int = 10) -> List[Dict[str, Any]]:
         params = {"timeout": timeout}
         if offset is not None:
             params["offset"] = offset
         url = self._url("getUpdates")
-        result = get(url, params=params)
+        started = time.perf_counter()
+        # the HTTP timeout must outlast the long-poll timeout
+        result = get(url, params=params, timeout=timeout + DEFAULT_TIMEOUT)
+        observe_telegram("getUpdates", started, result)
         if not result.get("ok"):
             logger.warning("getUpdates failed: %s", result.get("error"))
             return []
         return result.get("body", {}).get("result", [])
 
     def send_message(self, chat_id: int, text: str) -> Dict[str, Any]:
+        self._throttle(chat_id)
         url = self._url("sendMessage")
         payload = {"chat_id": chat_id, "text": text}
-        return post(url, payload)
+        started = time.perf_counter()
+        result = post(url, payload)
+        observe_telegram("sendMessage", started, result)
+        return result
+
+    def edit_message_text(self, chat_id: int, message_id: int, text: str) -> Dict[str, Any]:
+        """Replace the text of a message the bot sent earlier (e.g. a status line)."""
+        self._throttle(chat_id)
+        url = self._url("editMessageText")
+        payload = {"chat_id": chat_id, "message_id": message_id, "text": text}
+        started = time.perf_counter()
+        result = post(url, payload)
+        observe_telegram("editMessageText", started, result)
+        return result
+
+    def delete_message(self, chat_id: int, message_id: int) -> Dict[str, Any]:
+        self._throttle(chat_id)
+        url = self._url("deleteMessage")
+        payload = {"chat_id": chat_id, "message_id": message_id}
+        started = time.perf_counter()
+        result = post(url, payload)
+        observe_telegram("deleteMessage", started, result)
+        return result
 
-    def send_document(self, chat_id: int, file_path: str, filename: Optional[str] = None) -> Dict[str, Any]:
+    def send_document_by_id(self, chat_id: int, file_id: str) -> Dict[str, Any]:
+        """Resend a document Telegram already stores, identified by `file_id`."""
+        self._throttle(chat_id)
+        url = self._url("sendDocument")
+        payload = {"chat_id": chat_id, "document": file_id}
+        started = time.perf_counter()
+        result = post(url, payload)
+        observe_telegram("sendDocumentById", started, result)
+        return result
+
+    def send_document(self, chat_id: int, file_path: str, filename: Optional[str] = None,
+                      progress: Optional[ProgressCallback] = None,
+                      timeout: Optional[float] = None) -> Dict[str, Any]:
         """Send a file to the given chat using sendDocument (multipart upload).
 
+        The file is streamed in chunks, so memory stays flat regardless of its
+        size. `progress(sent, total)` is called as bytes go out and `timeout`
+        (default `TELEGRAM_UPLOAD_DEADLINE`) bounds the whole upload.
         Returns a normalized response dict similar to `post`/`get`.
+
+        With a local Bot API server that shares the file's volume, only its
+        `file://` path is sent (Telegram then names it after the file).
         """
-        # Use requests directly to send multipart/form-data
-        try:
-            import requests
-        except Exception:
-            return {"ok": False, "status": None, "headers": {}, "body": None, "error": "requests not available"}
+        uri = self.local_files.uri(file_path) if self.local_files else None
+        if uri is not None:
+            return self._send_local(chat_id, "sendDocument", {"document": uri},
+                                    os.path.getsize(file_path), progress, timeout)
+        encoder = MultipartEncoder(
+            {"chat_id": str(chat_id)}, "document", filename or os.path.basename(file_path), file_path,
+            progress=progress, timeout=timeout or UPLOAD_DEADLINE,
+        )
+        self._throttle(chat_id)
+        return self._upload_document(encoder)
 
-        url = self._url("sendDocument")
-        files = {"document": (filename or os.path.basename(file_path), open(file_path, "rb"))}
-        data = {"chat_id": str(chat_id)}
-        try:
-            resp = requests.post(url, data=data, files=files)
-            resp.raise_for_status()
-        except Exception as exc:
-            logger.exception("Failed to upload document")
-            return {"ok": False, "status": None, "headers": {}, "body": None, "error": str(exc)}
+    def send_document_stream(self, chat_id: int, source: Iterable[bytes], size: Optional[int], filename: str,
+                             progress: Optional[ProgressCallback] = None,
+                             timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Send a document whose bytes come from an iterable (e.g. a streaming zip).
 
-        try:
-            body = resp.json()
-        except Exception:
-            body = resp.text
+        `size` must be the exact number of bytes `source` yields, or None to
+        upload with chunked transfer encoding.
+        """
+        encoder = MultipartEncoder(
+            {"chat_id": str(chat_id)}, "document", filename, source, size=size,
+            progress=progress, timeout=timeout or UPLOAD_DEADLINE,
+        )
+        self._throttle(chat_id)
+        return self._upload_document(encoder)
+
+    def send_media_group(self, chat_id: int, files: Sequence[Tuple[str, str]],
+                         timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Send 2-10 files as one album of documents (`sendMediaGroup`).
+
+        `files` are `(path, filename)` pairs; all of them go out in a single
+        streamed multipart request.
+        """
+        uris = [self.local_files.uri(path) for path, _ in files] if self.local_files else []
+        if uris and None not in uris:
+            media = [{"type": "document", "media": uri} for uri in uris]
+            size = sum(os.path.getsize(path) for path, _ in files)
+            return self._send_local(chat_id, "sendMediaGroup", {"media": json.dumps(media)}, size, None, timeout)
+        media = [{"type": "document", "media": f"attach://file{i}"} for i in range(len(files))]
+        (first_path, first_name), rest = files[0], files[1:]
+        encoder = MultipartEncoder(
+            {"chat_id": str(chat_id), "media": json.dumps(media)}, "file0", first_name, first_path,
+            timeout=timeout or UPLOAD_DEADLINE,
+            extra_files=[(f"file{i}", name, path) for i, (path, name) in enumerate(rest, 1)],
+        )
+        self._throttle(chat_id)
+        return self._upload_document(encoder, "sendMediaGroup")
+
+    def _send_local(self, chat_id: int, method: str, payload: Dict[str, Any], size: int,
+                    progress: Optional[ProgressCallback], timeout: Optional[float]) -> Dict[str, Any]:
+        # the server reads the file itself; the request only carries its path
+        self._throttle(chat_id)
+        url = self._url(method)
+        started = time.perf_counter()
+        result = post(url, dict(payload, chat_id=chat_id), timeout=timeout or UPLOAD_DEADLINE)
+        observe_telegram(method, started, result)
+        if not result.get("ok"):
+            logger.warning("Failed to send local file: %s", result.get("error") or result.get("status"))
+        elif progress is not None:
+            progress(size, size)
+        return result
 
-        return {"ok": resp.ok, "status": resp.status_code, "headers": dict(resp.headers), "body": body}
+    def _upload_document(self, encoder: MultipartEncoder, method: str = "sendDocument") -> Dict[str, Any]:
+        url = self._url(method)
+        started = time.perf_counter()
+        try:
+            result = request("POST", url, data=encoder, headers=encoder.headers(), timeout=UPLOAD_TIMEOUT)
+        except UploadTimeout as exc:
+            result = {"ok": False, "status": None, "headers": {}, "body": None, "error": str(exc)}
+        observe_telegram(method, started, result)
+        if not result.get("ok"):
+            logger.warning("Failed to upload document: %s", result.get("error") or result.get("status"))
+        else:
+            TELEGRAM_UPLOAD_BYTES.inc(encoder.bytes_sent)
+        return result
 
-    def run_polling(self, handler, poll_interval: float = 1.0):
+    def run_polling(self, handler, poll_interval: float = 1.0,
+                    workers: Optional[int] = None, max_pending: Optional[int] = None,
+                    job_store: Optional[JobStore] = None):
         """Continuously poll for updates and dispatch to `handler(update, self)`.
 
         Handler is a callable that receives (update: dict, adapter: TelegramAdapter).
+        Updates are handled by a `Dispatcher` worker pool so a slow download in
+        one chat does not stall the others. SIGTERM (and Ctrl+C) stop polling
+        and drain the updates already accepted before returning.
+
+        With a job store (default: `BOT_JOB_DB`), updates are recorded before
+        the offset moves past them, and jobs left unfinished by a previous run
+        are resubmitted first.
         """
+        job_store = job_store or get_default_job_store()
+        if job_store is not None:
+            handler = tracked_handler(job_store, handler)
+        dispatcher = Dispatcher(handler, self, workers=workers, max_pending=max_pending).start()
+        stop = threading.Event()
+        previous = _install_sigterm(stop)
         offset = None
         try:
-            while True:
+            if job_store is not None:
+                job_store.prune(JOB_RETENTION)
+                offset = job_store.offset()
+                resumed = job_store.unfinished()
+                if resumed:
+                    logger.info("Resuming %d unfinished jobs", len(resumed))
+                for upd in resumed:
+                    dispatcher.submit(upd)
+            while not stop.is_set():
                 updates = self.get_updates(offset=offset)
+                if job_store is not None:
+                    # durably recorded before the next getUpdates confirms them
+                    updates = job_store.accept(updates)
+                    offset = job_store.offset()
                 for upd in updates:
-                    offset = max(offset or 0, upd.get("update_id", 0) + 1)
-                    try:
-                        handler(upd, self)
-                    except Exception:
-                        logger.exception("Error in update handler")
-                time.sleep(poll_interval)
+                    if job_store is None:
+                        offset = max(offset or 0, upd.get("update_id", 0) + 1)
+                    dispatcher.submit(upd)
+                stop.wait(poll_interval)
+            logger.info("Polling stopped by SIGTERM")
         except KeyboardInterrupt:
             logger.info("Polling stopped by user")
+        finally:
+            _restore_sigterm(previous)
+            dispatcher.shutdown(wait=True)
+
+
+def _install_sigterm(stop: threading.Event):
+    """Make SIGTERM set `stop`; returns the previous handler (or None)."""
+    if threading.current_thread() is not threading.main_thread():
+        return None
+
+    def _on_sigterm(signum, frame):
+        stop.set()
+
+    return signal.signal(signal.SIGTERM, _on_sigterm)
+
+
+def _restore_sigterm(previous) -> None:
+    if previous is not None:
+        signal.signal(signal.SIGTERM, previous)
 
 
-__all__ = ["TelegramAdapter"]
+__all__ = ["LocalFiles", "TelegramAdapter", "api_settings"]
@@ -0,0 +1,89 @@
+"""Load heavy dependencies ahead of the first request.
+
+`botlib` imports `requests`, `httpx` and yt-dlp lazily, which keeps cold
+starts and `/health` cheap but moves that cost onto whichever update arrives
+first. A long-lived worker can pay it up front instead: `bot_app` calls
+`prewarm_from_env()` on start-up, and other hosts (a gunicorn `post_fork`
+hook, a custom launcher) can call `prewarm()` directly.
+
+`BOT_PREWARM` selects what is loaded: `0` (default) nothing, `1` everything
+in `DEFAULT_COMPONENTS`, or a comma-separated list of component names.
+"""
+
+import importlib
+import os
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def _warm_services() -> None:
+    importlib.import_module(".services", __package__)
+
+
+def _warm_http() -> None:
+    from .http_client import get_session
+
+    # imports requests and builds the pooled session
+    get_session()
+
+
+def _warm_async() -> None:
+    importlib.import_module(".async_telegram_adapter", __package__)
+
+
+def _warm_yt_dlp() -> None:
+    from . import downloader
+
+    downloader._youtube_dl()
+    # the extractor table is what `video_key` walks for every URL
+    downloader._extractor_classes()
+
+
+COMPONENTS: Dict[str, Callable[[], None]] = {
+    "services": _warm_services,
+    "http": _warm_http,
+    "async": _warm_async,
+    "yt_dlp": _warm_yt_dlp,
+}
+DEFAULT_COMPONENTS = ("services", "http", "yt_dlp")
+
+
+def prewarm(components: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """Load `components` (default `DEFAULT_COMPONENTS`); returns seconds spent on each.
+
+    Failures are logged and skipped: a missing optional dependency should not
+    keep a worker from starting.
+    """
+    spent: Dict[str, float] = {}
+    for name in components or DEFAULT_COMPONENTS:
+        warm = COMPONENTS.get(name)
+        if warm is None:
+            logger.warning("Unknown prewarm component %r", name)
+            continue
+        started = time.perf_counter()
+        try:
+            warm()
+        except Exception:
+            logger.exception("Prewarming %s failed", name)
+        spent[name] = time.perf_counter() - started
+    if spent:
+        logger.info("Prewarmed %s", ", ".join(f"{name} in {secs:.2f}s" for name, secs in spent.items()))
+    return spent
+
+
+def prewarm_from_env() -> Dict[str, float]:
+    """Run `prewarm` as configured by `BOT_PREWARM`."""
+    value = os.getenv("BOT_PREWARM", "0").strip()
+    if value in ("", "0"):
+        return {}
+    if value == "1":
+        return prewarm()
+    return prewarm([name.strip() for name in value.split(",") if name.strip()])
+
+
+__all__ = ["COMPONENTS", "DEFAULT_COMPONENTS", "prewarm", "prewarm_from_env"]
@@ -0,0 +1,513 @@
+"""Shared work queue that lets several download workers split the load.
+
+Only one process may call `getUpdates`, and in webhook mode an update is
+handled by whichever uvicorn worker received it. In distributed mode
+(`BOT_QUEUE` set) the polling loop or webhook is only the *ingress*: it
+pushes each update to a shared queue. Any number of stateless workers
+(`MODE=worker`, on any host that can reach the queue) claim jobs, run the
+usual `handle_update` and acknowledge them.
+
+A claim is a *lease*: the worker must `heartbeat` before it expires, and a
+job whose lease expired (the worker died or hung) becomes claimable again.
+A job that was claimed `max_attempts` times without completing is moved
+aside as dead. Delivery is therefore at-least-once; updates are
+de-duplicated by `update_id` on push. Jobs of the same chat may run on
+different workers at once.
+
+Backends:
+- `SQLiteWorkQueue` (`sqlite:///path/queue.sqlite3`) for workers on one host;
+- `RedisWorkQueue` (`redis://host:6379/0`) for several hosts, through any
+  client with the redis-py API (the `redis` package is optional).
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+DEFAULT_LEASE = 60.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_CONCURRENCY = 4
+# a failed job is offered again after this many seconds
+RETRY_DELAY = 5.0
+# how long pushed update ids are remembered for de-duplication
+DEDUP_TTL = 7 * 24 * 3600
+
+READY = "ready"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+
+class Job:
+    """A claimed update; `owner` identifies the lease."""
+
+    __slots__ = ("id", "update", "attempts", "owner")
+
+    def __init__(self, job_id: Any, update: Dict[str, Any], attempts: int, owner: str):
+        self.id = job_id
+        self.update = update
+        self.attempts = attempts
+        self.owner = owner
+
+    def __repr__(self) -> str:
+        return f"Job({self.id!r}, update_id={self.update.get('update_id')!r}, attempts={self.attempts})"
+
+
+class WorkQueue:
+    """Interface of the queue backends."""
+
+    def __init__(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+
+    def push(self, update: Dict[str, Any]) -> bool:
+        """Queue `update`; False when an update with the same id was already pushed."""
+        raise NotImplementedError
+
+    def claim(self, owner: str, lease: float = DEFAULT_LEASE) -> Optional[Job]:
+        """Lease the oldest available job to `owner` for `lease` seconds."""
+        raise NotImplementedError
+
+    def heartbeat(self, job: Job, lease: float = DEFAULT_LEASE) -> bool:
+        """Extend the lease; False when the job was taken over in the meantime."""
+        raise NotImplementedError
+
+    def complete(self, job: Job) -> None:
+        raise NotImplementedError
+
+    def fail(self, job: Job, error: str, retry: bool = True) -> None:
+        """Give the job up; it is offered again unless `retry` is False or attempts ran out."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """Work queue in a SQLite (WAL) database shared by processes on one host."""
+
+    def __init__(self, path: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 clock: Callable[[], float] = time.time):
+        super().__init__(max_attempts)
+        self.path = path
+        self._clock = clock
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # other processes may hold the write lock briefly; wait instead of failing
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS work ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " update_id INTEGER UNIQUE,"
+            " payload TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " owner TEXT,"
+            " available_at REAL NOT NULL,"
+            " error TEXT,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS work_available ON work (state, available_at)")
+
+    def push(self, update: Dict[str, Any]) -> bool:
+        now = self._clock()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO work (update_id, payload, state, available_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (update.get("update_id"), json.dumps(update), READY, now, now),
+            )
+        return bool(cur.rowcount)
+
+    def claim(self, owner: str, lease: float = DEFAULT_LEASE) -> Optional[Job]:
+        now = self._clock()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    # ready jobs, and leased ones whose lease ran out
+                    row = self._conn.execute(
+                        "SELECT id, payload, attempts FROM work WHERE state IN (?, ?) AND available_at <= ?"
+                        " ORDER BY available_at, id LIMIT 1",
+                        (READY, LEASED, now),
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute("COMMIT")
+                        return None
+                    job_id, payload, attempts = row
+                    if attempts >= self.max_attempts:
+                        logger.warning("Job %s was claimed %d times; giving up", job_id, attempts)
+                        self._conn.execute(
+                            "UPDATE work SET state = ?, owner = NULL, error = COALESCE(error, ?), updated_at = ?"
+                            " WHERE id = ?", (DEAD, "lease expired too often", now, job_id))
+                        continue
+                    self._conn.execute(
+                        "UPDATE work SET state = ?, owner = ?, attempts = attempts + 1, available_at = ?,"
+                        " updated_at = ? WHERE id = ?",
+                        (LEASED, owner, now + lease, now, job_id),
+                    )
+                    self._conn.execute("COMMIT")
+                    return Job(job_id, json.loads(payload), attempts + 1, owner)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def heartbeat(self, job: Job, lease: float = DEFAULT_LEASE) -> bool:
+        now = self._clock()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE work SET available_at = ?, updated_at = ? WHERE id = ? AND owner = ? AND state = ?",
+                (now + lease, now, job.id, job.owner, LEASED),
+            )
+        return bool(cur.rowcount)
+
+    def complete(self, job: Job) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE work SET state = ?, owner = NULL, updated_at = ? WHERE id = ? AND owner = ?",
+                (DONE, self._clock(), job.id, job.owner),
+            )
+
+    def fail(self, job: Job, error: str, retry: bool = True) -> None:
+        now = self._clock()
+        state = READY if retry and job.attempts < self.max_attempts else DEAD
+        with self._lock:
+            self._conn.execute(
+                "UPDATE work SET state = ?, owner = NULL, error = ?, available_at = ?, updated_at = ?"
+                " WHERE id = ? AND owner = ?",
+                (state, error, now + RETRY_DELAY, now, job.id, job.owner),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM work GROUP BY state").fetchall()
+        return {state: n for state, n in rows}
+
+    def prune(self, older_than: float) -> int:
+        """Delete done and dead jobs last updated more than `older_than` seconds ago."""
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM work WHERE state IN (?, ?) AND updated_at < ?",
+                                     (DONE, DEAD, self._clock() - older_than))
+        return cur.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _text(value: Any) -> Optional[str]:
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return None if value is None else str(value)
+
+
+# Finding the next claimable job, leasing it and counting the attempt happen
+# in one script, so a worker dying mid-claim cannot lose the job.
+# KEYS: queue, active; ARGV: now, lease expiry, owner, job key prefix, leased state
+_CLAIM_SCRIPT = """
+local found = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)
+if #found == 0 then
+  return false
+end
+local id = found[1]
+local key = ARGV[4] .. id
+local payload = redis.call('HGET', key, 'payload')
+if not payload then
+  redis.call('ZREM', KEYS[1], id)
+  redis.call('SREM', KEYS[2], id)
+  return {id, 0, ''}
+end
+redis.call('ZADD', KEYS[1], ARGV[2], id)
+local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('HSET', key, 'state', ARGV[5], 'owner', ARGV[3], 'updated_at', ARGV[1])
+return {id, attempts, payload}
+"""
+
+# Extends a lease only if `owner` still holds the job and it is still queued.
+# KEYS: queue, job key; ARGV: owner, lease expiry, job id
+_HEARTBEAT_SCRIPT = """
+if redis.call('HGET', KEYS[2], 'owner') ~= ARGV[1] or not redis.call('ZSCORE', KEYS[1], ARGV[3]) then
+  return 0
+end
+redis.call('ZADD', KEYS[1], 'XX', ARGV[2], ARGV[3])
+return 1
+"""
+
+
+class RedisWorkQueue(WorkQueue):
+    """Work queue in Redis (or a compatible server) shared by workers on many hosts.
+
+    Keys (under `prefix`):
+      `<prefix>:queue`       sorted set of job ids scored by when they are
+                             claimable: enqueue time, or lease expiry
+      `<prefix>:job:<id>`    hash with the payload, attempts and owner
+      `<prefix>:active`      set of unfinished job ids (to recover orphans)
+      `<prefix>:seen:<uid>`  de-duplication marker per update id
+
+    A claim is one Lua script that takes the lowest-scored claimable id and
+    re-scores it with the lease expiry, so no two workers get the same job
+    and none is lost in between. Heartbeats are a script too: they only
+    succeed while the job is still queued under the same owner.
+    """
+
+    def __init__(self, client: Any, prefix: str = "bot", max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 clock: Callable[[], float] = time.time):
+        super().__init__(max_attempts)
+        self.client = client
+        self.prefix = prefix
+        self._clock = clock
+        self._queue = f"{prefix}:queue"
+        self._active = f"{prefix}:active"
+        self._claim_script = client.register_script(_CLAIM_SCRIPT)
+        self._heartbeat_script = client.register_script(_HEARTBEAT_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "RedisWorkQueue":
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError("a redis:// BOT_QUEUE needs the `redis` package") from exc
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def push(self, update: Dict[str, Any]) -> bool:
+        update_id = update.get("update_id")
+        if update_id is not None and not self.client.set(f"{self.prefix}:seen:{update_id}", 1,
+                                                         nx=True, ex=DEDUP_TTL):
+            return False
+        job_id = str(self.client.incr(f"{self.prefix}:next_id"))
+        now = self._clock()
+        self.client.hset(self._job_key(job_id), mapping={
+            "payload": json.dumps(update), "state": READY, "attempts": 0, "updated_at": now})
+        self.client.sadd(self._active, job_id)
+        self.client.zadd(self._queue, {job_id: now})
+        return True
+
+    def claim(self, owner: str, lease: float = DEFAULT_LEASE) -> Optional[Job]:
+        while True:
+            now = self._clock()
+            claimed = self._claim_script(keys=[self._queue, self._active],
+                                         args=[repr(now), repr(now + lease), owner, self._job_key(""), LEASED])
+            if not claimed:
+                return None
+            job_id, attempts, payload = _text(claimed[0]), int(claimed[1]), _text(claimed[2])
+            if not payload:
+                # the job's hash expired or was deleted; the script dropped it
+                continue
+            if attempts > self.max_attempts:
+                logger.warning("Job %s was claimed %d times; giving up", job_id, attempts - 1)
+                self._finish(job_id, DEAD, "lease expired too often")
+                continue
+            return Job(job_id, json.loads(payload), attempts, owner)
+
+    def _owns(self, job: Job) -> bool:
+        return _text(self.client.hget(self._job_key(job.id), "owner")) == job.owner
+
+    def heartbeat(self, job: Job, lease: float = DEFAULT_LEASE) -> bool:
+        renewed = self._heartbeat_script(keys=[self._queue, self._job_key(job.id)],
+                                         args=[job.owner, repr(self._clock() + lease), job.id])
+        return bool(int(renewed))
+
+    def _finish(self, job_id: str, state: str, error: Optional[str] = None) -> None:
+        self.client.zrem(self._queue, job_id)
+        self.client.srem(self._active, job_id)
+        fields = {"state": state, "owner": "", "updated_at": self._clock()}
+        if error:
+            fields["error"] = error
+        key = self._job_key(job_id)
+        self.client.hset(key, mapping=fields)
+        self.client.expire(key, DEDUP_TTL)
+
+    def complete(self, job: Job) -> None:
+        if self._owns(job):
+            self._finish(job.id, DONE)
+
+    def fail(self, job: Job, error: str, retry: bool = True) -> None:
+        if not self._owns(job):
+            return
+        if retry and job.attempts < self.max_attempts:
+            now = self._clock()
+            self.client.hset(self._job_key(job.id), mapping={
+                "state": READY, "owner": "", "error": error, "updated_at": now})
+            self.client.zadd(self._queue, {job.id: now + RETRY_DELAY})
+        else:
+            self._finish(job.id, DEAD, error)
+
+    def recover(self, grace: float = DEFAULT_LEASE) -> int:
+        """Requeue unfinished jobs missing from the queue (a producer died mid-push)."""
+        now = self._clock()
+        recovered = 0
+        for member in self.client.smembers(self._active):
+            job_id = _text(member)
+            if self.client.zscore(self._queue, job_id) is not None:
+                continue
+            updated = self.client.hget(self._job_key(job_id), "updated_at")
+            if updated is not None and now - float(_text(updated)) > grace:
+                self.client.zadd(self._queue, {job_id: now}, nx=True)
+                recovered += 1
+        if recovered:
+            logger.warning("Recovered %d orphaned jobs", recovered)
+        return recovered
+
+    def stats(self) -> Dict[str, int]:
+        now = self._clock()
+        queued = int(self.client.zcard(self._queue))
+        leased = int(self.client.zcount(self._queue, f"({now}", "+inf"))
+        return {READY: queued - leased, LEASED: leased}
+
+
+def enqueue_handler(queue: WorkQueue) -> Callable[[Dict[str, Any], Any], None]:
+    """An ingress `handler(update, adapter)` that only pushes the update to `queue`."""
+
+    def push(update: Dict[str, Any], adapter) -> None:
+        if not queue.push(update):
+            logger.debug("Update %s was already queued", update.get("update_id"))
+
+    return push
+
+
+class QueueWorker:
+    """Claim jobs from a queue and run `handler(update, adapter)` on them.
+
+    Up to `concurrency` jobs run at once; one heartbeat thread keeps all of
+    their leases alive. A handler exception fails the job (it is retried on
+    some worker); a lost lease is logged, since another worker now owns it.
+
+    Usage:
+      worker = QueueWorker(queue, handle_update, adapter, concurrency=4)
+      worker.run(stop_event)      # until stop_event is set; drains running jobs
+    """
+
+    def __init__(self, queue: WorkQueue, handler: Callable[[Dict[str, Any], Any], None], adapter: Any,
+                 concurrency: Optional[int] = None, lease: Optional[float] = None,
+                 poll_interval: float = 1.0, name: Optional[str] = None):
+        self.queue = queue
+        self.handler = handler
+        self.adapter = adapter
+        self.concurrency = concurrency or int(os.getenv("BOT_QUEUE_CONCURRENCY", str(DEFAULT_CONCURRENCY)))
+        self.lease = lease or float(os.getenv("BOT_QUEUE_LEASE", str(DEFAULT_LEASE)))
+        self.poll_interval = poll_interval
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._running: Dict[Any, Job] = {}
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+
+    def _heartbeats(self, stop: threading.Event) -> None:
+        while not stop.wait(self.lease / 3):
+            with self._lock:
+                jobs = list(self._running.values())
+            for job in jobs:
+                try:
+                    if not self.queue.heartbeat(job, self.lease):
+                        logger.warning("Lost the lease on %r", job)
+                except Exception:
+                    logger.exception("Heartbeat for %r failed", job)
+
+    def _run(self, job: Job) -> None:
+        try:
+            self.handler(job.update, self.adapter)
+        except Exception as exc:
+            logger.exception("Job %r failed", job)
+            self.queue.fail(job, repr(exc))
+        else:
+            self.queue.complete(job)
+        finally:
+            with self._lock:
+                self._running.pop(job.id, None)
+            self._slots.release()
+
+    def run_once(self) -> Optional[Job]:
+        """Claim one job and run it in the calling thread (for tests and tools)."""
+        job = self.queue.claim(self.name, self.lease)
+        if job is not None:
+            self._slots.acquire()
+            with self._lock:
+                self._running[job.id] = job
+            self._run(job)
+        return job
+
+    def run(self, stop: threading.Event) -> None:
+        heartbeat_stop = threading.Event()
+        beat = threading.Thread(target=self._heartbeats, args=(heartbeat_stop,), name="bot-queue-heartbeat",
+                                daemon=True)
+        beat.start()
+        logger.info("Queue worker %s started (%d slots)", self.name, self.concurrency)
+        recover = getattr(self.queue, "recover", None)
+        last_recover = 0.0
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bot-queue") as pool:
+                while not stop.is_set():
+                    if not self._slots.acquire(timeout=self.poll_interval):
+                        continue
+                    if recover is not None and time.monotonic() - last_recover > self.lease:
+                        last_recover = time.monotonic()
+                        recover(self.lease)
+                    try:
+                        job = self.queue.claim(self.name, self.lease)
+                    except Exception:
+                        logger.exception("Claiming a job failed")
+                        job = None
+                    if job is None:
+                        self._slots.release()
+                        stop.wait(self.poll_interval)
+                        continue
+                    with self._lock:
+                        self._running[job.id] = job
+                    pool.submit(self._run, job)
+        finally:
+            heartbeat_stop.set()
+            logger.info("Queue worker %s stopped", self.name)
+
+
+_default_queue: Optional[WorkQueue] = None
+_default_url: Optional[str] = None
+_default_lock = threading.Lock()
+
+
+def get_default_queue() -> Optional[WorkQueue]:
+    """Return the queue configured via `BOT_QUEUE`, or None outside distributed mode.
+
+    `BOT_QUEUE` is `sqlite:///path/to/queue.sqlite3` or `redis://host:port/db`;
+    `BOT_QUEUE_MAX_ATTEMPTS` bounds how often a job is claimed.
+    """
+    global _default_queue, _default_url
+    url = os.getenv("BOT_QUEUE")
+    if not url:
+        return None
+    with _default_lock:
+        if _default_queue is None or _default_url != url:
+            max_attempts = int(os.getenv("BOT_QUEUE_MAX_ATTEMPTS", str(DEFAULT_MAX_ATTEMPTS)))
+            if url.startswith("sqlite:///"):
+                # sqlite:///relative/path or sqlite:////absolute/path
+                _default_queue = SQLiteWorkQueue(url[len("sqlite:///"):], max_attempts=max_attempts)
+            elif url.startswith(("redis://", "rediss://", "unix://")):
+                _default_queue = RedisWorkQueue.from_url(url, prefix=os.getenv("BOT_QUEUE_PREFIX", "bot"),
+                                                         max_attempts=max_attempts)
+            else:
+                raise ValueError(f"unsupported BOT_QUEUE: {url!r}")
+            _default_url = url
+        return _default_queue
+
+
+__all__ = [
+    "Job", "QueueWorker", "RedisWorkQueue", "SQLiteWorkQueue", "WorkQueue",
+    "enqueue_handler", "get_default_queue",
+]
@@ -0,0 +1,289 @@
+"""Durable per-URL download directories and the janitor that reclaims them.
+
+`handle_update` used to download into a fresh `tempfile.mkdtemp()` directory,
+so a restart mid-download threw the partial file away. A `Workspace` instead
+hands out a deterministic `bot_dl_<hash>` directory per URL: when the same
+URL is requested again after a crash, yt-dlp finds its `.part`/`.ytdl` files
+there and resumes from the last byte or fragment.
+
+Directories are removed once their video was delivered. Anything left behind
+(crashes, failed downloads) is reclaimed by `reclaim()`, which deletes
+directories not touched for `max_age` seconds and then the oldest ones until
+the total is under `max_bytes`.
+
+Several processes (uvicorn workers, queue workers) may share one root. Each
+directory in use holds an exclusive `flock` on its sibling `<dir>.lock`
+file, and neither `release()` nor `reclaim()` deletes a directory without
+holding that lock, so one process never removes another's download. When
+the directory for a URL is locked by another process, `acquire()` hands out
+a numbered variant (`bot_dl_<hash>-1`, ...) instead of waiting.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on Windows; locking is per process there
+    fcntl = None
+
+from .logger import get_logger
+
+
+logger = get_logger(__name__)
+
+PREFIX = "bot_dl_"
+DEFAULT_MAX_AGE = 24 * 3600
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+DEFAULT_SWEEP_INTERVAL = 600.0
+# yt-dlp's in-progress files; their presence means a download can resume
+PARTIAL_SUFFIXES = (".part", ".ytdl")
+LOCK_SUFFIX = ".lock"
+# stands in for a lock file descriptor where fcntl is unavailable
+_NO_FD = -1
+
+
+def is_partial(name: str) -> bool:
+    return name.endswith(PARTIAL_SUFFIXES) or ".part-Frag" in name
+
+
+def _dir_usage(path: str) -> Tuple[int, float]:
+    """Return `(bytes, newest mtime)` for everything under `path`."""
+    total = 0
+    newest = 0.0
+    for dirpath, _, filenames in os.walk(path):
+        try:
+            newest = max(newest, os.stat(dirpath).st_mtime)
+        except OSError:
+            continue
+        for name in filenames:
+            try:
+                st = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            total += st.st_size
+            newest = max(newest, st.st_mtime)
+    return total, newest
+
+
+def _try_lock(path: str) -> Optional[int]:
+    """Lock directory `path` against other processes without waiting.
+
+    Returns the lock's file descriptor, or None when another process holds it.
+    """
+    if fcntl is None:
+        return _NO_FD
+    lock_path = path + LOCK_SUFFIX
+    while True:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        try:
+            current = os.stat(lock_path).st_ino == os.fstat(fd).st_ino
+        except FileNotFoundError:
+            current = False
+        if current:
+            return fd
+        # the previous holder removed the file while we opened it; lock the new one
+        os.close(fd)
+
+
+def _unlock(path: str, fd: int, remove: bool) -> None:
+    if fd == _NO_FD:
+        return
+    if remove:
+        # unlink while still holding the lock; `_try_lock` notices and retries
+        try:
+            os.unlink(path + LOCK_SUFFIX)
+        except OSError:
+            pass
+    os.close(fd)
+
+
+class Workspace:
+    """Deterministic download directories under `root`.
+
+    Usage:
+      ws = Workspace("/var/tmp/bot")
+      path = ws.acquire(normalized_url)
+      ...                           # download into path
+      ws.release(path, done=True)   # delete it, or keep partials with done=False
+    """
+
+    def __init__(self, root: str, max_age: float = DEFAULT_MAX_AGE, max_bytes: int = DEFAULT_MAX_BYTES,
+                 sweep_interval: float = DEFAULT_SWEEP_INTERVAL):
+        self.root = root
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._active: Dict[str, int] = {}
+        # path in use -> its lock fd; directory for a key -> the path handed out for it
+        self._locks: Dict[str, int] = {}
+        self._aliases: Dict[str, str] = {}
+        self._last_sweep: Optional[float] = None
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.root, PREFIX + digest)
+
+    def acquire(self, key: str) -> str:
+        """Return (and create) the directory for `key`, marking it in use.
+
+        Callers in this process share the directory; another process using
+        it makes this one get a numbered variant of it.
+        """
+        self._maybe_reclaim()
+        base = self.path_for(key)
+        with self._lock:
+            path = self._aliases.get(base)
+            if path is None:
+                path, attempt = base, 0
+                while True:
+                    fd = _try_lock(path)
+                    if fd is not None:
+                        break
+                    attempt += 1
+                    path = f"{base}-{attempt}"
+                self._locks[path] = fd
+                self._aliases[base] = path
+            self._active[path] = self._active.get(path, 0) + 1
+        os.makedirs(path, exist_ok=True)
+        if any(is_partial(name) for name in os.listdir(path)):
+            logger.info("Resuming partial download in %s", path)
+        return path
+
+    def release(self, path: str, done: bool = True) -> None:
+        """Stop using `path`; delete it when `done`, or when it holds no partials."""
+        with self._lock:
+            refs = self._active.get(path, 0) - 1
+            if refs > 0:
+                self._active[path] = refs
+                return
+            self._active.pop(path, None)
+            fd = self._locks.pop(path, _NO_FD)
+            for base in [b for b, p in self._aliases.items() if p == path]:
+                del self._aliases[base]
+        try:
+            keep = not done and any(is_partial(name) for name in os.listdir(path))
+        except OSError:
+            keep = False
+        if not keep:
+            shutil.rmtree(path, ignore_errors=True)
+        _unlock(path, fd, remove=not keep)
+
+    def _candidates(self) -> List[Tuple[float, int, str]]:
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        with self._lock:
+            active = set(self._active)
+        found = []
+        for name in names:
+            path = os.path.join(self.root, name)
+            if not name.startswith(PREFIX) or path in active or not os.path.isdir(path):
+                continue
+            size, newest = _dir_usage(path)
+            found.append((newest, size, path))
+        return found
+
+    def reclaim(self, now: Optional[float] = None) -> int:
+        """Delete stale and excess directories; returns how many were removed.
+
+        Directories in use by this or another process are skipped.
+        """
+        now = time.time() if now is None else now
+        removed = 0
+        kept = []
+        for newest, size, path in sorted(self._candidates()):
+            if self.max_age and now - newest > self.max_age and self._remove_unused(path):
+                removed += 1
+            else:
+                kept.append((newest, size, path))
+        total = sum(size for _, size, _ in kept)
+        for newest, size, path in kept:
+            if total <= self.max_bytes:
+                break
+            if self._remove_unused(path):
+                total -= size
+                removed += 1
+        if removed:
+            logger.info("Workspace janitor removed %d director%s", removed, "y" if removed == 1 else "ies")
+        return removed
+
+    def _remove_unused(self, path: str) -> bool:
+        fd = _try_lock(path)
+        if fd is None:
+            return False
+        shutil.rmtree(path, ignore_errors=True)
+        _unlock(path, fd, remove=True)
+        return True
+
+    def _maybe_reclaim(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._last_sweep is not None and now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        try:
+            self.reclaim()
+        except Exception:
+            logger.exception("Workspace janitor failed")
+
+
+def ytdl_resume_options() -> Dict[str, object]:
+    """yt-dlp options for resumable, chunked and parallel-fragment downloads.
+
+    `YTDLP_CONCURRENT_FRAGMENTS` (default 4) HLS/DASH fragments are fetched
+    at once; `YTDLP_HTTP_CHUNK_SIZE` (bytes, default 10 MiB, 0 = off) splits
+    plain HTTP downloads into ranged requests so a dropped connection only
+    costs one chunk; `YTDLP_RETRIES` applies to requests and fragments.
+    """
+    retries = int(os.getenv("YTDLP_RETRIES", "10"))
+    opts: Dict[str, object] = {
+        "continuedl": True,
+        "nopart": False,
+        "concurrent_fragment_downloads": max(1, int(os.getenv("YTDLP_CONCURRENT_FRAGMENTS", "4"))),
+        "retries": retries,
+        "fragment_retries": retries,
+    }
+    chunk = int(os.getenv("YTDLP_HTTP_CHUNK_SIZE", str(10 * 1024 * 1024)))
+    if chunk > 0:
+        opts["http_chunk_size"] = chunk
+    return opts
+
+
+_default_workspace: Optional[Workspace] = None
+_default_lock = threading.Lock()
+
+
+def get_default_workspace() -> Workspace:
+    """Return the process-wide workspace.
+
+    `BOT_WORKSPACE_DIR` (default: the system temp dir) is where `bot_dl_*`
+    directories live; `BOT_WORKSPACE_MAX_AGE` (seconds) and
+    `BOT_WORKSPACE_MAX_BYTES` bound what the janitor leaves behind.
+    """
+    global _default_workspace
+    root = os.getenv("BOT_WORKSPACE_DIR") or tempfile.gettempdir()
+    with _default_lock:
+        if _default_workspace is None or _default_workspace.root != root:
+            _default_workspace = Workspace(
+                root,
+                max_age=float(os.getenv("BOT_WORKSPACE_MAX_AGE", str(DEFAULT_MAX_AGE))),
+                max_bytes=int(os.getenv("BOT_WORKSPACE_MAX_BYTES", str(DEFAULT_MAX_BYTES))),
+            )
+        return _default_workspace
+
+
+__all__ = ["Workspace", "get_default_workspace", "is_partial", "ytdl_resume_options"]
@@ -5,3 +5,24 @@ import sys
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
+
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _no_outbound_rate_limit(monkeypatch):
+    # tests send many messages to the same chat; don't let the limiter sleep
+    monkeypatch.setenv("TELEGRAM_RATE_LIMIT", "0")
+
+
+@pytest.fixture(autouse=True)
+def _no_probe_cache(monkeypatch):
+    # fake extractors differ per test; don't share probed metadata between them
+    monkeypatch.setenv("BOT_PROBE_TTL", "0")
+
+
+@pytest.fixture(autouse=True)
+def _private_workspace(monkeypatch, tmp_path):
+    # keep bot_dl_* directories (and the janitor) out of the system temp dir
+    monkeypatch.setenv("BOT_WORKSPACE_DIR", str(tmp_path / "workspace"))
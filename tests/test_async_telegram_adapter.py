@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from botlib import async_http_client
+from botlib.async_telegram_adapter import AsyncTelegramAdapter
+
+
+def _mock_transport(monkeypatch, handler):
+    monkeypatch.setattr(async_http_client, "_build_client",
+                        lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+def test_init_without_token(monkeypatch):
+    monkeypatch.delenv("TELEGRAM_TOKEN", raising=False)
+    with pytest.raises(ValueError):
+        AsyncTelegramAdapter(token=None)
+
+
+def test_send_message_returns_normalized_dict(monkeypatch):
+    def handler(request):
+        assert request.url.path == "/sendMessage"
+        assert json.loads(request.content) == {"chat_id": 1, "text": "hi"}
+        return httpx.Response(200, json={"ok": True, "result": {}})
+
+    _mock_transport(monkeypatch, handler)
+    adapter = AsyncTelegramAdapter(token="tok", base_url="http://api")
+    res = asyncio.run(adapter.send_message(1, "hi"))
+    assert res["ok"] is True
+    assert res["status"] == 200
+    assert res["body"] == {"ok": True, "result": {}}
+
+
+def test_get_updates_retries_429(monkeypatch):
+    monkeypatch.setattr(async_http_client.asyncio, "sleep", _no_sleep)
+    responses = [
+        httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 1}}),
+        httpx.Response(200, json={"ok": True, "result": [{"update_id": 3}]}),
+    ]
+    _mock_transport(monkeypatch, lambda request: responses.pop(0))
+    adapter = AsyncTelegramAdapter(token="tok", base_url="http://api")
+    assert asyncio.run(adapter.get_updates()) == [{"update_id": 3}]
+
+
+async def _no_sleep(delay):
+    return None
+
+
+def test_send_document_uploads_file(monkeypatch, tmp_path):
+    fn = tmp_path / "video.zip"
+    fn.write_bytes(b"zipdata")
+
+    def handler(request):
+        assert request.url.path == "/sendDocument"
+        assert b"zipdata" in request.content
+        assert b'filename="video.zip"' in request.content
+        return httpx.Response(200, json={"ok": True})
+
+    _mock_transport(monkeypatch, handler)
+    adapter = AsyncTelegramAdapter(token="tok", base_url="http://api")
+    assert asyncio.run(adapter.send_document(1, str(fn)))["ok"] is True
+
+
+def test_run_polling_runs_handlers_concurrently_in_chat_order(monkeypatch):
+    batches = [[{"update_id": i, "message": {"chat": {"id": i % 2}, "text": str(i)}} for i in range(6)]]
+    seen = []
+
+    async def fake_get_updates(self, offset=None, timeout=10):
+        if batches:
+            return batches.pop()
+        await asyncio.sleep(3600)
+
+    async def handler(update, adapter):
+        await asyncio.sleep(0.01 * (6 - update["update_id"]))
+        seen.append(update["update_id"])
+
+    monkeypatch.setattr(AsyncTelegramAdapter, "get_updates", fake_get_updates)
+    adapter = AsyncTelegramAdapter(token="tok", base_url="http://api")
+
+    async def main():
+        task = asyncio.ensure_future(adapter.run_polling(handler, poll_interval=0))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert sorted(seen) == list(range(6))
+    assert [u for u in seen if u % 2 == 0] == [0, 2, 4]
+    assert [u for u in seen if u % 2 == 1] == [1, 3, 5]
+
+
+def test_run_polling_stops_polling_while_all_slots_are_busy(monkeypatch):
+    polls = []
+    release = None
+
+    async def fake_get_updates(self, offset=None, timeout=10):
+        polls.append(offset)
+        return [{"update_id": len(polls) * 10 + i, "message": {"chat": {"id": i}, "text": "x"}} for i in range(2)]
+
+    async def handler(update, adapter):
+        await release.wait()
+
+    monkeypatch.setattr(AsyncTelegramAdapter, "get_updates", fake_get_updates)
+    adapter = AsyncTelegramAdapter(token="tok", base_url="http://api")
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        task = asyncio.ensure_future(adapter.run_polling(handler, poll_interval=0, concurrency=3))
+        await asyncio.sleep(0.1)
+        # two updates fill two slots, the third takes the last one and the fourth waits
+        assert polls == [None, 12]
+        release.set()
+        await asyncio.sleep(0.05)
+        assert len(polls) > 2
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+import pytest
+
+import bot_app
+
+
+class FakeRequest:
+    def __init__(self, body):
+        self._body = body
+
+    async def json(self):
+        return self._body
+
+
+@pytest.fixture(autouse=True)
+def _reset_dispatcher():
+    yield
+    bot_app.shutdown_dispatcher()
+
+
+def test_webhook_rejects_wrong_token(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_TOKEN", "tok")
+    resp = asyncio.run(bot_app.webhook("other", FakeRequest({})))
+    assert resp.status_code == 403
+
+
+def test_webhook_acknowledges_before_handling(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_TOKEN", "tok")
+    release = threading.Event()
+    handled = []
+
+    def slow_handler(update, adapter):
+        release.wait(5)
+        handled.append(update["update_id"])
+
+    monkeypatch.setattr(bot_app, "handle_update", slow_handler)
+    update = {"update_id": 1, "message": {"chat": {"id": 1}, "text": "http://x"}}
+    resp = asyncio.run(bot_app.webhook("tok", FakeRequest(update)))
+    assert resp.status_code == 200
+    assert handled == []
+
+    health = bot_app.health()
+    assert health["queue_depth"] + health["in_flight"] == 1
+
+    release.set()
+    bot_app.shutdown_dispatcher()
+    assert handled == [1]
+
+
+def test_webhook_returns_503_when_queue_full(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_TOKEN", "tok")
+    monkeypatch.setenv("BOT_WORKERS", "1")
+    monkeypatch.setenv("BOT_MAX_PENDING", "1")
+    release = threading.Event()
+    monkeypatch.setattr(bot_app, "handle_update", lambda u, a: release.wait(5))
+
+    statuses = []
+    for i in range(4):
+        update = {"update_id": i, "message": {"chat": {"id": 1}, "text": "x"}}
+        statuses.append(asyncio.run(bot_app.webhook("tok", FakeRequest(update))).status_code)
+    release.set()
+    assert statuses[0] == 200
+    assert 503 in statuses
+
+
+def test_metrics_endpoint_renders_prometheus_text():
+    from botlib import metrics
+
+    previous = metrics.ENABLED
+    metrics.set_enabled(True)
+    try:
+        metrics.TELEGRAM_UPLOAD_BYTES.inc(10)
+        resp = bot_app.metrics_endpoint()
+    finally:
+        metrics.set_enabled(previous)
+    assert resp.media_type.startswith("text/plain")
+    assert b"# TYPE bot_telegram_upload_bytes_total counter" in resp.body
+
+
+def test_webhook_pushes_to_work_queue_when_configured(monkeypatch, tmp_path):
+    from botlib import work_queue
+
+    monkeypatch.setenv("TELEGRAM_TOKEN", "tok")
+    monkeypatch.setenv("BOT_QUEUE", f"sqlite:///{tmp_path}/queue.sqlite3")
+    monkeypatch.setattr(work_queue, "_default_queue", None)
+    monkeypatch.setattr(bot_app, "handle_update", lambda u, a: pytest.fail("handled in the web process"))
+
+    update = {"update_id": 7, "message": {"chat": {"id": 1}, "text": "http://x"}}
+    for _ in range(2):
+        resp = asyncio.run(bot_app.webhook("tok", FakeRequest(update)))
+        assert resp.status_code == 200
+    assert bot_app.health()["work_queue"] == {"ready": 1}
+    job = work_queue.get_default_queue().claim("worker")
+    assert job.update == update
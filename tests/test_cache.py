@@ -0,0 +1,61 @@
+import os
+import time
+
+from botlib.cache import DownloadCache, get_default_cache, normalize_url
+
+
+def test_normalize_url_drops_noise():
+    a = normalize_url("HTTPS://www.Example.com:443/v/123/?utm_source=x&b=2&a=1#frag")
+    b = normalize_url("https://example.com/v/123?a=1&b=2&si=abc")
+    assert a == b == "https://example.com/v/123?a=1&b=2"
+
+
+def test_put_and_get_roundtrip(tmp_path):
+    src = tmp_path / "clip.mp4"
+    src.write_bytes(b"video")
+    cache = DownloadCache(str(tmp_path / "cache"))
+
+    assert cache.get("Youtube:abc") is None
+    stored = cache.put("Youtube:abc", str(src), aliases=("url:https://youtu.be/abc",))
+    assert stored and os.path.basename(stored) == "clip.mp4"
+    assert cache.get("Youtube:abc") == stored
+    assert cache.get("url:https://youtu.be/abc") == stored
+    # the source can go away (temp dir cleanup) without affecting the entry
+    src.unlink()
+    with open(cache.get("Youtube:abc"), "rb") as fh:
+        assert fh.read() == b"video"
+
+
+def test_ttl_expires_entries(tmp_path):
+    src = tmp_path / "clip.mp4"
+    src.write_bytes(b"video")
+    cache = DownloadCache(str(tmp_path / "cache"), ttl=0.01)
+    cache.put("k", str(src))
+    time.sleep(0.05)
+    assert cache.get("k") is None
+
+
+def test_lru_eviction_respects_size_budget(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"), max_bytes=25)
+    for name in ("a", "b", "c"):
+        src = tmp_path / f"{name}.mp4"
+        src.write_bytes(b"x" * 10)
+        cache.put(name, str(src))
+        # make access times strictly ordered
+        past = time.time() - {"a": 30, "b": 20, "c": 10}[name]
+        os.utime(os.path.join(os.path.dirname(cache.get(name)), "entry.json"), (past, past))
+        if name == "b":
+            # touch "a" so "b" becomes the least recently used entry
+            cache.get("a")
+
+    assert cache.size() <= 25
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_default_cache_disabled_without_env(monkeypatch, tmp_path):
+    monkeypatch.delenv("BOT_CACHE_DIR", raising=False)
+    assert get_default_cache() is None
+    monkeypatch.setenv("BOT_CACHE_DIR", str(tmp_path))
+    assert get_default_cache().root == str(tmp_path)
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from botlib.dispatcher import Dispatcher, QueueFull, chat_key
+
+
+def _update(update_id, chat_id):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": str(update_id)}}
+
+
+def test_chat_key_falls_back_to_update_id():
+    assert chat_key(_update(1, 42)) == 42
+    assert chat_key({"update_id": 5, "callback_query": {}}) == ("update", 5)
+
+
+def test_same_chat_is_processed_in_order():
+    seen = []
+
+    def handler(update, adapter):
+        time.sleep(0.01)
+        seen.append(update["update_id"])
+
+    d = Dispatcher(handler, adapter=None, workers=4).start()
+    for i in range(10):
+        d.submit(_update(i, 1))
+    assert d.join(timeout=5)
+    d.shutdown()
+    assert seen == list(range(10))
+
+
+def test_different_chats_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def handler(update, adapter):
+        # deadlocks (and times out) unless three chats run at the same time
+        barrier.wait()
+
+    d = Dispatcher(handler, adapter=None, workers=3).start()
+    for chat in range(3):
+        d.submit(_update(chat, chat))
+    assert d.join(timeout=5)
+    d.shutdown()
+    assert not barrier.broken
+
+
+def test_submit_applies_backpressure():
+    release = threading.Event()
+    d = Dispatcher(lambda u, a: release.wait(5), adapter=None, workers=1, max_pending=1).start()
+    d.submit(_update(1, 1))
+    # wait until the worker picked the first update up
+    for _ in range(100):
+        if d.stats()["in_flight"] == 1:
+            break
+        time.sleep(0.01)
+    d.submit(_update(2, 1))
+    with pytest.raises(QueueFull):
+        d.submit(_update(3, 1), block=False)
+    with pytest.raises(QueueFull):
+        d.submit(_update(3, 1), timeout=0.05)
+    release.set()
+    d.shutdown(wait=True)
+    assert d.stats()["queue_depth"] == 0
+
+
+def test_handler_errors_do_not_kill_workers():
+    seen = []
+
+    def handler(update, adapter):
+        if update["update_id"] == 1:
+            raise RuntimeError("boom")
+        seen.append(update["update_id"])
+
+    d = Dispatcher(handler, adapter=None, workers=1).start()
+    d.submit(_update(1, 1))
+    d.submit(_update(2, 1))
+    d.shutdown(wait=True)
+    assert seen == [2]
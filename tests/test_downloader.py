@@ -26,6 +26,9 @@ def test_download_success(monkeypatch, tmp_path):
         def extract_info(self, url, download=True):
             return {"id": "abc"}
 
+        def process_ie_result(self, info, download=True):
+            return info
+
         def prepare_filename(self, info):
             return str(tmp_path / "title.mp4")
 
@@ -54,14 +57,171 @@ def test_prepare_filename_missing_uses_first_file(monkeypatch, tmp_path):
         def extract_info(self, url, download=True):
             return {"id": "abc"}
 
+        writes = True
+
+        def process_ie_result(self, info, download=True):
+            # the download writes a file other than the one prepare_filename names
+            if self.writes:
+                (tmp_path / "yt_clip.webm").write_bytes(b"ok")
+            return info
+
         def prepare_filename(self, info):
             return str(tmp_path / "not_there.mp4")
 
     monkeypatch.setattr(downloader, "YoutubeDL", FakeYDL)
-    # create a real file in out_dir so fallback can pick it
-    real = tmp_path / "found.mp4"
-    real.write_bytes(b"ok")
+    # a leftover package from an earlier job in the reused directory
+    (tmp_path / "video.zip").write_bytes(b"stale")
 
     out = downloader.download_video("http://x", str(tmp_path))
     assert out is not None
-    assert out.endswith("found.mp4")
+    assert out.endswith("yt_clip.webm")
+
+    # a download that produced nothing must not hand back the leftover
+    (tmp_path / "yt_clip.webm").unlink()
+    FakeYDL.writes = False
+    assert downloader.download_video("http://x", str(tmp_path)) is None
+
+
+def test_cache_hit_skips_yt_dlp(monkeypatch, tmp_path):
+    monkeypatch.setenv("BOT_CACHE_DIR", str(tmp_path / "cache"))
+    calls = []
+
+    class FakeYDL:
+        def __init__(self, opts):
+            self.out_dir = os.path.dirname(opts["outtmpl"])
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            return False
+
+        def extract_info(self, url, download=True):
+            calls.append(url)
+            return {"id": "abc", "extractor_key": "Fake"}
+
+        def process_ie_result(self, info, download=True):
+            with open(os.path.join(self.out_dir, "clip.mp4"), "wb") as fh:
+                fh.write(b"data")
+            return info
+
+        def prepare_filename(self, info):
+            return os.path.join(self.out_dir, "clip.mp4")
+
+    monkeypatch.setattr(downloader, "YoutubeDL", FakeYDL)
+
+    first = downloader.download_video("https://example.com/v?utm_source=a", str(tmp_path / "one"))
+    second = downloader.download_video("https://example.com/v", str(tmp_path / "two"))
+
+    assert calls == ["https://example.com/v?utm_source=a"]
+    assert first == str(tmp_path / "one" / "clip.mp4")
+    assert second == str(tmp_path / "two" / "clip.mp4")
+    with open(second, "rb") as fh:
+        assert fh.read() == b"data"
+
+
+def test_video_key_uses_extractor_id():
+    a = downloader.video_key("https://youtu.be/dQw4w9WgXcQ")
+    b = downloader.video_key("https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=3")
+    assert a == b
+    assert downloader.video_key("https://example.com/a/") == "url:https://example.com/a"
+
+
+def test_video_key_is_memoized_per_normalized_url(monkeypatch):
+    monkeypatch.setattr(downloader, "_video_keys", downloader.OrderedDict())
+    url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ&utm_source=x"
+    assert downloader.known_video_key(url) == "url:https://youtube.com/watch?v=dQw4w9WgXcQ"
+    key = downloader.video_key(url)
+    monkeypatch.setattr(downloader, "_extractor_classes", lambda: pytest.fail("not memoized"))
+    assert downloader.video_key("https://youtube.com/watch?v=dQw4w9WgXcQ") == key
+    assert downloader.known_video_key(url) == key
+
+
+def test_download_uses_planned_format(monkeypatch, tmp_path):
+    formats = [
+        {"format_id": "big", "vcodec": "avc1", "acodec": "mp4a", "height": 1080, "filesize": 900},
+        {"format_id": "small", "vcodec": "avc1", "acodec": "mp4a", "height": 360, "filesize": 90},
+    ]
+    used = []
+
+    class FakeYDL:
+        def __init__(self, opts):
+            self.opts = opts
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            return False
+
+        def extract_info(self, url, download=True):
+            assert download is False
+            return {"id": "abc", "duration": 10, "formats": formats}
+
+        def process_ie_result(self, info, download=True):
+            used.append(self.opts["format"])
+            (tmp_path / "clip.mp4").write_bytes(b"ok")
+            return info
+
+        def prepare_filename(self, info):
+            return str(tmp_path / "clip.mp4")
+
+    monkeypatch.setattr(downloader, "YoutubeDL", FakeYDL)
+
+    assert downloader.download_video("http://x", str(tmp_path), max_bytes=500)
+    assert downloader.download_video("http://x", str(tmp_path))
+    assert used == ["small", downloader.DEFAULT_FORMAT]
+
+
+def _counting_ydl(tmp_path, extractions, fetches, fail_first_fetch=False):
+    class FakeYDL:
+        def __init__(self, opts):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            return False
+
+        def extract_info(self, url, download=True):
+            extractions.append(url)
+            return {"id": "abc", "extractor_key": "Fake", "n": len(extractions)}
+
+        def process_ie_result(self, info, download=True):
+            fetches.append(info["n"])
+            if fail_first_fetch and len(fetches) == 1:
+                raise RuntimeError("HTTP Error 403: Forbidden")
+            (tmp_path / "clip.mp4").write_bytes(b"ok")
+            return info
+
+        def prepare_filename(self, info):
+            return str(tmp_path / "clip.mp4")
+
+    return FakeYDL
+
+
+def test_probe_results_are_cached(monkeypatch, tmp_path):
+    monkeypatch.setenv("BOT_PROBE_TTL", "60")
+    extractions, fetches = [], []
+    monkeypatch.setattr(downloader, "YoutubeDL", _counting_ydl(tmp_path, extractions, fetches))
+
+    assert downloader.probe("https://example.com/cached")["id"] == "abc"
+    assert downloader.download_video("https://example.com/cached", str(tmp_path))
+    assert extractions == ["https://example.com/cached"]
+
+    downloader.invalidate_probe("https://example.com/cached")
+    downloader.probe("https://example.com/cached")
+    assert len(extractions) == 2
+
+
+def test_stale_cached_probe_is_refreshed_once(monkeypatch, tmp_path):
+    monkeypatch.setenv("BOT_PROBE_TTL", "60")
+    extractions, fetches = [], []
+    monkeypatch.setattr(downloader, "YoutubeDL", _counting_ydl(tmp_path, extractions, fetches, True))
+
+    downloader.probe("https://example.com/stale")
+    assert downloader.download_video("https://example.com/stale", str(tmp_path))
+    # the first fetch used cached metadata and failed; the retry re-extracted
+    assert fetches == [1, 2]
+    assert len(extractions) == 2
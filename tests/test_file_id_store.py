@@ -0,0 +1,24 @@
+from botlib.file_id_store import FileIdStore, get_default_store
+
+
+def test_put_get_delete(tmp_path):
+    store = FileIdStore(str(tmp_path / "ids.sqlite3"))
+    assert store.get("Youtube:abc") is None
+    store.put("Youtube:abc", "FILE1")
+    store.put("Youtube:abc", "FILE2")
+    assert store.get("Youtube:abc") == "FILE2"
+    store.delete("Youtube:abc")
+    assert store.get("Youtube:abc") is None
+
+
+def test_store_persists_across_instances(tmp_path):
+    path = str(tmp_path / "ids.sqlite3")
+    FileIdStore(path).put("k", "FILE")
+    assert FileIdStore(path).get("k") == "FILE"
+
+
+def test_default_store_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv("BOT_FILE_ID_DB", raising=False)
+    assert get_default_store() is None
+    monkeypatch.setenv("BOT_FILE_ID_DB", str(tmp_path / "ids.sqlite3"))
+    assert get_default_store() is not None
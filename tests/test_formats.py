@@ -0,0 +1,49 @@
+from botlib.formats import estimate_size, plan_format, single_stream_format
+
+
+FORMATS = [
+    {"format_id": "18", "vcodec": "avc1", "acodec": "mp4a", "height": 360, "filesize": 10_000},
+    {"format_id": "22", "vcodec": "avc1", "acodec": "mp4a", "height": 720, "filesize_approx": 40_000},
+    {"format_id": "137", "vcodec": "avc1", "acodec": "none", "height": 1080, "tbr": 4000},
+    {"format_id": "136", "vcodec": "avc1", "acodec": "none", "height": 720, "filesize": 20_000},
+    {"format_id": "140", "vcodec": "none", "acodec": "mp4a", "filesize": 5_000},
+]
+
+
+def test_estimate_size_prefers_exact_then_approx_then_bitrate():
+    assert estimate_size({"filesize": 10, "filesize_approx": 20}, 5) == 10
+    assert estimate_size({"filesize_approx": 20, "tbr": 8}, 5) == 20
+    # 8 kbit/s for 5 s = 5000 bytes, plus the safety margin
+    assert estimate_size({"tbr": 8}, 5) == 5500
+    assert estimate_size({"tbr": 8}, None) is None
+
+
+def test_plan_picks_best_quality_that_fits():
+    info = {"id": "x", "duration": 100, "formats": FORMATS}
+    # 1080p (~55 MB by bitrate) never fits; 720p single file wins the tie with the 720p pair
+    assert plan_format(info, 100_000, merge=True) == "22"
+    assert plan_format(info, 30_000, merge=True) == "136+140"
+    assert plan_format(info, 30_000, merge=False) == "18"
+    assert plan_format(info, 10**9, merge=True) == "137+140"
+
+
+def test_plan_falls_back_to_smallest_or_default():
+    info = {"id": "x", "duration": 100, "formats": FORMATS}
+    assert plan_format(info, 1, merge=True) == "18"
+    assert plan_format({"id": "x", "formats": [{"format_id": "a", "vcodec": "vp9", "acodec": "opus"}]}, 10) is None
+    assert plan_format({"id": "x"}, 10) is None
+
+
+def test_single_stream_format_needs_plain_http_and_exact_size():
+    formats = [
+        {"format_id": "18", "url": "https://cdn/18", "protocol": "https", "vcodec": "avc1", "acodec": "mp4a",
+         "height": 360, "filesize": 10_000},
+        {"format_id": "22", "url": "https://cdn/22", "protocol": "https", "vcodec": "avc1", "acodec": "mp4a",
+         "height": 720, "filesize_approx": 40_000},
+        {"format_id": "hls", "url": "https://cdn/m3u8", "protocol": "m3u8_native", "vcodec": "avc1",
+         "acodec": "mp4a", "height": 1080, "filesize": 30_000},
+        {"format_id": "136", "url": "https://cdn/136", "protocol": "https", "vcodec": "avc1", "acodec": "none",
+         "height": 720, "filesize": 20_000},
+    ]
+    assert single_stream_format({"formats": formats}, 50_000)["format_id"] == "18"
+    assert single_stream_format({"formats": formats}, 5_000) is None
@@ -1,5 +1,7 @@
 import types
 
+import pytest
+
 from botlib import http_client
 
 
@@ -12,20 +14,116 @@ def test_requests_not_available(monkeypatch):
     assert r2["ok"] is False
 
 
-def test_get_request_exception(monkeypatch):
-    class FakeRequests:
-        class exceptions:
-            RequestException = Exception
+class FakeResponse:
+    def __init__(self, status, body, headers=None):
+        self.status_code = status
+        self.ok = status < 400
+        self.headers = headers or {}
+        self._body = body
+        self.text = str(body)
+
+    def json(self):
+        return self._body
+
 
-        def get(self, url, params=None, headers=None, timeout=None):
-            raise Exception("boom")
+class FakeSession:
+    def __init__(self, responses=None, exc=None):
+        self.responses = list(responses or [])
+        self.exc = exc
+        self.calls = []
 
-    monkeypatch.setattr(http_client, "requests", FakeRequests())
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls.append((method, url, kwargs))
+        if self.exc is not None:
+            raise self.exc
+        return self.responses.pop(0)
+
+
+def test_get_request_exception(monkeypatch):
+    session = FakeSession(exc=http_client.requests.exceptions.ConnectionError("boom"))
+    monkeypatch.setattr(http_client, "_session", session)
     res = http_client.get("http://x")
     assert res["ok"] is False
     assert "error" in res
 
 
+def test_session_is_shared(monkeypatch):
+    monkeypatch.setattr(http_client, "_session", None)
+    first = http_client.get_session()
+    assert http_client.get_session() is first
+    http_client.close_session()
+
+
+def test_retries_429_honoring_retry_after(monkeypatch):
+    session = FakeSession([
+        FakeResponse(429, {"ok": False, "parameters": {"retry_after": 2}}),
+        FakeResponse(502, "bad gateway"),
+        FakeResponse(200, {"ok": True, "result": []}),
+    ])
+    monkeypatch.setattr(http_client, "_session", session)
+    sleeps = []
+    monkeypatch.setattr(http_client.time, "sleep", sleeps.append)
+
+    res = http_client.get("http://x")
+    assert res["ok"] is True
+    assert len(session.calls) == 3
+    assert sleeps == [2.0, http_client.DEFAULT_BACKOFF * 2]
+
+
+def test_post_retries_429_but_not_5xx(monkeypatch):
+    session = FakeSession([
+        FakeResponse(429, {"ok": False, "parameters": {"retry_after": 1}}),
+        FakeResponse(502, "bad gateway"),
+        FakeResponse(200, {"ok": True}),
+    ])
+    monkeypatch.setattr(http_client, "_session", session)
+    monkeypatch.setattr(http_client.time, "sleep", lambda s: None)
+
+    # the 502 may have come after Telegram sent the message; do not send it twice
+    res = http_client.post("http://x", {"k": "v"})
+    assert res["status"] == 502
+    assert len(session.calls) == 2
+
+
+def test_long_retry_after_is_returned_not_slept(monkeypatch):
+    session = FakeSession([FakeResponse(429, {"ok": False, "parameters": {"retry_after": 600}})])
+    monkeypatch.setattr(http_client, "_session", session)
+    monkeypatch.setattr(http_client.time, "sleep", lambda s: pytest.fail("slept"))
+
+    res = http_client.get("http://x")
+    assert res["status"] == 429
+    assert len(session.calls) == 1
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setenv("HTTP_MAX_RETRIES", "1")
+    session = FakeSession([FakeResponse(503, "down"), FakeResponse(503, "down")])
+    monkeypatch.setattr(http_client, "_session", session)
+    monkeypatch.setattr(http_client.time, "sleep", lambda s: None)
+
+    res = http_client.get("http://x")
+    assert res["ok"] is False
+    assert res["status"] == 503
+    assert len(session.calls) == 2
+
+
+def test_one_shot_body_is_not_retried(monkeypatch):
+    session = FakeSession([FakeResponse(429, {"ok": False}), FakeResponse(200, {"ok": True})])
+    monkeypatch.setattr(http_client, "_session", session)
+    body = types.SimpleNamespace(rewindable=False)
+    res = http_client.request("POST", "http://x", data=body)
+    assert res["status"] == 429
+    assert len(session.calls) == 1
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    session = FakeSession([FakeResponse(400, {"ok": False})])
+    monkeypatch.setattr(http_client, "_session", session)
+    res = http_client.get("http://x")
+    assert res["status"] == 400
+    assert len(session.calls) == 1
+
+
 def test_format_response_non_json(monkeypatch):
     # create a fake Response-like object where json() raises
     class FakeResp:
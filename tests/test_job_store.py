@@ -0,0 +1,60 @@
+import pytest
+
+from botlib import job_store
+from botlib.job_store import JobStore, mark_current, tracked_handler
+
+
+def _upd(update_id, text="hi"):
+    return {"update_id": update_id, "message": {"chat": {"id": 1}, "text": text}}
+
+
+def test_accept_is_idempotent_and_advances_offset(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    assert store.offset() is None
+    assert [u["update_id"] for u in store.accept([_upd(5), _upd(6)])] == [5, 6]
+    assert store.offset() == 7
+    # Telegram redelivering after a crash
+    assert [u["update_id"] for u in store.accept([_upd(6), _upd(7)])] == [7]
+    assert store.offset() == 8
+    assert store.counts() == {"queued": 3}
+
+
+def test_unfinished_survives_reopen_and_gives_up_eventually(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(path)
+    store.accept([_upd(1), _upd(2), _upd(3)])
+    store.mark(1, job_store.DONE)
+    store.mark(2, job_store.DOWNLOADING)
+    for _ in range(3):
+        store.start(3)
+    store.close()
+
+    reopened = JobStore(path)
+    assert [u["update_id"] for u in reopened.unfinished()] == [2]
+    assert reopened.state(3) == job_store.FAILED
+    assert reopened.offset() == 4
+
+
+def test_tracked_handler_records_stages(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    store.accept([_upd(1), _upd(2), _upd(3)])
+    seen = []
+
+    def handler(update, adapter):
+        mark_current(job_store.DOWNLOADING)
+        seen.append(store.state(update["update_id"]))
+        if update["update_id"] == 2:
+            mark_current(job_store.FAILED, "download failed")
+        if update["update_id"] == 3:
+            raise RuntimeError("boom")
+
+    run = tracked_handler(store, handler)
+    run(_upd(1), None)
+    run(_upd(2), None)
+    with pytest.raises(RuntimeError):
+        run(_upd(3), None)
+
+    assert seen == ["downloading"] * 3
+    assert [store.state(i) for i in (1, 2, 3)] == ["done", "failed", "failed"]
+    # outside a tracked handler marking is a no-op
+    mark_current(job_store.DONE)
@@ -0,0 +1,74 @@
+import pytest
+
+from botlib import metrics
+
+
+@pytest.fixture
+def enabled():
+    previous = metrics.ENABLED
+    metrics.set_enabled(True)
+    yield
+    metrics.set_enabled(previous)
+
+
+def test_counter_and_render(enabled):
+    c = metrics.counter("test_things_total", "Things", ["kind"])
+    c.inc(kind="a")
+    c.inc(2, kind="a")
+    c.inc(kind='b"q')
+    assert c.value(kind="a") == 3
+    text = metrics.render()
+    assert "# TYPE test_things_total counter" in text
+    assert 'test_things_total{kind="a"} 3' in text
+    assert 'test_things_total{kind="b\\"q"} 1' in text
+
+
+def test_histogram_buckets_are_cumulative(enabled):
+    h = metrics.histogram("test_latency_seconds", "Latency", ["op"], buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 5.0):
+        h.observe(v, op="x")
+    text = metrics.render()
+    assert 'test_latency_seconds_bucket{op="x",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{op="x",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{op="x",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{op="x"} 3' in text
+    assert 'test_latency_seconds_sum{op="x"} 5.55' in text
+
+
+def test_timed_records_errors(enabled):
+    h = metrics.histogram("test_timed_seconds", "Timed", ["result"])
+    with metrics.timed(h, result="ok"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.timed(h, result="ok"):
+            raise ValueError()
+    assert h.count(result="ok") == 1
+    assert h.count(result="error") == 1
+
+
+def test_disabled_is_noop():
+    previous = metrics.ENABLED
+    metrics.set_enabled(False)
+    try:
+        c = metrics.counter("test_disabled_total", "Disabled")
+        c.inc()
+        assert c.value() == 0
+        h = metrics.histogram("test_disabled_seconds", "Disabled")
+        assert metrics.timed(h) is metrics._NOOP
+    finally:
+        metrics.set_enabled(previous)
+
+
+def test_download_records_cache_hits(enabled, monkeypatch, tmp_path):
+    from botlib import downloader
+
+    monkeypatch.setenv("BOT_CACHE_DIR", str(tmp_path / "cache"))
+    src = tmp_path / "clip.mp4"
+    src.write_bytes(b"data")
+    key = downloader.video_key("https://example.com/hit")
+    downloader.get_default_cache().put(key, str(src))
+
+    hits = metrics.CACHE_REQUESTS.value(result="hit")
+    assert downloader.download_video("https://example.com/hit", str(tmp_path / "out"))
+    assert metrics.CACHE_REQUESTS.value(result="hit") == hits + 1
+    assert metrics.DOWNLOAD_SECONDS.count(result="cache_hit") >= 1
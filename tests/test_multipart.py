@@ -0,0 +1,88 @@
+import asyncio
+import email
+import tracemalloc
+
+import pytest
+
+from botlib import multipart
+from botlib.multipart import MultipartEncoder, UploadTimeout
+
+
+def _parse(body, content_type):
+    msg = email.message_from_bytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+    return {part.get_param("name", header="content-disposition"): part for part in msg.get_payload()}
+
+
+def test_body_is_valid_multipart(tmp_path):
+    fn = tmp_path / "video.mp4"
+    fn.write_bytes(b"\x00\x01payload" * 1000)
+    enc = MultipartEncoder({"chat_id": "42"}, "document", "vídeo.mp4", str(fn), chunk_size=1024)
+
+    body = b"".join(enc)
+    assert len(body) == enc.len
+    parts = _parse(body, enc.content_type)
+    assert parts["chat_id"].get_payload() == "42"
+    assert parts["document"].get_payload(decode=True) == fn.read_bytes()
+    assert "filename*=UTF-8''v%C3%ADdeo.mp4" in parts["document"]["Content-Disposition"]
+
+
+def test_progress_and_reiteration(tmp_path):
+    fn = tmp_path / "f.bin"
+    fn.write_bytes(b"x" * 10)
+    seen = []
+    enc = MultipartEncoder({}, "document", "f.bin", str(fn), chunk_size=4, progress=lambda s, t: seen.append((s, t)))
+    first = b"".join(enc)
+    assert seen == [(4, 10), (8, 10), (10, 10)]
+    # a retry re-reads the file from the start
+    assert b"".join(enc) == first
+
+
+def test_iterable_source_without_size_has_no_length():
+    enc = MultipartEncoder({}, "document", "f.bin", iter([b"ab", b"cd"]))
+    assert enc.len is None
+    assert "Content-Length" not in enc.headers()
+    assert b"abcd" in b"".join(enc)
+
+
+def test_rewindable_only_for_file_sources(tmp_path):
+    fn = tmp_path / "f.bin"
+    fn.write_bytes(b"x")
+    assert MultipartEncoder({}, "document", "f.bin", str(fn)).rewindable is True
+    enc = MultipartEncoder({}, "document", "f.bin", iter([b"ab"]))
+    assert enc.rewindable is False
+    assert enc.async_body().rewindable is False
+
+
+def test_upload_deadline(monkeypatch, tmp_path):
+    fn = tmp_path / "f.bin"
+    fn.write_bytes(b"x" * 10)
+    clock = iter(range(0, 1000, 10))
+    monkeypatch.setattr(multipart.time, "monotonic", lambda: next(clock))
+    enc = MultipartEncoder({}, "document", "f.bin", str(fn), chunk_size=2, timeout=15)
+    with pytest.raises(UploadTimeout):
+        b"".join(enc)
+
+
+def test_memory_stays_flat_for_large_files(tmp_path):
+    fn = tmp_path / "big.bin"
+    with open(fn, "wb") as fh:
+        fh.truncate(32 * 1024 * 1024)
+    enc = MultipartEncoder({}, "document", "big.bin", str(fn))
+
+    tracemalloc.start()
+    total = sum(len(chunk) for chunk in enc)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert total == enc.len
+    assert peak < 4 * multipart.DEFAULT_CHUNK_SIZE
+
+
+def test_async_body_matches_sync(tmp_path):
+    fn = tmp_path / "f.bin"
+    fn.write_bytes(b"abc" * 100000)
+    enc = MultipartEncoder({"chat_id": "1"}, "document", "f.bin", str(fn))
+
+    async def collect():
+        return b"".join([chunk async for chunk in enc.async_body()])
+
+    assert asyncio.run(collect()) == b"".join(enc)
@@ -0,0 +1,73 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from botlib import packaging
+from botlib.packaging import StreamingZip, build_package, packaging_mode
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(os.urandom(100000))
+    return path
+
+
+def test_streaming_zip_is_valid_and_sized(video):
+    stream = StreamingZip(str(video))
+    data = b"".join(stream)
+    assert len(data) == stream.len
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.read("clip.mp4") == video.read_bytes()
+
+
+@pytest.mark.parametrize("mode", ["stored", "deflate"])
+def test_zip_modes_write_archive(video, tmp_path, mode):
+    package = build_package(str(video), str(tmp_path), mode)
+    assert package.filename == "video.zip"
+    assert package.size == os.path.getsize(package.path)
+    with zipfile.ZipFile(package.path) as zf:
+        expected = zipfile.ZIP_STORED if mode == "stored" else zipfile.ZIP_DEFLATED
+        assert zf.getinfo("clip.mp4").compress_type == expected
+
+
+def test_raw_mode_sends_file_as_is(video, tmp_path):
+    package = build_package(str(video), str(tmp_path), "raw")
+    assert package.path == str(video)
+    assert package.filename == "clip.mp4"
+    assert not (tmp_path / "video.zip").exists()
+
+
+def test_stream_mode_writes_nothing_until_materialized(video, tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    package = build_package(str(video), str(out), "stream")
+    assert package.path is None
+    assert os.listdir(out) == []
+    path = package.materialize(str(out))
+    assert os.path.getsize(path) == package.size
+
+
+def test_mode_from_env(monkeypatch):
+    monkeypatch.setenv("BOT_PACKAGING", "RAW")
+    assert packaging_mode() == "raw"
+    monkeypatch.setenv("BOT_PACKAGING", "bogus")
+    assert packaging_mode() == packaging.DEFAULT_MODE
+
+
+def test_streaming_zip_with_several_entries(tmp_path):
+    a = tmp_path / "a.mp4"
+    b = tmp_path / "b.mp4"
+    a.write_bytes(b"first video" * 100)
+    b.write_bytes(b"second")
+    stream = StreamingZip([(str(a), "01-a.mp4"), (str(b), "02-b.mp4")])
+    data = b"".join(stream)
+    assert len(data) == stream.len
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["01-a.mp4", "02-b.mp4"]
+        assert zf.read("02-b.mp4") == b"second"
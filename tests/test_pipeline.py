@@ -0,0 +1,169 @@
+import io
+import threading
+import types
+import zipfile
+
+import pytest
+
+from botlib import http_client, pipeline
+from botlib.packaging import StreamingZip
+from botlib.pipeline import BoundedPipe, PipeClosed, open_stream
+from botlib.telegram_adapter import TelegramAdapter
+
+
+class FakeResponse:
+    def __init__(self, data, status=200, length=None, chunk=4):
+        self.data = data
+        self.status_code = status
+        self.ok = status < 400
+        self.headers = {"Content-Length": str(len(data) if length is None else length)}
+        self.chunk = chunk
+        self.closed = False
+
+    def iter_content(self, size):
+        for i in range(0, len(self.data), self.chunk):
+            yield self.data[i:i + self.chunk]
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _info(size):
+    return {"id": "abc", "title": "My/Clip", "formats": [
+        {"format_id": "18", "url": "https://cdn/v.mp4", "protocol": "https", "ext": "mp4",
+         "vcodec": "avc1", "acodec": "mp4a", "height": 360, "filesize": size,
+         "http_headers": {"User-Agent": "ua"}},
+    ]}
+
+
+def _serve(monkeypatch, response, info):
+    requested = []
+
+    class Session:
+        def get(self, url, headers=None, stream=False, timeout=None):
+            requested.append((url, headers, stream))
+            return response
+
+    monkeypatch.setattr(pipeline, "probe", lambda url: info)
+    monkeypatch.setattr(pipeline, "get_session", lambda: Session())
+    return requested
+
+
+def test_pipe_applies_backpressure_and_abort_releases_writer():
+    pipe = BoundedPipe(2)
+    outcome = []
+
+    def produce():
+        try:
+            for i in range(10):
+                pipe.write(bytes([i]))
+        except PipeClosed:
+            outcome.append("closed")
+
+    writer = threading.Thread(target=produce)
+    writer.start()
+    first = next(iter(pipe))
+    writer.join(0.3)
+    assert first == b"\x00" and writer.is_alive()  # blocked on the full pipe
+    pipe.abort()
+    writer.join(2)
+    assert outcome == ["closed"]
+
+
+def test_producer_error_reaches_reader():
+    pipe = BoundedPipe(4)
+    pipe.write(b"a")
+    pipe.close(ConnectionError("reset"))
+    with pytest.raises(IOError):
+        list(pipe)
+
+
+def test_pipe_cannot_be_read_twice():
+    pipe = BoundedPipe(4)
+    pipe.write(b"a")
+    pipe.close()
+    assert list(pipe) == [b"a"]
+    with pytest.raises(PipeClosed):
+        iter(pipe).__next__()
+
+
+def test_rate_limited_stream_upload_fails_instead_of_hanging(monkeypatch):
+    data = b"x" * 100
+    _serve(monkeypatch, FakeResponse(data), _info(len(data)))
+    package, pipe = open_stream("https://example.com/v", 10_000, mode="stream")
+
+    class Session:
+        def __init__(self):
+            self.calls = 0
+
+        def request(self, method, url, timeout=None, data=None, **kwargs):
+            self.calls += 1
+            b"".join(data)
+            status = 429 if self.calls == 1 else 200
+            return types.SimpleNamespace(status_code=status, ok=status < 400, headers={}, text="",
+                                         json=lambda: {"ok": status < 400, "parameters": {"retry_after": 0}})
+
+    session = Session()
+    monkeypatch.setattr(http_client, "_session", session)
+    result = []
+    uploader = threading.Thread(target=lambda: result.append(
+        TelegramAdapter(token="tok").send_document_stream(1, package.stream, package.size, package.filename)))
+    uploader.start()
+    uploader.join(5)
+    pipe.abort()
+    assert not uploader.is_alive()
+    # the one-shot body is not replayed; the caller falls back to downloading
+    assert session.calls == 1
+    assert result[0]["status"] == 429
+
+
+def test_open_stream_zips_the_source_on_the_fly(monkeypatch):
+    data = b"0123456789" * 10
+    response = FakeResponse(data)
+    requested = _serve(monkeypatch, response, _info(len(data)))
+
+    package, pipe = open_stream("https://example.com/v", 10_000, mode="stream")
+    body = b"".join(package.stream)
+    pipe.abort()
+
+    assert requested == [("https://cdn/v.mp4", {"User-Agent": "ua"}, True)]
+    assert package.filename == "video.zip" and len(body) == package.size
+    with zipfile.ZipFile(io.BytesIO(body)) as zf:
+        assert zf.namelist() == ["My_Clip.mp4"]
+        assert zf.read("My_Clip.mp4") == data
+
+
+def test_open_stream_declines_unsuitable_sources(monkeypatch):
+    data = b"x" * 100
+    _serve(monkeypatch, FakeResponse(data), _info(len(data)))
+    assert open_stream("https://example.com/v", 50, mode="raw") is None   # does not fit
+
+    mismatched = FakeResponse(data, length=99)
+    _serve(monkeypatch, mismatched, _info(len(data)))
+    assert open_stream("https://example.com/v", 10_000, mode="raw") is None
+    assert mismatched.closed
+
+
+def test_zip_budget_matches_the_archive_exactly(monkeypatch):
+    data = b"x" * 100
+    _serve(monkeypatch, FakeResponse(data), _info(len(data)))
+    fits = len(StreamingZip.from_stream(iter(()), len(data), "My_Clip.mp4"))
+    assert open_stream("https://example.com/v", fits - 1, mode="stream") is None
+    package, pipe = open_stream("https://example.com/v", fits, mode="stream")
+    pipe.abort()
+    assert package.size == fits
+
+
+def test_short_source_fails_the_upload_stream(monkeypatch):
+    response = FakeResponse(b"x" * 60, length=100)
+    response.headers = {}
+    _serve(monkeypatch, response, _info(100))
+    package, pipe = open_stream("https://example.com/v", 10_000, mode="raw")
+    with pytest.raises(IOError):
+        b"".join(package.stream)
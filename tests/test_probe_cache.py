@@ -0,0 +1,47 @@
+from botlib.probe_cache import ProbeCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_returns_private_copies_until_ttl():
+    clock = Clock()
+    cache = ProbeCache(ttl=60, clock=clock)
+    cache.put("Fake:1", {"id": "1", "formats": [{"format_id": "a"}]})
+
+    first = cache.get("Fake:1")
+    first["formats"].clear()
+    assert cache.get("Fake:1")["formats"] == [{"format_id": "a"}]
+
+    clock.now += 61
+    assert cache.get("Fake:1") is None
+
+
+def test_disk_entries_survive_a_new_instance(tmp_path):
+    clock = Clock()
+    ProbeCache(ttl=60, root=str(tmp_path), clock=clock).put("Fake:1", {"id": "1"})
+
+    reopened = ProbeCache(ttl=60, root=str(tmp_path), clock=clock)
+    assert reopened.get("Fake:1") == {"id": "1"}
+
+    clock.now += 61
+    assert ProbeCache(ttl=60, root=str(tmp_path), clock=clock).get("Fake:1") is None
+
+
+def test_invalidate_and_lru_bound(tmp_path):
+    cache = ProbeCache(ttl=60, root=str(tmp_path), max_entries=2)
+    cache.put("a", {"id": "a"})
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert not list(tmp_path.iterdir())
+
+    memory_only = ProbeCache(ttl=60, max_entries=2)
+    for key in ("a", "b", "c"):
+        memory_only.put(key, {"id": key})
+    assert memory_only.get("a") is None
+    assert memory_only.get("c") == {"id": "c"}
@@ -0,0 +1,50 @@
+import operator
+import os
+import time
+
+import pytest
+
+from botlib.process_pool import JobTimeout, ProcessPool, WorkerCrashed
+
+
+@pytest.fixture
+def pool():
+    pool = ProcessPool(size=1, timeout=30, warm=None)
+    yield pool
+    pool.close()
+
+
+def test_workers_are_reused_and_errors_propagate(pool):
+    first = pool.run(os.getpid)
+    assert first != os.getpid()
+    assert pool.run(operator.add, 2, 3) == 5
+    with pytest.raises(ZeroDivisionError):
+        pool.run(operator.truediv, 1, 0)
+    assert pool.run(os.getpid) == first
+
+
+def test_hung_job_is_killed_and_worker_replaced(pool):
+    before = pool.run(os.getpid)
+    started = time.monotonic()
+    with pytest.raises(JobTimeout):
+        pool.run(time.sleep, 30, timeout=0.5)
+    assert time.monotonic() - started < 10
+    after = pool.run(os.getpid)
+    assert after != before
+
+
+def test_crashed_worker_is_replaced(pool):
+    with pytest.raises(WorkerCrashed):
+        pool.run(os._exit, 3)
+    assert pool.run(operator.mul, 6, 7) == 42
+
+
+@pytest.mark.skipif(not hasattr(os, "setpgrp"), reason="POSIX only")
+def test_memory_limit_applies_per_worker():
+    pool = ProcessPool(size=1, timeout=30, memory_limit=512 * 1024 * 1024, warm=None)
+    try:
+        with pytest.raises(MemoryError):
+            pool.run(bytearray, 1024 * 1024 * 1024)
+        assert pool.run(operator.add, 1, 1) == 2
+    finally:
+        pool.close()
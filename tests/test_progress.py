@@ -0,0 +1,118 @@
+from botlib.progress import AsyncProgressReporter, ProgressBroadcast, ProgressReporter, describe_download
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class EditAdapter:
+    def __init__(self):
+        self.calls = []
+
+    def send_message(self, chat_id, text):
+        self.calls.append(("send", text))
+        return {"ok": True, "body": {"result": {"message_id": 9}}}
+
+    def edit_message_text(self, chat_id, message_id, text):
+        self.calls.append(("edit", text))
+        return {"ok": True}
+
+    def delete_message(self, chat_id, message_id):
+        self.calls.append(("delete", message_id))
+        return {"ok": True}
+
+
+def test_updates_are_throttled_and_coalesced():
+    clock = Clock()
+    adapter = EditAdapter()
+    reporter = ProgressReporter(adapter, 1, "start", min_interval=60, clock=clock)
+    reporter.update("10%")
+    reporter.update("20%")
+    assert adapter.calls == [("send", "start")]
+
+    clock.now += 61
+    reporter.update("30%")
+    reporter.update("30%")
+    assert adapter.calls == [("send", "start"), ("edit", "30%")]
+
+    # the final state is always shown and the pending timer is dropped
+    reporter.update("40%")
+    reporter.finish("done")
+    assert adapter.calls[-1] == ("edit", "done")
+    reporter.update("50%")
+    assert adapter.calls[-1] == ("edit", "done")
+
+
+def test_pending_update_is_flushed_by_timer():
+    import time
+
+    adapter = EditAdapter()
+    reporter = ProgressReporter(adapter, 1, "start", min_interval=0.05)
+    reporter.update("a")
+    reporter.update("b")
+    time.sleep(0.3)
+    assert adapter.calls == [("send", "start"), ("edit", "b")]
+    reporter.finish()
+    assert adapter.calls[-1] == ("delete", 9)
+
+
+def test_describe_download_and_broadcast():
+    assert describe_download({"status": "downloading", "downloaded_bytes": 1024 * 1024,
+                              "total_bytes": 4 * 1024 * 1024, "speed": 2048, "eta": 75}) == \
+        "Downloading: 25% of 4.0 MB at 2.0 KB/s, ETA 1:15"
+    assert describe_download({"status": "finished"}) == "Processing video..."
+    assert describe_download({"status": "error"}) is None
+
+    broadcast = ProgressBroadcast()
+    a, b = EditAdapter(), EditAdapter()
+    ra = ProgressReporter(a, 1, "start", min_interval=0)
+    rb = ProgressReporter(b, 2, "start", min_interval=0)
+    broadcast.subscribe("k", ra)
+    broadcast.subscribe("k", rb)
+    hook = broadcast.hook("k")
+    hook({"status": "downloading", "downloaded_bytes": 10})
+    broadcast.unsubscribe("k", rb)
+    hook({"status": "finished"})
+    assert [c[1] for c in a.calls] == ["start", "Downloading: 10 B", "Processing video..."]
+    assert [c[1] for c in b.calls] == ["start", "Downloading: 10 B"]
+
+
+def test_async_reporter_coalesces_updates_from_any_thread():
+    import asyncio
+    import threading
+
+    class AsyncEditAdapter:
+        def __init__(self):
+            self.calls = []
+
+        async def send_message(self, chat_id, text):
+            self.calls.append(("send", text))
+            return {"ok": True, "body": {"result": {"message_id": 9}}}
+
+        async def edit_message_text(self, chat_id, message_id, text):
+            self.calls.append(("edit", text))
+            return {"ok": True}
+
+        async def delete_message(self, chat_id, message_id):
+            self.calls.append(("delete", message_id))
+            return {"ok": True}
+
+    adapter = AsyncEditAdapter()
+
+    async def run():
+        reporter = await AsyncProgressReporter.start(adapter, 1, "start", min_interval=0.05)
+        reporter.update("a")
+        # yt-dlp hooks call in from download threads
+        thread = threading.Thread(target=reporter.download_hook, args=({"status": "finished"},))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0.3)
+        await reporter.finish()
+        reporter.update("late")
+
+    asyncio.run(run())
+    assert adapter.calls == [("send", "start"), ("edit", "Processing video..."), ("delete", 9)]
@@ -0,0 +1,60 @@
+import json
+
+from botlib import quotas
+from botlib.quotas import QuotaLedger
+
+
+class Clock:
+    def __init__(self, now=10 * quotas.DAY + 100):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_limits_and_daily_reset():
+    clock = Clock()
+    ledger = QuotaLedger(max_bytes=1000, max_seconds=60, clock=clock)
+    ledger.charge(1, nbytes=600, seconds=5)
+    assert ledger.exceeded(1) is None
+    ledger.charge(1, nbytes=400)
+    assert ledger.exceeded(1) == "bytes"
+    ledger.charge(2, seconds=61)
+    assert ledger.exceeded(2) == "seconds"
+    assert ledger.exceeded(3) is None
+
+    clock.now += quotas.DAY
+    assert ledger.usage(1) == {"bytes": 0, "seconds": 0.0}
+    assert ledger.exceeded(1) is None
+
+
+def test_usage_is_flushed_periodically_and_reloaded(tmp_path):
+    path = str(tmp_path / "quotas.json")
+    clock = Clock()
+    ledger = QuotaLedger(max_bytes=1000, path=path, flush_interval=30, clock=clock)
+    ledger.charge(-100123, nbytes=10)
+    # not yet: writes are batched
+    assert not (tmp_path / "quotas.json").exists()
+    clock.now += 30
+    ledger.charge(-100123, nbytes=5)
+    assert json.loads((tmp_path / "quotas.json").read_text())["-100123"][1] == 15
+
+    reloaded = QuotaLedger(max_bytes=1000, path=path, clock=clock)
+    assert reloaded.usage(-100123)["bytes"] == 15
+    # entries from another day are not carried over
+    clock.now += quotas.DAY
+    assert QuotaLedger(path=path, clock=clock).usage(-100123)["bytes"] == 0
+
+
+def test_default_ledger_only_with_a_limit(monkeypatch, tmp_path):
+    monkeypatch.setattr(quotas, "_default_ledger", None)
+    monkeypatch.delenv("BOT_QUOTA_DAILY_MB", raising=False)
+    monkeypatch.delenv("BOT_QUOTA_DAILY_SECONDS", raising=False)
+    assert quotas.get_default_ledger() is None
+    monkeypatch.setenv("BOT_QUOTA_DAILY_MB", "1")
+    monkeypatch.setenv("BOT_QUOTA_FILE", str(tmp_path / "q.json"))
+    ledger = quotas.get_default_ledger()
+    assert ledger.max_bytes == 2**20
+    ledger.charge(7, nbytes=1)
+    quotas.flush_default_ledger()
+    assert json.loads((tmp_path / "q.json").read_text())["7"][1] == 1
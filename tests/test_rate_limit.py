@@ -0,0 +1,100 @@
+import asyncio
+
+from botlib.rate_limit import RateLimiter, TokenBucket, get_default_limiter
+from botlib.telegram_adapter import TelegramAdapter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_rate():
+    bucket = TokenBucket(rate=1.0, burst=3)
+    starts = [bucket.reserve(0.0) for _ in range(5)]
+    assert starts == [0.0, 0.0, 0.0, 1.0, 2.0]
+
+
+def _sleeping_clock(monkeypatch):
+    clock = FakeClock()
+
+    def fake_sleep(delay):
+        clock.now += delay
+
+    monkeypatch.setattr("botlib.rate_limit.time.sleep", fake_sleep)
+    return clock
+
+
+def test_per_chat_limit_does_not_affect_other_chats(monkeypatch):
+    clock = _sleeping_clock(monkeypatch)
+    limiter = RateLimiter(global_rate=100, global_burst=100, chat_rate=1, chat_burst=1, clock=clock)
+    assert limiter.acquire(1) == 0
+    # a second call for chat 1 has to wait for its chat bucket...
+    assert limiter._reserve_chat(1) == 1.0
+    # ...while chat 2 goes out immediately
+    assert limiter.acquire(2) == 0
+
+
+def test_global_limit_spreads_calls(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("botlib.rate_limit.time.sleep", lambda delay: None)
+    limiter = RateLimiter(global_rate=10, global_burst=2, chat_rate=100, chat_burst=100, clock=clock)
+    waits = [round(limiter.acquire(chat), 6) for chat in range(4)]
+    assert waits == [0, 0, 0.1, 0.2]
+    stats = limiter.stats()
+    assert stats["throttled_calls"] == 2
+    assert abs(stats["throttled_seconds"] - 0.3) < 1e-6
+
+
+def test_idle_chat_buckets_are_pruned(monkeypatch):
+    from botlib import rate_limit
+
+    monkeypatch.setattr(rate_limit, "MAX_CHAT_BUCKETS", 2)
+    clock = FakeClock()
+    limiter = RateLimiter(chat_rate=1, chat_burst=1, clock=clock)
+    limiter._reserve_chat(1)
+    limiter._reserve_chat(2)
+    clock.now += 10
+    limiter._reserve_chat(3)
+    assert limiter.stats()["tracked_chats"] == 1
+
+
+def test_adapter_waits_instead_of_failing(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("botlib.rate_limit.time.sleep", sleeps.append)
+    monkeypatch.setattr("botlib.telegram_adapter.post", lambda url, message, headers=None, timeout=None: {"ok": True})
+    clock = FakeClock()
+    limiter = RateLimiter(chat_rate=1, chat_burst=1, clock=clock)
+    adapter = TelegramAdapter(token="tok", base_url="http://api", rate_limiter=limiter)
+
+    assert adapter.send_message(1, "a")["ok"]
+    assert adapter.send_message(1, "b")["ok"]
+    assert sleeps == [1.0]
+
+
+def test_acquire_async_sleeps(monkeypatch):
+    clock = FakeClock()
+    limiter = RateLimiter(chat_rate=2, chat_burst=1, clock=clock)
+    slept = []
+
+    async def fake_sleep(delay):
+        slept.append(delay)
+
+    monkeypatch.setattr("botlib.rate_limit.asyncio.sleep", fake_sleep)
+
+    async def main():
+        await limiter.acquire_async(7)
+        await limiter.acquire_async(7)
+
+    asyncio.run(main())
+    assert slept == [0.5]
+
+
+def test_default_limiter_can_be_disabled(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_RATE_LIMIT", "0")
+    assert get_default_limiter() is None
+    monkeypatch.setenv("TELEGRAM_RATE_LIMIT", "1")
+    assert get_default_limiter() is get_default_limiter()
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+from botlib import downloader, probe_cache, scheduler
+from botlib.dispatcher import Dispatcher, chat_key
+from botlib.scheduler import NORMAL, PRIORITY, FairScheduler, classify_update, parse_weights
+
+
+def _update(update_id, chat_id, text="https://example.com/v"):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": text}}
+
+
+def _drain(sched, elapsed):
+    """Run the queue on one worker; `elapsed(update)` is each update's service time."""
+    order = []
+    while True:
+        picked = sched.pop()
+        if picked is None:
+            return order
+        flow, update = picked
+        order.append(update["update_id"])
+        sched.done(flow, elapsed(update))
+
+
+def test_heavy_chat_yields_to_light_chats():
+    sched = FairScheduler(chat_key, workers=1)
+    # chat 1 queued five long downloads before chats 2 and 3 asked for one each
+    for i in range(5):
+        sched.push(_update(i, 1))
+    sched.push(_update(10, 2))
+    sched.push(_update(11, 3))
+    order = _drain(sched, lambda u: 100.0 if u["message"]["chat"]["id"] == 1 else 1.0)
+    assert order == [0, 10, 11, 1, 2, 3, 4]
+
+
+def test_weights_and_no_credit_for_idle_chats():
+    sched = FairScheduler(chat_key, workers=1, weights={2: 2.0})
+    for i in range(4):
+        sched.push(_update(i, 1))
+        sched.push(_update(10 + i, 2))
+    order = _drain(sched, lambda u: 10.0)
+    # chat 2 has twice the weight: two of its updates per one of chat 1's
+    assert order[:6] == [0, 10, 11, 1, 12, 13]
+
+    # chat 3 was idle all along: it starts at the current virtual time, just
+    # behind chat 1, instead of running everything it queued first
+    sched.push(_update(20, 1))
+    for i in range(3):
+        sched.push(_update(30 + i, 3))
+    assert _drain(sched, lambda u: 10.0) == [30, 20, 31, 32]
+
+
+def test_priority_lane_skips_the_line_of_other_chats():
+    sched = FairScheduler(chat_key, workers=2, priority_workers=1)
+    assert sched.normal_slots == 1
+    sched.push(_update(1, 1), NORMAL)
+    sched.push(_update(2, 2), NORMAL)
+    long_run, long_update = sched.pop()
+    assert long_update["update_id"] == 1
+    # the second normal download must wait for the first...
+    assert sched.pop() is None
+    # ...but another chat's cache hit runs on the reserved worker
+    sched.push(_update(3, 3), PRIORITY)
+    run, update = sched.pop()
+    assert update["update_id"] == 3
+    sched.done(run, 0.1)
+    sched.done(long_run, 100.0)
+    assert sched.pop()[1]["update_id"] == 2
+
+
+def test_priority_lane_keeps_a_chats_own_order():
+    sched = FairScheduler(chat_key, workers=2, priority_workers=1)
+    sched.push(_update(1, 1), NORMAL)
+    sched.push(_update(2, 1), PRIORITY)
+    sched.push(_update(3, 2), NORMAL)
+    long_run, long_update = sched.pop()
+    assert long_update["update_id"] == 1
+    # chat 1's cache hit arrived after its download, so it waits for it
+    assert sched.pop() is None
+    sched.done(long_run, 100.0)
+    # then it still goes before chat 2, although chat 2 has the smaller virtual time
+    assert _drain(sched, lambda u: 1.0) == [2, 3]
+
+
+def test_classify_uses_local_caches_only(monkeypatch):
+    assert classify_update(_update(1, 1, text="hello")) == PRIORITY
+    assert classify_update(_update(1, 1, text="https://a.example/1 https://b.example/2")) == NORMAL
+    monkeypatch.setattr(scheduler, "_cached", lambda url: url.endswith("/known"))
+    monkeypatch.setattr(scheduler, "_short", lambda url: False)
+    assert classify_update(_update(1, 1, text="https://example.com/known")) == PRIORITY
+    assert classify_update(_update(1, 1, text="https://example.com/new")) == NORMAL
+    assert parse_weights("1=2, -5=0.5,vip=3,bad") == {1: 2.0, -5: 0.5, "vip": 3.0}
+
+
+def test_classify_never_loads_extractors(monkeypatch):
+    monkeypatch.setattr(downloader, "_extractor_classes", lambda: pytest.fail("yt-dlp loaded on ingress"))
+    monkeypatch.setattr(downloader, "_video_keys", OrderedDict({"https://youtu.be/abc": "Youtube:abc"}))
+    probes = {"Youtube:abc": {"duration": 30}}
+    monkeypatch.setattr(probe_cache, "get_default_probe_cache", lambda: probes)
+    assert classify_update(_update(1, 1, text="https://youtu.be/abc")) == PRIORITY
+    assert classify_update(_update(1, 1, text="https://youtu.be/new")) == NORMAL
+
+
+def test_dispatcher_serves_cache_hits_while_downloads_fill_the_pool():
+    release = threading.Event()
+    served = threading.Event()
+
+    def handler(update, adapter):
+        if update["message"]["text"] == "cached":
+            served.set()
+        else:
+            release.wait(5)
+
+    sched = FairScheduler(chat_key, workers=3, priority_workers=1,
+                          classify=lambda u: PRIORITY if u["message"]["text"] == "cached" else NORMAL)
+    d = Dispatcher(handler, adapter=None, workers=3, scheduler=sched).start()
+    for i in range(5):
+        d.submit(_update(i, i))
+    time.sleep(0.05)
+    d.submit(_update(99, 99, text="cached"))
+    try:
+        assert served.wait(2)
+        assert d.stats()["scheduler"]["running"][NORMAL] == 2
+    finally:
+        release.set()
+        assert d.join(timeout=5)
+        d.shutdown()
@@ -1,11 +1,10 @@
 import os
-import sys
-import tempfile
 import zipfile
 
 import pytest
 
 from botlib import services
+from botlib.packaging import StreamingZip
 
 
 class DummyAdapter:
@@ -46,7 +45,7 @@ def test_handle_url_triggers_download_and_send(monkeypatch, tmp_path):
     downloaded = dl_dir / "video.mp4"
     downloaded.write_bytes(b"fake video")
 
-    def fake_download(url, out_dir):
+    def fake_download(url, out_dir, max_bytes=None, **kwargs):
         return str(downloaded)
 
     monkeypatch.setattr(services, "download_video", fake_download)
@@ -65,7 +64,7 @@ def test_large_file_triggers_transfer_sh_fallback(monkeypatch, tmp_path):
     downloaded = dl_dir / "bigfile.mp4"
     downloaded.write_bytes(b"x" * 1024)
 
-    def fake_download(url, out_dir):
+    def fake_download(url, out_dir, max_bytes=None, **kwargs):
         return str(downloaded)
 
     monkeypatch.setattr(services, "download_video", fake_download)
@@ -73,22 +72,12 @@ def test_large_file_triggers_transfer_sh_fallback(monkeypatch, tmp_path):
     # Force TELEGRAM_MAX_UPLOAD_BYTES very small so zip will be larger
     monkeypatch.setenv("TELEGRAM_MAX_UPLOAD_BYTES", "1")
 
-    # Provide a fake requests.post used by the fallback upload
-    class FakeResp:
-        status_code = 200
+    # Fake the streamed PUT used by the transfer.sh backend
+    def fake_request(method, url, data=None, headers=None, timeout=None, retries=None):
+        assert method == "PUT" and url.startswith("https://transfer.sh/")
+        return {"ok": True, "status": 200, "headers": {}, "body": "https://transfer.sh/fake-link\n"}
 
-        def __init__(self, text):
-            self.text = text
-
-    def fake_post(url, files=None, timeout=None):
-        return FakeResp("https://transfer.sh/fake-link")
-
-    sys_modules = sys.modules
-    # ensure requests is available for import in services
-    import types
-
-    fake_requests = types.SimpleNamespace(post=fake_post)
-    monkeypatch.setitem(sys_modules, "requests", fake_requests)
+    monkeypatch.setattr("botlib.storage.request", fake_request)
 
     adapter = DummyAdapter()
     update = {"update_id": 3, "message": {"chat": {"id": 100}, "text": "http://foo"}}
@@ -100,7 +89,7 @@ def test_large_file_triggers_transfer_sh_fallback(monkeypatch, tmp_path):
 
 def test_download_failure_sends_error_message(monkeypatch):
     # simulate download_video returning None
-    monkeypatch.setattr(services, "download_video", lambda url, out_dir: None)
+    monkeypatch.setattr(services, "download_video", lambda url, out_dir, max_bytes=None, **kwargs: None)
     adapter = DummyAdapter()
     update = {"update_id": 10, "message": {"chat": {"id": 7}, "text": "http://nope"}}
     services.handle_update(update, adapter)
@@ -114,20 +103,12 @@ def test_fallback_upload_failure_sends_message(monkeypatch, tmp_path):
     downloaded = tmp_path / "video.mp4"
     downloaded.write_bytes(b"x" * 1024)
 
-    monkeypatch.setattr(services, "download_video", lambda url, out_dir: str(downloaded))
+    monkeypatch.setattr(services, "download_video", lambda url, out_dir, max_bytes=None, **kwargs: str(downloaded))
     monkeypatch.setenv("TELEGRAM_MAX_UPLOAD_BYTES", "1")
 
-    class FakeResp:
-        status_code = 500
-        def __init__(self, text=""):
-            self.text = text
-
-    def fake_post(url, files=None, timeout=None):
-        return FakeResp("")
-
-    import sys, types
-    fake_requests = types.SimpleNamespace(post=fake_post)
-    monkeypatch.setitem(sys.modules, "requests", fake_requests)
+    monkeypatch.setenv("BOT_STORAGE_BACKOFF", "0")
+    monkeypatch.setattr("botlib.storage.request", lambda method, url, **kwargs: {
+        "ok": False, "status": 500, "headers": {}, "body": "", "error": None})
 
     adapter = DummyAdapter()
     update = {"update_id": 11, "message": {"chat": {"id": 8}, "text": "http://big"}}
@@ -135,3 +116,474 @@ def test_fallback_upload_failure_sends_message(monkeypatch, tmp_path):
 
     # fallback upload failed -> send_message called with failure note
     assert any(c[0] == "send_message" and ("fallback upload failed" in c[2] or "too large" in c[2]) for c in adapter.calls)
+
+
+class FileIdAdapter(DummyAdapter):
+    def __init__(self, accept_file_id=True):
+        super().__init__()
+        self.accept_file_id = accept_file_id
+
+    def send_document(self, chat_id, file_path, filename=None):
+        self.calls.append(("send_document", chat_id, file_path, filename))
+        return {"ok": True, "body": {"ok": True, "result": {"document": {"file_id": "FID"}}}}
+
+    def send_document_by_id(self, chat_id, file_id):
+        self.calls.append(("send_document_by_id", chat_id, file_id))
+        return {"ok": self.accept_file_id}
+
+
+def test_repeat_url_resends_by_file_id(monkeypatch, tmp_path):
+    monkeypatch.setenv("BOT_FILE_ID_DB", str(tmp_path / "ids.sqlite3"))
+    downloaded = tmp_path / "video.mp4"
+    downloaded.write_bytes(b"fake video")
+    downloads = []
+
+    def fake_download(url, out_dir, max_bytes=None, **kwargs):
+        downloads.append(url)
+        return str(downloaded)
+
+    monkeypatch.setattr(services, "download_video", fake_download)
+
+    adapter = FileIdAdapter()
+    update = {"update_id": 20, "message": {"chat": {"id": 5}, "text": "https://example.com/v"}}
+    services.handle_update(update, adapter)
+    services.handle_update(update, adapter)
+
+    assert downloads == ["https://example.com/v"]
+    assert [c[0] for c in adapter.calls] == ["send_document", "send_document_by_id"]
+    assert adapter.calls[1][2] == "FID"
+
+
+def test_file_ids_are_kept_per_packaging_mode(monkeypatch, tmp_path):
+    monkeypatch.setenv("BOT_FILE_ID_DB", str(tmp_path / "ids.sqlite3"))
+    downloaded = tmp_path / "video.mp4"
+    downloaded.write_bytes(b"fake video")
+    monkeypatch.setattr(services, "download_video", lambda url, out_dir, max_bytes=None, **kwargs: str(downloaded))
+
+    adapter = FileIdAdapter()
+    update = {"update_id": 22, "message": {"chat": {"id": 5}, "text": "https://example.com/m"}}
+    monkeypatch.setenv("BOT_PACKAGING", "stored")
+    services.handle_update(update, adapter)
+    # a zip was uploaded; switching to raw must upload the video itself
+    monkeypatch.setenv("BOT_PACKAGING", "raw")
+    services.handle_update(update, adapter)
+    services.handle_update(update, adapter)
+
+    sent = [(c[0], c[3]) for c in adapter.calls if c[0] == "send_document"]
+    assert sent == [("send_document", "video.zip"), ("send_document", "video.mp4")]
+    assert adapter.calls[-1][0] == "send_document_by_id"
+
+
+def test_rejected_file_id_falls_back_to_upload(monkeypatch, tmp_path):
+    monkeypatch.setenv("BOT_FILE_ID_DB", str(tmp_path / "ids.sqlite3"))
+    downloaded = tmp_path / "video.mp4"
+    downloaded.write_bytes(b"fake video")
+    monkeypatch.setattr(services, "download_video", lambda url, out_dir, max_bytes=None, **kwargs: str(downloaded))
+    key = services.package_key(services.video_key("https://example.com/w"), services.packaging_mode())
+    services.get_default_store().put(key, "STALE")
+
+    adapter = FileIdAdapter(accept_file_id=False)
+    update = {"update_id": 21, "message": {"chat": {"id": 5}, "text": "https://example.com/w"}}
+    services.handle_update(update, adapter)
+
+    assert [c[0] for c in adapter.calls] == ["send_document_by_id", "send_document"]
+
+
+class AsyncDummyAdapter:
+    def __init__(self):
+        self.calls = []
+
+    async def send_message(self, chat_id, text):
+        self.calls.append(("send_message", chat_id, text))
+        return {"ok": True}
+
+    async def send_document(self, chat_id, file_path, filename=None):
+        self.calls.append(("send_document", chat_id, file_path, filename))
+        return {"ok": True}
+
+
+def test_async_echo_message():
+    import asyncio
+
+    adapter = AsyncDummyAdapter()
+    update = {"update_id": 30, "message": {"chat": {"id": 42}, "text": "hello"}}
+    asyncio.run(services.handle_update_async(update, adapter))
+    assert adapter.calls == [("send_message", 42, "Echo: hello")]
+
+
+def test_async_url_downloads_in_executor(monkeypatch, tmp_path):
+    import asyncio
+    import threading
+
+    downloaded = tmp_path / "video.mp4"
+    downloaded.write_bytes(b"fake video")
+    threads = []
+
+    def fake_download(url, out_dir, max_bytes=None, **kwargs):
+        threads.append(threading.current_thread())
+        return str(downloaded)
+
+    monkeypatch.setattr(services, "download_video", fake_download)
+    adapter = AsyncDummyAdapter()
+    update = {"update_id": 31, "message": {"chat": {"id": 9}, "text": "http://example.com/v"}}
+    asyncio.run(services.handle_update_async(update, adapter))
+
+    assert threads and threads[0] is not threading.main_thread()
+    assert [c[0] for c in adapter.calls] == ["send_document"]
+
+
+def test_stream_packaging_uses_send_document_stream(monkeypatch, tmp_path):
+    downloaded = tmp_path / "video.mp4"
+    downloaded.write_bytes(b"fake video")
+    monkeypatch.setattr(services, "download_video", lambda url, out_dir, max_bytes=None, **kwargs: str(downloaded))
+    monkeypatch.setenv("BOT_PACKAGING", "stream")
+
+    class StreamAdapter(DummyAdapter):
+        def send_document_stream(self, chat_id, source, size, filename):
+            data = b"".join(source)
+            self.calls.append(("send_document_stream", chat_id, len(data) == size, filename))
+            return {"ok": True}
+
+    adapter = StreamAdapter()
+    update = {"update_id": 40, "message": {"chat": {"id": 3}, "text": "http://example.com/s"}}
+    services.handle_update(update, adapter)
+    assert adapter.calls == [("send_document_stream", 3, True, "video.zip")]
+
+
+def test_raw_packaging_sends_original_file(monkeypatch, tmp_path):
+    downloaded = tmp_path / "My Clip.mp4"
+    downloaded.write_bytes(b"fake video")
+    monkeypatch.setattr(services, "download_video", lambda url, out_dir, max_bytes=None, **kwargs: str(downloaded))
+    monkeypatch.setenv("BOT_PACKAGING", "raw")
+
+    adapter = DummyAdapter()
+    update = {"update_id": 41, "message": {"chat": {"id": 3}, "text": "http://example.com/r"}}
+    services.handle_update(update, adapter)
+    assert adapter.calls == [("send_document", 3, str(downloaded), "My Clip.mp4")]
+
+
+def test_concurrent_identical_urls_share_one_download(monkeypatch, tmp_path):
+    import threading
+
+    downloaded = tmp_path / "video.mp4"
+    downloaded.write_bytes(b"fake video")
+    entered = threading.Event()
+    release = threading.Event()
+    downloads = []
+
+    def fake_download(url, out_dir, max_bytes=None, **kwargs):
+        downloads.append(url)
+        entered.set()
+        release.wait(5)
+        return str(downloaded)
+
+    monkeypatch.setattr(services, "download_video", fake_download)
+
+    adapter = DummyAdapter()
+    texts = ["https://www.example.com/v?id=1&utm_source=x", "https://example.com/v?id=1#t=3"]
+    threads = [
+        threading.Thread(target=services.handle_update,
+                         args=({"update_id": i, "message": {"chat": {"id": 100 + i}, "text": t}}, adapter))
+        for i, t in enumerate(texts)
+    ]
+    threads[0].start()
+    assert entered.wait(5)
+    threads[1].start()
+    # let the second request join the in-flight job before it finishes
+    for _ in range(100):
+        if services._flights._calls and next(iter(services._flights._calls.values())).refs == 2:
+            break
+        threading.Event().wait(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(downloads) == 1
+    sent = [c for c in adapter.calls if c[0] == "send_document"]
+    assert sorted(c[1] for c in sent) == [100, 101]
+    assert services._flights.in_flight() == 0
+
+
+def test_pool_failure_reports_download_error(monkeypatch):
+    from botlib.process_pool import JobTimeout
+
+    class HungPool:
+        def run(self, func, *args, **kwargs):
+            raise JobTimeout("job exceeded 1s")
+
+    monkeypatch.setattr(services, "get_default_pool", lambda: HungPool())
+    adapter = DummyAdapter()
+    update = {"update_id": 9, "message": {"chat": {"id": 5}, "text": "https://example.com/hang"}}
+    services.handle_update(update, adapter)
+    assert adapter.calls == [("send_message", 5, "Sorry, I couldn't download that video.")]
+
+
+class BatchAdapter(DummyAdapter):
+    def send_message(self, chat_id, text):
+        self.calls.append(("send_message", chat_id, text))
+        return {"ok": True, "body": {"result": {"message_id": 77}}}
+
+    def edit_message_text(self, chat_id, message_id, text):
+        self.calls.append(("edit", message_id, text))
+        return {"ok": True}
+
+    def send_document_stream(self, chat_id, source, size, filename, progress=None):
+        data = b"".join(source)
+        assert len(data) == size
+        self.calls.append(("send_document_stream", chat_id, filename, data))
+        return {"ok": True}
+
+    def send_media_group(self, chat_id, files):
+        self.calls.append(("send_media_group", chat_id, [name for _, name in files]))
+        return {"ok": True}
+
+
+def _fake_batch_download(tmp_path):
+    def fake_download(url, out_dir, max_bytes=None, **kwargs):
+        if "broken" in url:
+            return None
+        path = os.path.join(out_dir, url.rsplit("/", 1)[-1] + ".mp4")
+        with open(path, "wb") as fh:
+            fh.write(url.encode())
+        return path
+
+    return fake_download
+
+
+def test_multiple_urls_are_sent_as_one_archive(monkeypatch, tmp_path):
+    import io
+
+    monkeypatch.setattr(services, "download_video", _fake_batch_download(tmp_path))
+    adapter = BatchAdapter()
+    text = "https://example.com/a https://example.com/broken https://example.com/b https://example.com/a"
+    services.handle_update({"update_id": 3, "message": {"chat": {"id": 8}, "text": text}}, adapter)
+
+    kinds = [c[0] for c in adapter.calls]
+    assert kinds.count("send_message") == 1  # one status message, edited afterwards
+    archives = [c for c in adapter.calls if c[0] == "send_document_stream"]
+    assert len(archives) == 1 and archives[0][2] == "videos.zip"
+    with zipfile.ZipFile(io.BytesIO(archives[0][3])) as zf:
+        assert zf.namelist() == ["01-a.mp4", "03-b.mp4"]
+    summary = adapter.calls[-1]
+    assert summary[0] == "edit"
+    assert summary[2].startswith("Sent 2 of 3 videos.")
+    assert "https://example.com/broken — download failed" in summary[2]
+
+
+def test_async_handler_shares_batches_progress_and_quotas(monkeypatch, tmp_path):
+    import asyncio
+    import io
+
+    monkeypatch.setattr(services, "download_video", _fake_batch_download(tmp_path))
+    charged = []
+    monkeypatch.setattr(services, "_charge", lambda chat, nbytes=0, seconds=0.0: charged.append((chat, nbytes)))
+
+    class AsyncBatchAdapter:
+        def __init__(self):
+            self.calls = []
+
+        async def send_message(self, chat_id, text):
+            self.calls.append(("send_message", chat_id, text))
+            return {"ok": True, "body": {"result": {"message_id": 77}}}
+
+        async def edit_message_text(self, chat_id, message_id, text):
+            self.calls.append(("edit", message_id, text))
+            return {"ok": True}
+
+        async def send_document_stream(self, chat_id, source, size, filename, progress=None):
+            self.calls.append(("send_document_stream", chat_id, filename, b"".join(source)))
+            return {"ok": True}
+
+    adapter = AsyncBatchAdapter()
+    text = "https://example.com/a https://example.com/b"
+    asyncio.run(services.handle_update_async({"update_id": 5, "message": {"chat": {"id": 8}, "text": text}}, adapter))
+
+    archives = [c for c in adapter.calls if c[0] == "send_document_stream"]
+    assert len(archives) == 1
+    with zipfile.ZipFile(io.BytesIO(archives[0][3])) as zf:
+        assert zf.namelist() == ["01-a.mp4", "02-b.mp4"]
+    assert adapter.calls[-1] == ("edit", 77, "Sent 2 of 2 videos.")
+    assert charged[0][0] == 8 and charged[0][1] > 0
+
+
+def test_async_progress_never_blocks_the_loop_on_a_slow_edit(monkeypatch, tmp_path):
+    import asyncio
+    import time
+
+    downloaded = tmp_path / "video.mp4"
+    downloaded.write_bytes(b"fake video")
+    monkeypatch.setattr(services, "download_video", lambda url, out_dir, **kwargs: str(downloaded))
+    monkeypatch.setenv("BOT_PROGRESS_INTERVAL", "0.05")
+
+    class SlowEditAdapter:
+        def __init__(self):
+            self.calls = []
+            self.stalls = []
+
+        async def send_message(self, chat_id, text):
+            self.calls.append(("send_message", text))
+            return {"ok": True, "body": {"result": {"message_id": 7}}}
+
+        async def edit_message_text(self, chat_id, message_id, text):
+            self.calls.append(("edit", text))
+            await asyncio.sleep(0.5)
+            return {"ok": True}
+
+        async def send_document(self, chat_id, file_path, filename=None, progress=None):
+            size = os.path.getsize(file_path)
+            for part in range(1, 5):
+                # further apart than BOT_PROGRESS_INTERVAL, while an edit is still in flight
+                await asyncio.sleep(0.15)
+                started = time.monotonic()
+                progress(size * part // 4, size)
+                self.stalls.append(time.monotonic() - started)
+            self.calls.append(("send_document", filename))
+            return {"ok": True}
+
+    adapter = SlowEditAdapter()
+    update = {"update_id": 6, "message": {"chat": {"id": 3}, "text": "http://example.com/v"}}
+    asyncio.run(asyncio.wait_for(services.handle_update_async(update, adapter), 5))
+
+    assert ("send_document", "video.zip") in adapter.calls
+    assert any(c[0] == "edit" and c[1].startswith("Uploading") for c in adapter.calls)
+    assert max(adapter.stalls) < 0.05
+
+
+def test_archive_parts_account_for_zip_headers(tmp_path):
+    items = []
+    for i in range(1, 4):
+        path = tmp_path / f"{i}.mp4"
+        path.write_bytes(b"x" * 100)
+        item = services._BatchItem(i, f"https://example.com/{i}")
+        item.prepared = services._Prepared(str(tmp_path), downloaded=str(path))
+        items.append(item)
+    # the raw bytes (300) fit, but not with three entries' headers
+    limit = 500
+    parts = services._archive_parts(items, limit)
+    assert [len(part) for part in parts] == [2, 1]
+    for part in parts:
+        assert StreamingZip([(i.prepared.downloaded, i.arcname) for i in part]).len <= limit
+
+
+def test_multiple_urls_as_media_group(monkeypatch, tmp_path):
+    monkeypatch.setattr(services, "download_video", _fake_batch_download(tmp_path))
+    monkeypatch.setenv("BOT_BATCH_MODE", "media_group")
+    adapter = BatchAdapter()
+    text = "https://example.com/a https://example.com/b"
+    services.handle_update({"update_id": 4, "message": {"chat": {"id": 8}, "text": text}}, adapter)
+
+    assert ("send_media_group", 8, ["01-a.mp4", "02-b.mp4"]) in adapter.calls
+    assert adapter.calls[-1][2] == "Sent 2 of 2 videos."
+
+
+def test_single_url_reports_progress_and_cleans_up(monkeypatch, tmp_path):
+    monkeypatch.setenv("BOT_PROGRESS_INTERVAL", "0")
+
+    def fake_download(url, out_dir, max_bytes=None, progress_hooks=()):
+        for hook in progress_hooks:
+            hook({"status": "downloading", "downloaded_bytes": 512, "total_bytes": 1024})
+        path = os.path.join(out_dir, "clip.mp4")
+        with open(path, "wb") as fh:
+            fh.write(b"video")
+        return path
+
+    class ProgressAdapter(BatchAdapter):
+        def send_document(self, chat_id, file_path, filename=None, progress=None):
+            progress(5, 10)
+            self.calls.append(("send_document", chat_id, filename))
+            return {"ok": True}
+
+        def delete_message(self, chat_id, message_id):
+            self.calls.append(("delete", message_id))
+            return {"ok": True}
+
+    monkeypatch.setattr(services, "download_video", fake_download)
+    adapter = ProgressAdapter()
+    services.handle_update({"update_id": 1, "message": {"chat": {"id": 3}, "text": "https://example.com/p"}}, adapter)
+
+    edits = [c[2] for c in adapter.calls if c[0] == "edit"]
+    assert edits[0] == "Downloading: 50% of 1.0 KB"
+    assert "Uploading: 50% of 10 B" in edits
+    assert adapter.calls[0] == ("send_message", 3, "Downloading...")
+    assert adapter.calls[-1] == ("delete", 77)
+
+
+def test_upload_limit_and_local_files_follow_adapter(monkeypatch, tmp_path):
+    downloaded = tmp_path / "clip.mp4"
+    downloaded.write_bytes(b"x" * 1024)
+    budgets = []
+
+    def fake_download(url, out_dir, max_bytes=None, **kwargs):
+        budgets.append(max_bytes)
+        return str(downloaded)
+
+    monkeypatch.setattr(services, "download_video", fake_download)
+    monkeypatch.delenv("TELEGRAM_MAX_UPLOAD_BYTES", raising=False)
+    monkeypatch.setenv("BOT_PACKAGING", "stream")
+
+    class LocalAdapter(DummyAdapter):
+        max_upload_bytes = 2000 * 1024 * 1024
+        local_files = object()
+
+        def send_document_stream(self, *args, **kwargs):
+            raise AssertionError("a local Bot API server should get a file path")
+
+    adapter = LocalAdapter()
+    services.handle_update({"update_id": 30, "message": {"chat": {"id": 3}, "text": "http://local"}}, adapter)
+
+    assert budgets == [2000 * 1024 * 1024 - services._PACKAGING_HEADROOM]
+    assert any(c[0] == "send_document" and c[3] == "video.zip" for c in adapter.calls)
+
+
+def test_pipeline_streams_single_stream_videos(monkeypatch):
+    from botlib.packaging import Package
+
+    monkeypatch.setenv("BOT_PIPELINE", "1")
+    aborted = []
+
+    class Pipe:
+        def abort(self):
+            aborted.append(True)
+
+    monkeypatch.setattr(services, "open_stream",
+                        lambda url, max_bytes: (Package("raw", "clip.mp4", 5, stream=iter([b"vid", b"eo"])), Pipe()))
+    monkeypatch.setattr(services, "download_video", lambda *a, **k: pytest.fail("must not download first"))
+    adapter = BatchAdapter()
+    services.handle_update({"update_id": 40, "message": {"chat": {"id": 4}, "text": "http://piped"}}, adapter)
+
+    assert ("send_document_stream", 4, "clip.mp4", b"video") in adapter.calls
+    assert aborted == [True]
+
+
+def test_pipeline_falls_back_to_download(monkeypatch, tmp_path):
+    monkeypatch.setenv("BOT_PIPELINE", "1")
+    monkeypatch.setenv("BOT_PACKAGING", "stream")
+    downloaded = tmp_path / "clip.mp4"
+    downloaded.write_bytes(b"video")
+    monkeypatch.setattr(services, "open_stream", lambda url, max_bytes: None)
+    monkeypatch.setattr(services, "download_video", lambda url, out_dir, max_bytes=None, **kw: str(downloaded))
+    adapter = BatchAdapter()
+    services.handle_update({"update_id": 41, "message": {"chat": {"id": 4}, "text": "http://hls"}}, adapter)
+
+    assert any(c[0] == "send_document_stream" and c[2] == "video.zip" for c in adapter.calls)
+
+
+def test_daily_quota_charges_downloads_and_refuses_when_used_up(monkeypatch, tmp_path):
+    from botlib import quotas
+
+    downloaded = tmp_path / "video.mp4"
+    downloaded.write_bytes(b"x" * 2048)
+    monkeypatch.setattr(services, "download_video", lambda url, out_dir, max_bytes=None, **kw: str(downloaded))
+    monkeypatch.setattr(quotas, "_default_ledger", None)
+    monkeypatch.setenv("BOT_QUOTA_DAILY_MB", str(1024 / 2**20))
+    monkeypatch.setenv("BOT_PACKAGING", "raw")
+
+    adapter = DummyAdapter()
+    update = {"update_id": 1, "message": {"chat": {"id": 5}, "text": "https://example.com/a"}}
+    services.handle_update(update, adapter)
+    assert adapter.calls[-1][0] == "send_document"
+    assert quotas.get_default_ledger().usage(5)["bytes"] == 2048
+
+    services.handle_update(update, adapter)
+    assert adapter.calls[-1] == ("send_message", 5, "You've reached today's download limit. Please try again tomorrow.")
+    assert sum(c[0] == "send_document" for c in adapter.calls) == 1
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from botlib.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    cleaned = []
+    results = []
+
+    def produce():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "shared"
+
+    def worker():
+        with flight.share("k", produce, cleaned.append) as value:
+            results.append(value)
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    threads[0].start()
+    assert started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert calls == [1]
+    assert results == ["shared"] * 5
+    assert cleaned == ["shared"]
+    assert flight.in_flight() == 0
+
+
+def test_cleanup_waits_for_last_participant():
+    flight = SingleFlight()
+    cleaned = []
+    first = flight.acquire("k", lambda: "v", cleaned.append)
+    second = flight.acquire("k", lambda: "other", cleaned.append)
+    assert first == second == "v"
+
+    flight.release("k")
+    assert cleaned == []
+    flight.release("k")
+    assert cleaned == ["v"]
+
+
+def test_error_is_shared_and_not_cached():
+    flight = SingleFlight()
+
+    def boom():
+        raise RuntimeError("fail")
+
+    with pytest.raises(RuntimeError):
+        flight.acquire("k", boom)
+    assert flight.in_flight() == 0
+    # the next request gets a fresh attempt
+    assert flight.acquire("k", lambda: "ok") == "ok"
+    flight.release("k")
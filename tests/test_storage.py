@@ -0,0 +1,127 @@
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from botlib import storage
+from botlib.storage import LocalBackend, S3Backend, StorageError, TransferShBackend
+
+
+class FakeS3:
+    """Enough of the boto3 S3 client for the backend, storing objects in memory."""
+
+    def __init__(self, fail_parts=()):
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+        self.fail_parts = set(fail_parts)
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body.read()
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.uploads["u1"] = {}
+        return {"UploadId": "u1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self._lock:
+            if PartNumber in self.fail_parts:
+                self.fail_parts.discard(PartNumber)
+                raise ConnectionError("reset by peer")
+            self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        numbers = [p["PartNumber"] for p in MultipartUpload["Parts"]]
+        assert numbers == sorted(parts)
+        self.objects[(Bucket, Key)] = b"".join(parts[n] for n in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+
+    def generate_presigned_url(self, op, Params, ExpiresIn):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+
+def test_s3_multipart_upload_retries_failed_part(tmp_path):
+    data = bytes(range(256)) * (12 * 1024 * 1024 // 256)
+    src = tmp_path / "big.zip"
+    src.write_bytes(data)
+    client = FakeS3(fail_parts={2})
+    backend = S3Backend("videos", client=client, part_size=5 * 1024 * 1024, backoff=0)
+
+    link = backend.upload(str(src))
+
+    assert link.startswith("https://s3.test/videos/") and link.split("?")[0].endswith("/big.zip")
+    (stored,) = client.objects.values()
+    assert stored == data
+    assert not client.aborted
+
+
+def test_s3_aborts_multipart_upload_after_retries(tmp_path):
+    src = tmp_path / "big.zip"
+    src.write_bytes(b"x" * (11 * 1024 * 1024))
+
+    class Broken(FakeS3):
+        def upload_part(self, **kwargs):
+            raise ConnectionError("down")
+
+    client = Broken()
+    backend = S3Backend("videos", client=client, part_size=5 * 1024 * 1024, retries=1, backoff=0)
+    with pytest.raises(StorageError):
+        backend.upload(str(src))
+    assert client.aborted == ["u1"]
+    assert not client.objects
+
+
+def test_local_backend_signs_and_expires_links(tmp_path):
+    now = [1000.0]
+    src = tmp_path / "video.zip"
+    src.write_bytes(b"payload")
+    backend = LocalBackend(str(tmp_path / "files"), "https://bot.test/files", "s3cret",
+                           ttl=60, clock=lambda: now[0])
+
+    link = backend.upload(str(src))
+    parsed = urlparse(link)
+    _, _, token, name = parsed.path.split("/")
+    query = parse_qs(parsed.query)
+    expires, sig = int(query["expires"][0]), query["sig"][0]
+
+    path = backend.resolve(token, name, expires, sig)
+    assert path is not None and open(path, "rb").read() == b"payload"
+    assert backend.resolve(token, name, expires + 3600, sig) is None   # tampered expiry
+    assert backend.resolve(token, "../video.zip", expires, sig) is None
+
+    now[0] += 120
+    assert backend.resolve(token, name, expires, sig) is None
+    assert backend.purge() == 1
+    assert not (tmp_path / "files" / token).exists()
+
+
+def test_transfer_sh_retries_and_streams_file(monkeypatch, tmp_path):
+    src = tmp_path / "video.zip"
+    src.write_bytes(b"payload")
+    calls = []
+
+    def fake_request(method, url, data=None, headers=None, timeout=None, retries=None):
+        calls.append((method, url, data.read()))
+        if len(calls) == 1:
+            return {"ok": False, "status": None, "headers": {}, "body": None, "error": "timed out"}
+        return {"ok": True, "status": 200, "headers": {}, "body": "https://transfer.test/abc/video.zip\n"}
+
+    monkeypatch.setattr(storage, "request", fake_request)
+    backend = TransferShBackend(url="https://transfer.test/", backoff=0)
+
+    assert backend.upload(str(src)) == "https://transfer.test/abc/video.zip"
+    assert calls == [("PUT", "https://transfer.test/video.zip", b"payload")] * 2
+
+
+def test_default_storage_follows_environment(monkeypatch, tmp_path):
+    monkeypatch.setenv("BOT_STORAGE", "local")
+    monkeypatch.setenv("BOT_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setenv("BOT_STORAGE_SECRET", "k")
+    assert isinstance(storage.get_default_storage(), LocalBackend)
+    monkeypatch.setenv("BOT_STORAGE", "none")
+    assert storage.get_default_storage() is None
@@ -1,6 +1,3 @@
-import sys
-import types
-
 import pytest
 
 from botlib.telegram_adapter import TelegramAdapter
@@ -22,30 +19,23 @@ def test_send_message_uses_post(monkeypatch):
     assert res["ok"] is True
 
 
-def test_send_document_uses_requests(monkeypatch, tmp_path):
+def test_send_document_uses_pooled_request(monkeypatch, tmp_path):
     fn = tmp_path / "f.txt"
     fn.write_text("x")
+    seen = {}
 
-    class FakeResp:
-        ok = True
-        status_code = 200
-        headers = {}
-
-        def json(self):
-            return {"ok": True}
-        
-        def raise_for_status(self):
-            return None
+    def fake_request(method, url, data=None, headers=None, timeout=None):
+        body = b"".join(data)
+        assert int(headers["Content-Length"]) == len(body)
+        seen.update(method=method, url=url, name=b'filename="f.txt"' in body, content=b"\r\n\r\nx\r\n" in body)
+        return {"ok": True, "status": 200, "headers": {}, "body": {"ok": True}}
 
-    def fake_requests_post(url, data=None, files=None):
-        return FakeResp()
-
-    fake_requests = types.SimpleNamespace(post=fake_requests_post)
-    monkeypatch.setitem(sys.modules, "requests", fake_requests)
+    monkeypatch.setattr("botlib.telegram_adapter.request", fake_request)
 
     adapter = TelegramAdapter(token="tok", base_url="http://api")
     res = adapter.send_document(1, str(fn))
     assert res["ok"] is True
+    assert seen == {"method": "POST", "url": "http://api/sendDocument", "name": True, "content": True}
 
 
 def test_get_updates_handles_error(monkeypatch):
@@ -73,3 +63,156 @@ def test_run_polling_stops_on_keyboardinterrupt(monkeypatch):
 
     adapter.run_polling(handler, poll_interval=0)
     assert called["h"] is False
+
+
+def test_run_polling_dispatches_and_drains(monkeypatch):
+    batches = [[{"update_id": 5, "message": {"chat": {"id": 1}, "text": "a"}},
+                {"update_id": 6, "message": {"chat": {"id": 2}, "text": "b"}}]]
+
+    def fake_get_updates(self, offset=None, timeout=10):
+        if batches:
+            return batches.pop()
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(TelegramAdapter, "get_updates", fake_get_updates)
+    adapter = TelegramAdapter(token="tok", base_url="http://api")
+
+    handled = []
+    adapter.run_polling(lambda upd, adp: handled.append(upd["update_id"]), poll_interval=0, workers=2)
+    assert sorted(handled) == [5, 6]
+
+
+def test_send_document_by_id_posts_file_id(monkeypatch):
+    sent = {}
+
+    def fake_post(url, message, headers=None, timeout=None):
+        sent.update(url=url, message=message)
+        return {"ok": True, "status": 200, "headers": {}, "body": {}}
+
+    monkeypatch.setattr("botlib.telegram_adapter.post", fake_post)
+    adapter = TelegramAdapter(token="tok", base_url="http://api")
+    assert adapter.send_document_by_id(1, "FID")["ok"] is True
+    assert sent == {"url": "http://api/sendDocument", "message": {"chat_id": 1, "document": "FID"}}
+
+
+def test_send_document_stream_sets_length(monkeypatch):
+    seen = {}
+
+    def fake_request(method, url, data=None, headers=None, timeout=None):
+        body = b"".join(data)
+        seen.update(length=int(headers["Content-Length"]) == len(body), payload=b"\r\n\r\nabcd\r\n" in body)
+        return {"ok": True, "status": 200, "headers": {}, "body": {"ok": True}}
+
+    monkeypatch.setattr("botlib.telegram_adapter.request", fake_request)
+    adapter = TelegramAdapter(token="tok", base_url="http://api")
+    res = adapter.send_document_stream(1, [b"ab", b"cd"], 4, "video.zip")
+    assert res["ok"] is True
+    assert seen == {"length": True, "payload": True}
+
+
+def test_run_polling_resumes_unfinished_jobs(monkeypatch, tmp_path):
+    from botlib.job_store import JobStore
+
+    path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(path)
+    # a previous run accepted 5 and 6 but crashed before finishing 6
+    store.accept([{"update_id": 5, "message": {"chat": {"id": 1}, "text": "a"}},
+                  {"update_id": 6, "message": {"chat": {"id": 1}, "text": "b"}}])
+    store.finish(5)
+
+    offsets = []
+    batches = [[{"update_id": 6, "message": {"chat": {"id": 1}, "text": "b"}},
+                {"update_id": 7, "message": {"chat": {"id": 1}, "text": "c"}}]]
+
+    def fake_get_updates(self, offset=None, timeout=10):
+        offsets.append(offset)
+        if batches:
+            return batches.pop()
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(TelegramAdapter, "get_updates", fake_get_updates)
+    adapter = TelegramAdapter(token="tok", base_url="http://api")
+
+    handled = []
+    adapter.run_polling(lambda upd, adp: handled.append(upd["update_id"]), poll_interval=0, job_store=store)
+
+    # 6 resumed from the store, redelivered 6 ignored, 7 new
+    assert handled == [6, 7]
+    assert offsets == [7, 8]
+    assert store.counts() == {"done": 3}
+
+
+def test_edit_message_text_and_media_group(monkeypatch, tmp_path):
+    posted = {}
+
+    def fake_post(url, message, headers=None, timeout=None):
+        posted.update(url=url, message=message)
+        return {"ok": True, "status": 200, "headers": {}, "body": {}}
+
+    sent = {}
+
+    def fake_request(method, url, data=None, headers=None, timeout=None):
+        sent.update(url=url, body=b"".join(data), length=int(headers["Content-Length"]))
+        return {"ok": True, "status": 200, "headers": {}, "body": {}}
+
+    monkeypatch.setattr("botlib.telegram_adapter.post", fake_post)
+    monkeypatch.setattr("botlib.telegram_adapter.request", fake_request)
+    adapter = TelegramAdapter(token="tok", base_url="http://api")
+
+    adapter.edit_message_text(1, 5, "50%")
+    assert posted == {"url": "http://api/editMessageText", "message": {"chat_id": 1, "message_id": 5, "text": "50%"}}
+    adapter.delete_message(1, 5)
+    assert posted == {"url": "http://api/deleteMessage", "message": {"chat_id": 1, "message_id": 5}}
+
+    a = tmp_path / "a.mp4"
+    b = tmp_path / "b.mp4"
+    a.write_bytes(b"AAAA")
+    b.write_bytes(b"BB")
+    assert adapter.send_media_group(1, [(str(a), "a.mp4"), (str(b), "b.mp4")])["ok"]
+    assert sent["url"] == "http://api/sendMediaGroup"
+    assert len(sent["body"]) == sent["length"]
+    assert b'attach://file1' in sent["body"]
+    assert b'name="file1"; filename="b.mp4"' in sent["body"]
+
+
+def test_local_mode_sends_shared_files_by_path(monkeypatch, tmp_path):
+    monkeypatch.setenv("TELEGRAM_API_URL", "http://bot-api:8081/")
+    monkeypatch.setenv("TELEGRAM_LOCAL_MODE", "1")
+    monkeypatch.setenv("TELEGRAM_LOCAL_FILES", f"{tmp_path}=/data")
+    shared = tmp_path / "bot_dl_1" / "video.mp4"
+    shared.parent.mkdir()
+    shared.write_bytes(b"x" * 10)
+    posted = []
+
+    def fake_post(url, message, headers=None, timeout=None):
+        posted.append((url, message))
+        return {"ok": True, "status": 200, "headers": {}, "body": {"ok": True}}
+
+    def no_upload(*args, **kwargs):
+        raise AssertionError("shared files must not be uploaded")
+
+    monkeypatch.setattr("botlib.telegram_adapter.post", fake_post)
+    monkeypatch.setattr("botlib.telegram_adapter.request", no_upload)
+    adapter = TelegramAdapter(token="tok")
+    progress = []
+
+    assert adapter.max_upload_bytes == 2000 * 1024 * 1024
+    assert adapter.send_document(5, str(shared), progress=lambda sent, total: progress.append(sent))["ok"]
+    assert posted == [("http://bot-api:8081/bottok/sendDocument",
+                       {"document": "file:///data/bot_dl_1/video.mp4", "chat_id": 5})]
+    assert progress == [10]
+
+
+def test_local_mode_uploads_files_outside_shared_volume(monkeypatch, tmp_path):
+    from botlib.telegram_adapter import LocalFiles
+
+    elsewhere = tmp_path / "f.txt"
+    elsewhere.write_text("x")
+    uploads = []
+    monkeypatch.setattr("botlib.telegram_adapter.request",
+                        lambda method, url, data=None, headers=None, timeout=None: uploads.append(url) or {"ok": True})
+    adapter = TelegramAdapter(token="tok", base_url="http://api", local_mode=True,
+                              local_files=LocalFiles("/srv/shared", "/data"))
+    adapter.send_document(1, str(elsewhere))
+    assert uploads == ["http://api/sendDocument"]
+    assert TelegramAdapter(token="tok", base_url="http://api", local_mode=False).max_upload_bytes == 50 * 1024 * 1024
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+import botlib
+from botlib import warmup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _loaded_after(code):
+    out = subprocess.run([sys.executable, "-c", code + "\nimport sys\n"
+                          "print(','.join(m for m in ('yt_dlp', 'requests', 'httpx') if m in sys.modules))"],
+                         cwd=ROOT, capture_output=True, text=True, check=True)
+    return out.stdout.strip()
+
+
+def test_importing_botlib_and_services_loads_no_heavy_dependency():
+    assert _loaded_after("import botlib") == ""
+    assert _loaded_after("import botlib.services, botlib.telegram_adapter") == ""
+    assert _loaded_after("import botlib; botlib.AsyncTelegramAdapter") == "httpx"
+
+
+def test_lazy_attributes_resolve_to_submodule_objects():
+    from botlib.services import handle_update
+    from botlib.telegram_adapter import TelegramAdapter
+
+    assert botlib.handle_update is handle_update
+    assert botlib.TelegramAdapter is TelegramAdapter
+    assert "prewarm" in dir(botlib)
+
+
+def test_prewarm_from_env_runs_selected_components(monkeypatch):
+    ran = []
+    monkeypatch.setitem(warmup.COMPONENTS, "http", lambda: ran.append("http"))
+    monkeypatch.setitem(warmup.COMPONENTS, "yt_dlp", lambda: 1 / 0)
+
+    monkeypatch.setenv("BOT_PREWARM", "0")
+    assert warmup.prewarm_from_env() == {}
+    monkeypatch.setenv("BOT_PREWARM", "http, yt_dlp, bogus")
+    spent = warmup.prewarm_from_env()
+    assert ran == ["http"]
+    assert set(spent) == {"http", "yt_dlp"}   # failures are logged, not raised
@@ -0,0 +1,254 @@
+import threading
+
+import pytest
+
+from botlib import work_queue
+from botlib.work_queue import QueueWorker, RedisWorkQueue, SQLiteWorkQueue, enqueue_handler
+
+
+def _upd(update_id, chat=1):
+    return {"update_id": update_id, "message": {"chat": {"id": chat}, "text": "http://x"}}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """The subset of the redis-py client `RedisWorkQueue` uses (bytes replies)."""
+
+    def __init__(self):
+        self.strings = {}
+        self.hashes = {}
+        self.sets = {}
+        self.zsets = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.strings:
+            return None
+        self.strings[key] = str(value).encode()
+        return True
+
+    def incr(self, key):
+        value = int(self.strings.get(key, b"0")) + 1
+        self.strings[key] = str(value).encode()
+        return value
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({k: str(v).encode() for k, v in mapping.items()})
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hincrby(self, key, field, amount):
+        value = int(self.hashes.setdefault(key, {}).get(field, b"0")) + amount
+        self.hashes[key][field] = str(value).encode()
+        return value
+
+    def expire(self, key, seconds):
+        return True
+
+    def sadd(self, key, member):
+        self.sets.setdefault(key, set()).add(str(member).encode())
+
+    def srem(self, key, member):
+        self.sets.get(key, set()).discard(str(member).encode())
+
+    def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    def zadd(self, key, mapping, nx=False, xx=False):
+        zset = self.zsets.setdefault(key, {})
+        for member, score in mapping.items():
+            member = str(member).encode()
+            if (nx and member in zset) or (xx and member not in zset):
+                continue
+            zset[member] = float(score)
+
+    def register_script(self, script):
+        # Python stand-ins for the queue's Lua scripts (redis runs those atomically)
+        run = {work_queue._CLAIM_SCRIPT: self._claim, work_queue._HEARTBEAT_SCRIPT: self._heartbeat}[script]
+        return lambda keys=(), args=(): run(*keys, *args)
+
+    def _claim(self, queue, active, now, expiry, owner, prefix, state):
+        zset = self.zsets.get(queue, {})
+        ready = [m for m, score in zset.items() if score <= float(now)]
+        if not ready:
+            return None
+        member = min(ready, key=lambda m: (zset[m], m))
+        key = prefix + member.decode()
+        payload = self.hget(key, "payload")
+        if payload is None:
+            self.zrem(queue, member.decode())
+            self.srem(active, member.decode())
+            return [member, 0, b""]
+        zset[member] = float(expiry)
+        attempts = self.hincrby(key, "attempts", 1)
+        self.hset(key, mapping={"state": state, "owner": owner, "updated_at": now})
+        return [member, attempts, payload]
+
+    def _heartbeat(self, queue, key, owner, expiry, job_id):
+        if self.hget(key, "owner") != owner.encode() or self.zscore(queue, job_id) is None:
+            return 0
+        self.zadd(queue, {job_id: expiry}, xx=True)
+        return 1
+
+    def zrem(self, key, member):
+        self.zsets.get(key, {}).pop(str(member).encode(), None)
+
+    def zscore(self, key, member):
+        return self.zsets.get(key, {}).get(str(member).encode())
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def zcount(self, key, low, high):
+        low = float(low.lstrip("("))
+        return sum(1 for score in self.zsets.get(key, {}).values() if score > low)
+
+
+def _lua_redis():
+    # runs the real Lua scripts when fakeredis (with lupa) is installed
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture(params=["sqlite", "redis", "redis-lua"])
+def make_queue(request, tmp_path):
+    def make(clock, max_attempts=3):
+        if request.param == "sqlite":
+            return SQLiteWorkQueue(str(tmp_path / "queue.sqlite3"), max_attempts=max_attempts, clock=clock)
+        client = FakeRedis() if request.param == "redis" else _lua_redis()
+        return RedisWorkQueue(client, max_attempts=max_attempts, clock=clock)
+    return make
+
+
+def test_push_is_idempotent_and_claims_in_order(make_queue):
+    queue = make_queue(Clock())
+    assert queue.push(_upd(1)) is True
+    assert queue.push(_upd(2)) is True
+    # Telegram redelivering the same update
+    assert queue.push(_upd(1)) is False
+
+    first = queue.claim("a")
+    second = queue.claim("b")
+    assert [first.update["update_id"], second.update["update_id"]] == [1, 2]
+    assert first.attempts == 1
+    assert queue.claim("c") is None
+    assert queue.stats()["leased"] == 2
+
+    queue.complete(first)
+    queue.complete(second)
+    assert queue.claim("c") is None
+    assert queue.stats().get("ready", 0) == 0
+
+
+def test_expired_lease_is_taken_over_and_heartbeat_keeps_it(make_queue):
+    clock = Clock()
+    queue = make_queue(clock)
+    queue.push(_upd(1))
+    queue.push(_upd(2))
+    kept = queue.claim("a", lease=10)
+    lost = queue.claim("a", lease=10)
+
+    clock.now += 8
+    assert queue.heartbeat(kept, lease=10) is True
+    clock.now += 5
+    # only the job without a heartbeat is available again
+    taken = queue.claim("b", lease=10)
+    assert taken.update["update_id"] == lost.update["update_id"]
+    assert taken.attempts == 2
+    assert queue.heartbeat(lost, lease=10) is False
+    assert queue.claim("c") is None
+
+    # the old owner finishing late must not ack the new owner's lease
+    queue.complete(lost)
+    assert queue.heartbeat(taken, lease=10) is True
+
+
+def test_failed_job_is_retried_then_dead(make_queue):
+    clock = Clock()
+    queue = make_queue(clock, max_attempts=2)
+    queue.push(_upd(1))
+    job = queue.claim("a")
+    queue.fail(job, "boom")
+    assert queue.claim("a") is None  # retry delay
+    clock.now += work_queue.RETRY_DELAY
+    job = queue.claim("b")
+    assert job.attempts == 2
+    queue.fail(job, "boom again")
+    clock.now += work_queue.RETRY_DELAY
+    assert queue.claim("c") is None
+
+
+def test_heartbeat_fails_once_the_job_left_the_queue(make_queue):
+    queue = make_queue(Clock())
+    queue.push(_upd(1))
+    job = queue.claim("a")
+    queue.complete(job)
+    assert queue.heartbeat(job) is False
+
+
+def test_redis_recovers_job_orphaned_mid_push():
+    clock = Clock()
+    client = FakeRedis()
+    queue = RedisWorkQueue(client, clock=clock)
+    queue.push(_upd(1))
+    # the producer died after registering the job but before queueing it
+    client.zrem("bot:queue", "1")
+    assert queue.claim("a") is None
+    assert queue.recover(grace=30) == 0
+    clock.now += 31
+    assert queue.recover(grace=30) == 1
+    assert queue.claim("a").update["update_id"] == 1
+
+
+def test_worker_processes_pushed_updates(monkeypatch, tmp_path):
+    monkeypatch.setattr(work_queue, "RETRY_DELAY", 0.0)
+    queue = SQLiteWorkQueue(str(tmp_path / "queue.sqlite3"))
+    ingress = enqueue_handler(queue)
+    for i in range(5):
+        ingress(_upd(i, chat=i % 2), None)
+
+    handled = []
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def handler(update, adapter):
+        with lock:
+            first_try = update["update_id"] not in handled
+            handled.append(update["update_id"])
+            if len(handled) == 6:
+                done.set()
+        if update["update_id"] == 3 and first_try:
+            raise RuntimeError("flaky")
+
+    stop = threading.Event()
+    worker = QueueWorker(queue, handler, adapter=None, concurrency=2, lease=5, poll_interval=0.01)
+    thread = threading.Thread(target=worker.run, args=(stop,))
+    thread.start()
+    assert done.wait(5)
+    stop.set()
+    thread.join(5)
+    assert sorted(set(handled)) == [0, 1, 2, 3, 4]
+    assert handled.count(3) == 2
+    assert queue.stats() == {"done": 5}
+
+
+def test_default_queue_from_env(monkeypatch, tmp_path):
+    monkeypatch.setattr(work_queue, "_default_queue", None)
+    monkeypatch.delenv("BOT_QUEUE", raising=False)
+    assert work_queue.get_default_queue() is None
+    monkeypatch.setenv("BOT_QUEUE", f"sqlite:///{tmp_path}/q.sqlite3")
+    queue = work_queue.get_default_queue()
+    assert isinstance(queue, SQLiteWorkQueue)
+    assert queue.path == f"{tmp_path}/q.sqlite3"
+    assert work_queue.get_default_queue() is queue
+    monkeypatch.setenv("BOT_QUEUE", "amqp://nope")
+    with pytest.raises(ValueError):
+        work_queue.get_default_queue()
@@ -0,0 +1,86 @@
+import os
+
+from botlib.workspace import Workspace, ytdl_resume_options
+
+
+def test_same_key_gets_the_same_directory(tmp_path):
+    ws = Workspace(str(tmp_path))
+    a = ws.acquire("https://example.com/v")
+    b = ws.acquire("https://example.com/v")
+    assert a == b
+    assert os.path.basename(a).startswith("bot_dl_")
+    assert a != ws.path_for("https://example.com/other")
+
+    ws.release(a)
+    assert os.path.isdir(a)  # still held by the second user
+    ws.release(b)
+    assert not os.path.exists(a)
+
+
+def test_failed_download_keeps_partials_for_resume(tmp_path):
+    ws = Workspace(str(tmp_path))
+    path = ws.acquire("k")
+    with open(os.path.join(path, "clip.mp4.part"), "wb") as fh:
+        fh.write(b"half")
+    ws.release(path, done=False)
+    assert os.path.exists(os.path.join(path, "clip.mp4.part"))
+
+    empty = ws.acquire("nothing")
+    ws.release(empty, done=False)
+    assert not os.path.exists(empty)
+
+
+def test_reclaim_by_age_and_size_skips_active(tmp_path):
+    ws = Workspace(str(tmp_path), max_age=100, max_bytes=15)
+    # the first acquire runs the janitor itself; do it before planting dirs
+    active = ws.acquire("active")
+    os.utime(active, (0, 0))
+    dirs = {}
+    for name, age, size in (("old", 500, 1), ("a", 50, 10), ("b", 10, 10)):
+        path = ws.path_for(name)
+        os.makedirs(path)
+        f = os.path.join(path, "x.part")
+        with open(f, "wb") as fh:
+            fh.write(b"x" * size)
+        stamp = 1000 - age
+        os.utime(f, (stamp, stamp))
+        os.utime(path, (stamp, stamp))
+        dirs[name] = path
+    (tmp_path / "unrelated").mkdir()
+
+    assert ws.reclaim(now=1000) == 2
+    assert not os.path.exists(dirs["old"])  # too old
+    assert not os.path.exists(dirs["a"])    # oldest once over the size budget
+    assert os.path.exists(dirs["b"])
+    assert os.path.exists(active)
+    assert (tmp_path / "unrelated").exists()
+
+
+def test_directories_are_not_shared_with_another_process(tmp_path):
+    # two Workspace objects hold separate flock()s, like two processes would
+    ours = Workspace(str(tmp_path), max_age=1)
+    theirs = Workspace(str(tmp_path), max_age=1)
+    mine = ours.acquire("https://example.com/v")
+    other = theirs.acquire("https://example.com/v")
+    assert other == mine + "-1"
+    os.utime(mine, (0, 0))
+
+    assert theirs.reclaim(now=1000) == 0
+    assert os.path.isdir(mine)
+    theirs.release(other)
+    assert os.path.isdir(mine)
+
+    ours.release(mine)
+    assert not os.path.exists(mine)
+    assert os.listdir(tmp_path) == []
+    # with the lock gone, the deterministic directory is handed out again
+    assert theirs.acquire("https://example.com/v") == mine
+
+
+def test_resume_options_from_env(monkeypatch):
+    monkeypatch.setenv("YTDLP_CONCURRENT_FRAGMENTS", "8")
+    monkeypatch.setenv("YTDLP_HTTP_CHUNK_SIZE", "0")
+    opts = ytdl_resume_options()
+    assert opts["continuedl"] is True
+    assert opts["concurrent_fragment_downloads"] == 8
+    assert "http_chunk_size" not in opts